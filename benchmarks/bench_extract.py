@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""Micro-benchmark for the extraction of pressbriefing sites. Compares the two pass extraction
+(`extrect_introduction` + `extrect_pdf_url` on a full `html.parser` soup) with the single pass
+`extrect_pressbriefing` and its process pool batch API. The single pass extraction only reads
+the article container, so only differing pdf urls are counted as mismatches.
+
+The saved sites from the content store (`data/SMC_dataset/store/**/*.html`) are used as fixtures.
+If no fixtures are available, a synthetic site is used.
+
+Usage:
+    python benchmarks/bench_extract.py [--fixtures DIR] [--repeat N]
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from bs4 import BeautifulSoup  # type: ignore
+
+from config import STORE_DIR
+from src import load_data
+
+SYNTHETIC_SITE = """<!DOCTYPE html>
+<html><head><title>SMC</title>{head}</head>
+<body>
+<nav>{nav}</nav>
+<main>
+<h1>Wie geht es weiter mit der Teststrategie?</h1>
+<time datetime="2020-10-13">13.10.2020</time>
+{paragraphs}
+<p>Transkript: <a href="/fileadmin/user_upload/Press_Briefing_Subject/Transkript_Teststrategie.pdf">PDF</a></p>
+</main>
+<footer>{footer}</footer>
+</body></html>
+"""
+
+
+def _synthetic_site() -> str:
+    return SYNTHETIC_SITE.format(
+        head='<meta name="x" content="y">' * 50,
+        nav="".join(f'<li><a href="/nav/{i}">Navigation {i}</a></li>' for i in range(300)),
+        paragraphs="".join(
+            f"<p>Absatz {i} mit <b>Text</b> über die nationale Teststrategie.</p>"
+            for i in range(20)
+        ),
+        footer="".join(f"<div><span>Footer {i}</span></div>" for i in range(200)),
+    )
+
+
+def _two_pass(html: bytes) -> tuple[str, str]:
+    bs = BeautifulSoup(html, "html.parser")
+    return load_data.extrect_introduction(bs), load_data.extrect_pdf_url(bs)
+
+
+def _single_pass(html: bytes) -> tuple[str, str]:
+    site = load_data.extrect_pressbriefing(html)
+    return site["introduction"], site["pdf_url"]  # type: ignore
+
+
+def _timeit(func, pages: list[bytes], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(pages)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--fixtures", default=STORE_DIR, help="directory with saved html sites")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--synthetic", type=int, default=200, help="number of synthetic sites")
+    args = parser.parse_args()
+
+    paths = glob.glob(os.path.join(args.fixtures, "**", "*.html"), recursive=True)
+    if paths:
+        pages = [open(path, "rb").read() for path in paths]
+    else:
+        pages = [_synthetic_site().encode()] * args.synthetic
+
+    mismatches = sum(_two_pass(page)[1] != _single_pass(page)[1] for page in pages)
+
+    two_pass = _timeit(lambda p: [_two_pass(page) for page in p], pages, args.repeat)
+    single_pass = _timeit(lambda p: [_single_pass(page) for page in p], pages, args.repeat)
+    batch = _timeit(load_data.extrect_pressbriefings, pages, args.repeat)
+
+    print(
+        f"sites:        {len(pages)} ({'fixtures' if paths else 'synthetic'}), parser: {load_data.HTML_PARSER}"
+    )
+    print(f"mismatches:   {mismatches}")
+    print(f"two pass:     {two_pass:.3f}s")
+    print(f"single pass:  {single_pass:.3f}s ({two_pass / single_pass:.1f}x)")
+    print(f"process pool: {batch:.3f}s ({two_pass / batch:.1f}x)")
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""Benchmark for the transcript segment parser. Compares `parse_pdf.parse_body` with the former
+implementation, which matched the timecode pattern up to four times per line and built the
+segment texts with repeated `+=`. The outputs of both parsers are checked for equality.
+
+The pdfs from the metadata table are used as corpus (the extracted lines are read through the
+pdf cache). If the pdfs are not available, synthetic transcripts are used.
+
+Usage:
+    python benchmarks/bench_parse_body.py [--limit N] [--repeat N]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import pandas as pd  # type: ignore
+
+from config import METADATA_PATH, PDF_CACHE_PATH
+from src import parse_pdf
+from src.pdf_cache import PdfCache
+
+
+def legacy_parse_body(lines: list[str]) -> list[dict[str, str]]:
+    """Former implementation of `parse_pdf.parse_body`, kept as reference."""
+    timecode_pattern = re.compile(r"\[\d\d:\d\d\]|\(\d\d:\d\d\)|\[\d\d:\d\d:\d\d\]")
+
+    def _get_timecode(line: str):
+        result = timecode_pattern.search(line)
+        if result:
+            timecode = re.findall(timecode_pattern, line)
+            return timecode[0]
+
+    def _get_name(line: str):
+        result = timecode_pattern.search(line)
+        if result:
+            line_split = timecode_pattern.split(line)
+            name = line_split[0].strip().replace(":", "")
+            return name
+
+    passages: list[dict[str, str]] = []
+    current_passage: dict[str, str] = {}
+
+    for line in lines:
+        if "in der Redaktion" in line:
+            break
+        if name := _get_name(line):
+            if current_passage:
+                passages.append(current_passage)
+                current_passage = {}
+            current_passage["speaker"] = name
+            current_passage["timecode"] = _get_timecode(line)
+        else:
+            if current_passage.get("text"):
+                current_passage["text"] += line.lstrip()
+            else:
+                current_passage["text"] = line.lstrip()
+
+    passages.append(current_passage)
+    return passages
+
+
+def synthetic_transcript(num_segments: int, max_lines: int = 60, seed: int = 0) -> list[str]:
+    """Transcript lines with speaker turns, timecodes in all three formats and long segments."""
+    rng = random.Random(seed)
+    speakers = ["Volker Stollorz", "Prof. Dr. Sandra Ciesek", "Dr. Jonas Schmidt-Chanasit"]
+    lines = ["Einleitung vor dem ersten Sprecher"]
+    for i in range(num_segments):
+        hours, rest = divmod(i * 7, 3600)
+        minutes, seconds = divmod(rest, 60)
+        timecode = rng.choice([f"[{minutes:02d}:{seconds:02d}]", f"({minutes:02d}:{seconds:02d})"])
+        if hours or i % 50 == 49:
+            timecode = f"[{hours:02d}:{minutes:02d}:{seconds:02d}]"
+        lines.append(f"{rng.choice(speakers)}: {timecode}")
+        for _ in range(rng.randint(1, max_lines)):
+            lines.append(" Das ist eine Zeile eines längeren Redebeitrags mit einigen Wörtern. ")
+        lines.append("")
+    lines += ["Ansprechpartner in der Redaktion", "Impressum"]
+    return lines
+
+
+def _timeit(func, corpus: list[list[str]], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for lines in corpus:
+            func(lines)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--limit", type=int, default=0, help="maximum number of pdfs")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus: list[list[str]] = []
+    paths = []
+    if os.path.exists(METADATA_PATH):
+        paths = pd.read_csv(METADATA_PATH).dropna()["pdf_path"]
+        paths = [path for path in paths if os.path.exists(path)][: args.limit or None]
+    if paths:
+        cache = PdfCache(PDF_CACHE_PATH)
+        corpus = [
+            result.body for result in parse_pdf.read_pdfs(paths, cache=cache) if not result.error
+        ]
+    source = "corpus"
+    if not corpus:
+        corpus = [synthetic_transcript(n, seed=n) for n in (10, 100, 1000, 5000)]
+        corpus.append(synthetic_transcript(10, max_lines=20000))  # long monologues
+        source = "synthetic"
+
+    mismatches = sum(legacy_parse_body(lines) != parse_pdf.parse_body(lines) for lines in corpus)
+    legacy = _timeit(legacy_parse_body, corpus, args.repeat)
+    current = _timeit(parse_pdf.parse_body, corpus, args.repeat)
+    segments = _timeit(lambda lines: list(parse_pdf.iter_segments(lines)), corpus, args.repeat)
+
+    print(f"transcripts:    {len(corpus)} ({source}), {sum(map(len, corpus))} lines")
+    print(f"mismatches:     {mismatches}")
+    print(f"legacy:         {legacy:.3f}s")
+    print(f"parse_body:     {current:.3f}s ({legacy / current:.1f}x)")
+    print(f"iter_segments:  {segments:.3f}s ({legacy / segments:.1f}x)")
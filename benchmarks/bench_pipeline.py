@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""Offline benchmark of the dataset pipeline on a synthetic corpus (see `synthetic.py`). At each
+scale the corpus is generated into a temporary directory and the stages are timed one after
+another:
+
+    read_pdf, extract_site, parse_head, parse_body, sanetize, import, segment, wikify
+
+`wikify` runs the title, introduction and (if segmented) sentence jobs against a local stub of
+the wikification api, so it measures the client, cache and job queue, not the network.
+`segment` is skipped if the punkt model is neither installed nor downloadable.
+
+The results are written as json (seconds, items and milliseconds per item for every stage and
+scale). The benchmark fails (exit code 1) if a stage is slower per item than its threshold in
+`thresholds.json` or, with `--baseline`, slower than `--tolerance` times a previous result.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--scales 10 100 1000] [--output results.json] [--baseline old.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+from urllib.parse import parse_qs
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from synthetic import generate_corpus  # type: ignore
+from src import create_db, load_data, parse_pdf, split_sentences, wikify, wikify_jobs
+
+THRESHOLDS_PATH = os.path.join(os.path.dirname(__file__), "thresholds.json")
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Wikification api stub, annotates every capitalized word with more than three letters."""
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.0  # seconds per request
+
+    def log_message(self, *args: Any):
+        pass
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        text = form["text"][0]
+        annotations, start = [], 0
+        for word in text.split(" "):
+            if word[:1].isupper() and len(word) > 3:
+                annotations.append(
+                    {
+                        "start": start,
+                        "end": start + len(word),
+                        "spot": word,
+                        "title": word,
+                        "id": sum(map(ord, word)),
+                        "uri": "https://de.wikipedia.org/wiki/" + word,
+                        "confidence": 0.8,
+                        "link_probability": 0.5,
+                    }
+                )
+            start += len(word) + 1
+        time.sleep(self.latency)
+        body = json.dumps({"annotations": annotations}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_stub(latency: float = 0.0) -> tuple[ThreadingHTTPServer, str]:
+    """Start the wikification api stub in a background thread and return it with its url."""
+    _StubHandler.latency = latency
+    ThreadingHTTPServer.request_queue_size = 128
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/"
+
+
+def _time(results: dict[str, Any], stage: str, func: Callable[[], int]):
+    """Time a stage, `func` returns the number of processed items."""
+    start = time.perf_counter()
+    items = func()
+    seconds = time.perf_counter() - start
+    results[stage] = {
+        "seconds": round(seconds, 4),
+        "items": items,
+        "ms_per_item": round(1000 * seconds / items, 4) if items else None,
+    }
+
+
+def run_scale(
+    num_briefings: int, num_segments: int, workers: Optional[int], stub_latency: float
+) -> dict[str, Any]:
+    """Generate a corpus of the given size and time all stages on it.
+
+    Args:
+        num_briefings (int): Number of press briefings.
+        num_segments (int): Speaker turns per press briefing.
+        workers (Optional[int]): Number of worker processes for segmentation.
+        stub_latency (float): Latency of the wikification stub in seconds.
+
+    Returns:
+        dict[str, Any]: Timings per stage, see `_time`.
+    """
+    results: dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        rows: list[dict[str, str]] = []
+        lines: list[tuple[list[str], list[str]]] = []
+        heads: list[dict[str, Any]] = []
+        bodies: list[list[dict[str, str]]] = []
+
+        def _generate() -> int:
+            rows.extend(generate_corpus(directory, num_briefings, num_segments))
+            return len(rows)
+
+        def _read_pdf() -> int:
+            lines.extend(parse_pdf.read_pdf(row["pdf_path"]) for row in rows)
+            return len(lines)
+
+        def _parse_head() -> int:
+            heads.extend(parse_pdf.parse_head(head) for head, _ in lines)  # type: ignore
+            return len(heads)
+
+        def _parse_body() -> int:
+            bodies.extend(parse_pdf.parse_body(body) for _, body in lines)
+            return len(bodies)
+
+        _time(results, "generate", _generate)
+        _time(results, "read_pdf", _read_pdf)
+        sites = []
+        for name in sorted(os.listdir(os.path.join(directory, "html"))):
+            with open(os.path.join(directory, "html", name), "rb") as f:
+                sites.append(f.read())
+        _time(
+            results, "extract_site", lambda: len(list(map(load_data.extrect_pressbriefing, sites)))
+        )
+        _time(results, "parse_head", _parse_head)
+        _time(results, "parse_body", _parse_body)
+        fulltexts = [" ".join(body) for _, body in lines]
+        _time(results, "sanetize", lambda: len(list(map(parse_pdf.sanetize, fulltexts))))
+
+        records = [
+            {
+                "pdf_path": row["pdf_path"],
+                "pdf_url": row["pdf_url"],
+                "introduction_text": row["introduction"],
+                "fulltext": fulltext,
+                "fulltext_clean": parse_pdf.sanetize(fulltext),
+                "title": head.get("title"),
+                "date": head.get("date"),
+                "video_url": head.get("video_url"),
+                "segments": segments,
+            }
+            for row, head, segments, fulltext in zip(rows, heads, bodies, fulltexts)
+        ]
+        connection = create_db.create_connection(os.path.join(directory, "dataset.db"))
+        create_db.migrate(connection)
+        _time(
+            results,
+            "import",
+            lambda: len(create_db.import_press_briefings(connection, records, bulk_load=True)),
+        )
+
+        try:
+            split_sentences.load_punkt()
+        except (LookupError, OSError) as e:
+            results["segment"] = {"skipped": f"punkt model not available: {e}"[:200]}
+        else:
+            _time(
+                results,
+                "segment",
+                lambda: split_sentences.split_sentences(connection, max_workers=workers),
+            )
+
+        server, url = serve_stub(stub_latency)
+
+        def _wikify() -> int:
+            jobs = 0
+            for target, service in [
+                ("title", "dandaleon"),
+                ("intro", "dandaleon"),
+                ("sentence", "tagme"),
+            ]:
+                jobs += wikify_jobs.enqueue(connection, target, service)
+                with wikify.WikifyClient(service, "token", base_url=url, rate=1e6) as client:
+                    wikify_jobs.run(connection, target, client, pack=target == "sentence")
+            return jobs
+
+        _time(results, "wikify", _wikify)
+        server.shutdown()
+        connection.close()
+    return results
+
+
+def check(
+    results: dict[str, dict[str, Any]],
+    thresholds: dict[str, float],
+    baseline: Optional[dict[str, dict[str, Any]]] = None,
+    tolerance: float = 1.5,
+) -> list[str]:
+    """Compare the milliseconds per item of every stage with the thresholds and a baseline.
+
+    Args:
+        results (dict[str, dict[str, Any]]): Timings per scale and stage.
+        thresholds (dict[str, float]): Maximum milliseconds per item per stage.
+        baseline (Optional[dict[str, dict[str, Any]]], optional): Timings of an earlier run. Defaults to None.
+        tolerance (float, optional): Allowed slowdown against the baseline. Defaults to 1.5.
+
+    Returns:
+        list[str]: Regressions, empty if all stages are fast enough.
+    """
+    regressions = []
+    for scale, stages in results.items():
+        for stage, timing in stages.items():
+            ms = timing.get("ms_per_item")
+            if ms is None:
+                continue
+            if stage in thresholds and ms > thresholds[stage]:
+                regressions.append(f"{scale}/{stage}: {ms:.3f}ms > threshold {thresholds[stage]}ms")
+            old = ((baseline or {}).get(scale) or {}).get(stage, {}).get("ms_per_item")
+            if old and ms > tolerance * old:
+                regressions.append(f"{scale}/{stage}: {ms:.3f}ms > {tolerance} x baseline {old}ms")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--segments", type=int, default=60, help="speaker turns per briefing")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="seconds per api call")
+    parser.add_argument("--output", default="bench_pipeline.json")
+    parser.add_argument("--thresholds", default=THRESHOLDS_PATH)
+    parser.add_argument("--baseline", default=None, help="results of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    args = parser.parse_args()
+
+    results = {}
+    for scale in args.scales:
+        results[str(scale)] = run_scale(scale, args.segments, args.workers, args.stub_latency)
+        for stage, timing in results[str(scale)].items():
+            if "skipped" in timing:
+                print(f"{scale:>6} {stage:14} skipped")
+            else:
+                print(
+                    f"{scale:>6} {stage:14} {timing['seconds']:9.3f}s {timing['items']:>8} items"
+                    f" {timing['ms_per_item'] or 0:9.3f}ms/item"
+                )
+
+    with open(args.thresholds, encoding="utf-8") as f:
+        thresholds = json.load(f)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    regressions = check(results, thresholds, baseline, args.tolerance)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "meta": {
+                    "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "cpus": os.cpu_count(),
+                    "segments": args.segments,
+                    "stub_latency": args.stub_latency,
+                },
+                "results": results,
+                "regressions": regressions,
+            },
+            f,
+            indent=1,
+        )
+    for regression in regressions:
+        print("REGRESSION", regression)
+    print("results written to", args.output)
+    sys.exit(1 if regressions else 0)
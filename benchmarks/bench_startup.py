@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Startup time benchmark for `config`, the light `src` modules and the CLI. Every case runs in
+a fresh interpreter. The benchmark fails (exit code 1) if a case is slower than the threshold or
+imports one of the heavy dependencies, which guards against an import creeping back to module
+level.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat N] [--max-seconds S]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HEAVY_MODULES = ["nltk", "pdfminer", "bs4", "requests", "pandas", "numpy"]
+
+# name: python code, run with `python -c`
+CASES = {
+    "import config": "import config",
+    "import src.create_db": "import src.create_db",
+    "import src.cli": "import src.cli",
+    "cli --help": "import sys; sys.argv = ['src', '--help']\ntry:\n    import src.__main__\nexcept SystemExit:\n    pass",
+    "cli check --help": "import sys; sys.argv = ['src', 'check', '--help']\ntry:\n    import src.__main__\nexcept SystemExit:\n    pass",
+}
+CHECK_MODULES = "\nimport sys\nprint(','.join(m for m in {heavy!r} if m in sys.modules), file=sys.stderr)"
+
+
+def _run(code: str) -> tuple[float, str]:
+    """Run code in a fresh interpreter and return the wall time and the loaded heavy modules."""
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-c", code + CHECK_MODULES.format(heavy=HEAVY_MODULES)],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    return time.perf_counter() - start, process.stderr.strip().split("\n")[-1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=0.5, help="threshold per case")
+    args = parser.parse_args()
+
+    baseline = min(_run("pass")[0] for _ in range(args.repeat))
+    print(f"{'interpreter':24} {baseline:.3f}s")
+    failed = False
+    for name, code in CASES.items():
+        runs = [_run(code) for _ in range(args.repeat)]
+        best = min(seconds for seconds, _ in runs)
+        heavy = runs[0][1]
+        ok = best <= args.max_seconds and not heavy
+        failed |= not ok
+        print(
+            f"{name:24} {best:.3f}s (+{best - baseline:.3f}s)"
+            + (f" imports {heavy}" if heavy else "")
+            + ("" if ok else "  FAILED")
+        )
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""Generator for a synthetic SMC press briefing corpus, so the benchmarks run offline and at any
+scale. Every press briefing consists of
+
+- a transcript pdf with a title page („…“ title, date, video url, guest and moderator blocks),
+  `Name: [mm:ss]` speaker turns with wrapped text lines on the following pages and the imprint
+  page ("Ansprechpartner in der Redaktion") that ends the transcript,
+- a briefing site with the title, date, introduction paragraphs and the link to the transcript,
+  like the sites `load_data.extrect_pressbriefing` reads,
+- a row of the metadata table.
+
+The pdfs are written without dependencies (one Helvetica font, WinAnsi encoding). The corpus is
+deterministic for a seed.
+
+Usage:
+    python benchmarks/synthetic.py OUTPUT_DIR [--briefings N] [--segments N] [--seed N]
+"""
+
+import argparse
+import csv
+import os
+import random
+from typing import Any
+
+FIRST_NAMES = ["Sandra", "Christian", "Jonas", "Melanie", "Hendrik", "Viola", "Frank", "Isabella"]
+LAST_NAMES = ["Ciesek", "Drosten", "Schmidt", "Brinkmann", "Streeck", "Priesemann", "Ulrich"]
+AFFILIATIONS = [
+    "Direktorin des Instituts für Medizinische Virologie, Universitätsklinikum Frankfurt",
+    "Leiter der Arbeitsgruppe Epidemiologie, Helmholtz-Zentrum für Infektionsforschung",
+    "Professorin für Klimaphysik, Universität Hamburg",
+    "Wissenschaftlicher Mitarbeiter, Fraunhofer-Institut für Systemtechnik",
+]
+TOPICS = ["Teststrategie", "Impfstoffe", "Hitzewellen", "Wasserstoff", "Künstliche Intelligenz"]
+WORDS = (
+    "die der und in den von zu das mit sich des auf für ist im dem nicht ein Die eine als auch "
+    "Daten Studie Virus Modell Risiko Forschung Ergebnisse Wirkung Menschen Klima Energie "
+    "Deutschland Wissenschaft Infektionen Impfung Prozent deutlich wichtig wahrscheinlich"
+).split()
+MODERATOR = "Volker Stollorz"
+LINE_WIDTH = 90  # characters per transcript line
+LINE_HEIGHT, GAP_HEIGHT, PAGE_HEIGHT = 14, 36, 750  # pt, see `write_pdf`
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(5, 25))]
+    sentence = " ".join(words)
+    return sentence[0].upper() + sentence[1:] + rng.choice([".", ".", ".", "?"])
+
+
+def _wrap(text: str, width: int = LINE_WIDTH) -> list[str]:
+    lines, line = [], ""
+    for word in text.split(" "):
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line + " ")  # pdf lines keep the trailing space of the word break
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    return lines + [line] if line else lines
+
+
+def synthetic_briefing(index: int, num_segments: int = 60, seed: int = 0) -> dict[str, Any]:
+    """Content of one synthetic press briefing.
+
+    Args:
+        index (int): Number of the press briefing, part of the file names.
+        num_segments (int, optional): Number of speaker turns. Defaults to 60.
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+
+    Returns:
+        dict[str, Any]: Title, date, guests, title page lines, transcript pages and introduction.
+    """
+    rng = random.Random(seed * 1000003 + index)
+    topic = rng.choice(TOPICS)
+    title = f"Was wissen wir über {topic}? Teil {index}"
+    date = f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(2018, 2021)}"
+    guests = [
+        (
+            f"{rng.choice(['Prof. Dr. ', 'Dr. ', ''])}{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            rng.choice(AFFILIATIONS),
+        )
+        for _ in range(rng.randint(2, 4))
+    ]
+
+    title_lines = _wrap(title, 40)
+    title_lines[0] = "„" + title_lines[0]
+    title_lines[-1] += "“"
+    head = title_lines + [""]
+    head += [f"Virtuelles Press Briefing vom {date}", ""]
+    for name, affiliation in guests:
+        head += [name, *_wrap(affiliation, 60), ""]
+    head += ["Moderator", f"{MODERATOR}, Redaktionsleiter, Science Media Center Germany", ""]
+    head += [f"https://bit.ly/{rng.randrange(16**6):06x}"]  # the video url ends the title page
+
+    lines = []
+    speakers = [MODERATOR] + [name.replace("Prof. ", "").replace("Dr. ", "") for name, _ in guests]
+    elapsed = 0
+    for turn in range(num_segments):
+        hours, rest = divmod(elapsed, 3600)
+        timecode = f"{rest // 60:02d}:{rest % 60:02d}"
+        speaker = MODERATOR if turn % 4 == 0 else rng.choice(speakers[1:])
+        lines.append(f"{speaker}: [{f'{hours:02d}:' if hours else ''}{timecode}]")
+        elapsed += rng.randint(20, 120)
+        text = " ".join(_sentence(rng) for _ in range(rng.randint(1, 8)))
+        lines += _wrap(text) + [""]
+    pages: list[list[str]] = [[]]
+    height = 0
+    for line in lines:
+        height += LINE_HEIGHT if line else GAP_HEIGHT
+        if height > PAGE_HEIGHT:
+            pages.append([])
+            height = LINE_HEIGHT if line else GAP_HEIGHT
+        pages[-1].append(line)
+    pages.append(["Ansprechpartner in der Redaktion", "", "Science Media Center Germany"])
+
+    introduction = [" ".join(_sentence(rng) for _ in range(4)) for _ in range(rng.randint(2, 4))]
+    return {
+        "title": title,
+        "date": date,
+        "guests": guests,
+        "head": head,
+        "pages": pages,
+        "introduction": introduction,
+    }
+
+
+def _escape(line: str) -> bytes:
+    return (
+        line.replace("\\", "\\\\")
+        .replace("(", "\\(")
+        .replace(")", "\\)")
+        .encode("cp1252", "replace")
+    )
+
+
+def write_pdf(path: str, pages: list[list[str]]):
+    """Write a minimal pdf with one text line per entry, empty entries are paragraph gaps.
+
+    Args:
+        path (str): Path to the pdf file.
+        pages (list[list[str]]): Lines of every page.
+    """
+    font = 3 + 2 * len(pages)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>"
+        % (" ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages))).encode(), len(pages)),
+    ]
+    for i, lines in enumerate(pages):
+        y = 800
+        content = [b"BT /F1 10 Tf"]
+        for line in lines:
+            if line:
+                content.append(b"1 0 0 1 50 %d Tm (%s) Tj" % (y, _escape(line)))
+            y -= LINE_HEIGHT if line else GAP_HEIGHT
+        content.append(b"ET")
+        stream = b"\n".join(content)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (font, 4 + 2 * i)
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+    objects.append(
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+    )
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    with open(path, "wb") as f:
+        f.write(pdf)
+
+
+def briefing_site(briefing: dict[str, Any], pdf_url: str) -> str:
+    """Html of the briefing site, with navigation and footer noise like the real sites."""
+    paragraphs = "".join(f"<p>{paragraph}</p>" for paragraph in briefing["introduction"])
+    day, month, year = briefing["date"].split(".")
+    return (
+        "<!DOCTYPE html><html><head><title>Science Media Center</title></head><body>"
+        + "<nav>"
+        + "".join(f'<li><a href="/nav/{i}">Navigation {i}</a></li>' for i in range(100))
+        + "</nav><main>"
+        + f"<h1>{briefing['title']}</h1>"
+        + f'<time datetime="{year}-{month}-{day}">{briefing["date"]}</time>'
+        + paragraphs
+        + f'<p>Transkript: <a href="{pdf_url}">PDF</a></p>'
+        + "</main><footer>"
+        + "".join(f"<div><span>Footer {i}</span></div>" for i in range(50))
+        + "</footer></body></html>"
+    )
+
+
+def generate_corpus(
+    directory: str, num_briefings: int, num_segments: int = 60, seed: int = 0
+) -> list[dict[str, str]]:
+    """Write a synthetic corpus: `pdf/`, `html/` and `metadata.csv` in a directory.
+
+    Args:
+        directory (str): Output directory.
+        num_briefings (int): Number of press briefings.
+        num_segments (int, optional): Speaker turns per press briefing. Defaults to 60.
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+
+    Returns:
+        list[dict[str, str]]: Metadata rows with the keys `introduction`, `pdf_path`, `pdf_url`
+            and `url`, like `metadata.read_metadata`.
+    """
+    os.makedirs(os.path.join(directory, "pdf"), exist_ok=True)
+    os.makedirs(os.path.join(directory, "html"), exist_ok=True)
+    rows = []
+    for index in range(num_briefings):
+        briefing = synthetic_briefing(index, num_segments, seed)
+        name = f"Transkript_Synthetisch_{index:05d}"
+        pdf_path = os.path.join(directory, "pdf", name + ".pdf")
+        pdf_url = f"https://www.sciencemediacenter.de/fileadmin/{name}.pdf"
+        write_pdf(pdf_path, [briefing["head"]] + briefing["pages"])
+        with open(os.path.join(directory, "html", name + ".html"), "w", encoding="utf-8") as f:
+            f.write(briefing_site(briefing, pdf_url))
+        rows.append(
+            {
+                "introduction": "".join(p + "\n" for p in briefing["introduction"]),
+                "pdf_path": pdf_path,
+                "pdf_url": pdf_url,
+                "url": f"https://www.sciencemediacenter.de/press-briefing/{index}",
+            }
+        )
+    with open(os.path.join(directory, "metadata.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, ["introduction", "pdf_path", "pdf_url", "url"])
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("output")
+    parser.add_argument("--briefings", type=int, default=10)
+    parser.add_argument("--segments", type=int, default=60, help="speaker turns per briefing")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rows = generate_corpus(args.output, args.briefings, args.segments, args.seed)
+    print(len(rows), "press briefings written to", args.output)
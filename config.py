@@ -1,19 +1,82 @@
 import os
-import nltk
 
 DEBUG = False
 
 # Source
 BASE_URL = "https://www.sciencemediacenter.de"
 
+# Crawler
+CRAWL_MAX_WORKERS = 8  # worker threads
+CRAWL_HOST_CONCURRENCY = 4  # requests in flight per host
+CRAWL_RATE = 2.0  # requests per second per host
+
 # Dataset
 BASE_DIR = os.path.join("data", "SMC_dataset")
 METADATA_PATH = os.path.join(BASE_DIR, "metadata.csv")
 DB_PATH = os.path.join(BASE_DIR, "dataset.db")
+PDF_DIR = os.path.join(BASE_DIR, "pdf")
+LABELED_DIR = os.path.join(BASE_DIR, "labeled")  # labeled jsonl slices, see `src.labeled_data`
+PRE_LABELED_DIR = os.path.join(BASE_DIR, "pre_labeled")
+CACHE_DIR = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+LABELED_INDEX_DIR = os.environ.get(  # sidecar indexes of the jsonl slices, outside the dataset
+    "SMC_INDEX_DIR", os.path.join(CACHE_DIR, "smc_dataset", "index")
+)
+
+# Parsing
+EXCLUDED_PDFS = [  # transcripts the parser can not handle
+    "Transkript_Versorgungssituation_Krankenhaeuser_SMC-virtuelles-Press-Briefing_20202_03_11.pdf",
+    "Transkript_vPB_Wasserstoffstrategie.pdf",
+    "Trankript_Duerre-Landwirtschaft-Waelder_SMC-Press-Briefing_2020-05-05.pdf",
+    "Transkript_Corona-und-Klima_SMC-Press-Briefing_2020-04-16.pdf",
+    "Transkript_virPB_Kinder_COVID.pdf",
+    "Transkript_Heinsberg-Studie_Ergebnisse_SMC-Press-Briefing_2020-05-04.pdf",
+    "Transkript_Atomenergie-und-Klimawandel_SMC-PressBriefing_2020-02-26.pdf",
+    "Transkript_SMC_Press_Briefing_Machine_Learning_Medizin_180518.pdf",
+    "Transkript_gesundeStaedte_vPressBriefing_30112020.pdf",
+    "Transkript_CO2-Emissionen-im-Corona-Jahr_SMC-Press-Briefing_2020-12-10.pdf",
+    "Transkript_vPB_Mutationen_SARSCoV2.pdf",
+    "Transkript_Die-_neue-GAP_SMC-Press-Briefing_20210316.pdf",
+    "Transkript_Modellierungen_COVID_SMC_virutelles_Press-Briefing_07-05-2020.pdf",
+]
+PDF_TIMEOUT = 120.0  # seconds per pdf
+PDF_CACHE_PATH = os.path.join(BASE_DIR, "pdf_cache.db")  # extracted lines, keyed by pdf hash
+PDF_CACHE_MAX_BYTES = 512 * 1024**2
+
+# Incremental sync
+STORE_DIR = os.path.join(BASE_DIR, "store")  # content addressed store for pdfs and sites
+MANIFEST_PATH = os.path.join(BASE_DIR, "manifest.db")
+
+# Wikification
+DANDELION_URL = "https://api.dandelion.eu/datatxt/nex/v1/"
+TAGME_URL = "https://tagme.d4science.org/tagme/tag"
+WIKIFY_MAX_WORKERS = 16  # requests in flight
+WIKIFY_RATE = 50.0  # calls per second, limit of the dandelion api
+WIKIFY_CACHE_PATH = os.path.join(BASE_DIR, "wikify_cache.db")  # api responses, keyed by text hash
+WIKIFY_CACHE_TTL = 180 * 24 * 3600  # seconds
+WIKIFY_CACHE_MAX_BYTES = 256 * 1024**2
+WIKIFYED_PATH = os.path.join(  # sentences wikified by the notebook, next to this file
+    os.path.dirname(os.path.abspath(__file__)), "scripts", "wikifyed.txt"
+)
+TOKEN_VARIABLES = {"tagme": "TAGME_TOKEN", "dandaleon": "DANDELION_TOKEN"}  # api token per service
 
-# NLTK
+# Sentence splitting
+SENTENCE_LANGUAGE = "german"  # punkt model
+SENTENCE_CHUNK_SIZE = 2000  # segments per worker task
+
+# NLTK, the punkt model is downloaded on first use, see `split_sentences.load_punkt`
 NLTK_DATA_PATH = os.path.join("data", "nltk_data")
-if not os.path.exists(NLTK_DATA_PATH):
-    os.makedirs(NLTK_DATA_PATH)
-    nltk.download("punkt", NLTK_DATA_PATH)
-    nltk.data.path.append(NLTK_DATA_PATH)
+
+# Export
+EXPORT_CHUNK_SIZE = 10000  # rows fetched from the database at once
+SNAPSHOT_PATH = os.path.join(BASE_DIR, "SMC_claim_sentences.snapshot")  # columnar snapshot
+SNAPSHOT_COMPRESSION = "zstd"  # arrow ipc buffer compression, None for zero-copy reads
+
+# Speaker resolution
+SPEAKER_MATCH_THRESHOLD = 0.85  # similarity of surnames with equal first names
+
+# Near-duplicate sentences
+DEDUP_SHINGLE_SIZE = 5  # bytes per shingle
+DEDUP_NUM_PERM = 64  # minhash permutations
+DEDUP_BANDS = 8  # lsh bands, candidates share all minhashes of a band
+DEDUP_THRESHOLD = 0.8  # minimum estimated jaccard similarity of a cluster pair
+DEDUP_BATCH_SIZE = 20000  # sentences hashed at once
@@ -1,69 +1,187 @@
 # -*- coding: utf-8 -*-
 """Check press briefing parses for database import. Since the press briefing pdfs are not consistent, the parser may fail.
-This script helps to get a quick overview of the parse quality. A brief overview for each press briefing is presented at 
+This script helps to get a quick overview of the parse quality. A brief overview for each press briefing is presented at
 run and can be accepted (y) or denied (n). All filenames for denied parses are written to a file for further investigation
 or exclusion.
+
+The next press briefings are parsed in a background process pool while the current one is reviewed. Verdicts are saved
+after every keypress, so a session can be stopped (q) and resumed later; press briefings whose pdf changed are shown again.
+
+With `--report` the script runs without interaction: all press briefings are parsed in parallel, scored with the
+heuristics in `check_pb` and written to a csv report ranked by score, so only the suspicious parses need a review
+(e.g. with `--min-score 1`).
+
+Usage:
+    python pb_checker.py                      # review all press briefings without a verdict
+    python pb_checker.py --min-score 1        # only review press briefings with issues
+    python pb_checker.py --report             # write parse_report.csv
 """
 
+import argparse
+import csv
+import json
 import os
 import sys
-from typing import Any, Optional
+from typing import Any, Iterable, Iterator, Optional
 
 import pandas as pd  # type: ignore
 
 sys.path.append("..")
-from src.create_dataset import parse_pdf
+from src import parse_pdf
+from src.pdf_cache import PdfCache, file_sha256
 
+ROOT = ".."  # the paths in the metadata table are relative to the repository root
+VERDICTS_PATH = "pb_verdicts.json"
+REPORT_PATH = "parse_report.csv"
+ISSUE_WEIGHTS = {
+    "read error": 10,
+    "missing title": 5,
+    "no segments": 5,
+    "one segment": 3,
+    "missing date": 2,
+    "non monotonic timecodes": 2,
+    "unknown speaker": 1,
+}
 
-def prepare_data(pdf: pd.Series) -> dict[str, Any]:
-    """Parse a pressbriefing pdf from a pressbriefing metadata table row into a dictionary.
+
+def build_pb(row: dict[str, Any], head: list[str], body: list[str]) -> dict[str, Any]:
+    """Parse the lines of a pressbriefing pdf into a dictionary.
 
     Args:
-        pdf (pd.Series): Row from pressbriefing metadata table.
+        row (dict[str, Any]): Row from pressbriefing metadata table.
+        head (list[str]): Lines of the first page.
+        body (list[str]): Lines of the remaining pages.
 
     Returns:
-        dict[str, str]: Dictionary with pressbriefing information.
+        dict[str, Any]: Dictionary with pressbriefing information.
     """
-
-    # add metadata
-    pdf_path = pdf[1]["pdf_path"]
-    pdf_url = pdf[1]["pdf_url"]
-    introduction_text = pdf[1]["introduction"]
-
-    # read pdf file
-    head, body = parse_pdf.read_pdf("../" + pdf[1]["pdf_path"])  # parse pdf
     fulltext = " ".join(body)
-    fulltext_clean = parse_pdf.sanetize(fulltext)
 
     # parse head
     head_metadata = parse_pdf.parse_head(head)  # type: ignore
-    title = head_metadata.get("title")
-    date = head_metadata.get("date")
-    video_url = head_metadata.get("video_url")
 
     # parse body
     segments = parse_pdf.parse_body(body)
     persons = list(set([part.get("speaker") for part in segments]))
 
     return {
-        "pdf_path": pdf_path,
-        "pdf_url": pdf_url,
-        "introduction_text": introduction_text,
+        "pdf_path": row["pdf_path"],
+        "pdf_url": row["pdf_url"],
+        "introduction_text": row["introduction"],
         "fulltext": fulltext,
-        "fulltext_clean": fulltext_clean,
-        "title": title,
-        "date": date,
-        "video_url": video_url,
+        "fulltext_clean": parse_pdf.sanetize(fulltext),
+        "title": head_metadata.get("title"),
+        "date": head_metadata.get("date"),
+        "video_url": head_metadata.get("video_url"),
         "person": persons,
+        "head_person": [person.get("name", "") for person in head_metadata["person"]],
         "segments": segments,
     }
 
 
-def print_pb(pb: dict[str, Optional[Any]]):
+def prepare_data(pdf: pd.Series, cache: Optional[PdfCache] = None) -> dict[str, Any]:
+    """Parse a pressbriefing pdf from a pressbriefing metadata table row into a dictionary.
+
+    Args:
+        pdf (pd.Series): Row from pressbriefing metadata table.
+        cache (Optional[PdfCache], optional): Cache for the extracted pdf lines. Defaults to None.
+
+    Returns:
+        dict[str, str]: Dictionary with pressbriefing information.
+    """
+    head, body = parse_pdf.read_pdf(os.path.join(ROOT, pdf[1]["pdf_path"]), cache=cache)
+    return build_pb(pdf[1], head, body)
+
+
+def iter_pbs(
+    rows: Iterable[dict[str, Any]],
+    cache: Optional[PdfCache] = None,
+    max_workers: Optional[int] = None,
+) -> Iterator[tuple[dict[str, Any], Optional[dict[str, Any]], Optional[str]]]:
+    """Parse press briefings in a process pool, see `parse_pdf.read_pdfs`. Up to two pdfs per
+    worker are parsed ahead of the one that is yielded.
+
+    Args:
+        rows (Iterable[dict[str, Any]]): Rows from pressbriefing metadata table.
+        cache (Optional[PdfCache], optional): Cache for the extracted pdf lines. Defaults to None.
+        max_workers (Optional[int], optional): Number of worker processes. Defaults to the number of CPUs.
+
+    Yields:
+        tuple[dict[str, Any], Optional[dict[str, Any]], Optional[str]]: Metadata row, pressbriefing
+            dictionary (None if the pdf could not be read) and error.
+    """
+    rows = list(rows)
+    paths = [os.path.join(ROOT, row["pdf_path"]) for row in rows]
+    for row, result in zip(rows, parse_pdf.read_pdfs(paths, max_workers=max_workers, cache=cache)):
+        if result.error:
+            yield row, None, result.error
+        else:
+            yield row, build_pb(row, result.head, result.body), None
+
+
+def check_pb(pb: Optional[dict[str, Any]]) -> list[str]:
+    """Find typical parse errors with simple heuristics.
+
+    Args:
+        pb (Optional[dict[str, Any]]): Pressbriefing dictionary, None if the pdf could not be read.
+
+    Returns:
+        list[str]: Issues, see `ISSUE_WEIGHTS`. Issues with a detail have the form "issue: detail".
+    """
+    if pb is None:
+        return ["read error"]
+    issues = []
+    if not pb.get("title"):
+        issues.append("missing title")
+    if not pb.get("date"):
+        issues.append("missing date")
+
+    segments = [s for s in pb["segments"] if s.get("text")]
+    if len(segments) == 0:
+        issues.append("no segments")
+    elif len(segments) == 1:
+        issues.append("one segment")
+
+    seconds = [
+        parse_pdf.timecode_seconds(s["timecode"]) for s in pb["segments"] if s.get("timecode")
+    ]
+    jumps = sum(1 for a, b in zip(seconds, seconds[1:]) if b < a)
+    if jumps:
+        issues.append(f"non monotonic timecodes: {jumps}")
+
+    head_names = " ".join(pb["head_person"])
+    for speaker in sorted(s for s in pb["person"] if s):
+        if speaker.split()[-1] not in head_names:  # compare last names, titles are often missing
+            issues.append(f"unknown speaker: {speaker}")
+    return issues
+
+
+def score(issues: list[str]) -> int:
+    """Sum of the weights of the issues."""
+    return sum(ISSUE_WEIGHTS[issue.split(":")[0]] for issue in issues)
+
+
+def load_verdicts(path: str = VERDICTS_PATH) -> dict[str, dict[str, str]]:
+    """Load the saved verdicts (pdf_path -> verdict and sha256 of the pdf)."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_verdicts(verdicts: dict[str, dict[str, str]], path: str = VERDICTS_PATH):
+    """Save the verdicts. The file is replaced atomically, so an interrupted session keeps the old one."""
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(verdicts, f, indent=4, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def print_pb(pb: dict[str, Optional[Any]], issues: Optional[list[str]] = None):
     """Pretty print pressbriefing information from a dictionary.
 
     Args:
         pb (dict[str, str]): Pressbriefing dictionarry.
+        issues (Optional[list[str]], optional): Issues found by `check_pb`. Defaults to None.
     """
     segments = [s.get("text") for s in pb.get("segments")]  # type: ignore
     timecodes = str([t.get("timecode") for t in pb.get("segments")])  # type: ignore
@@ -90,12 +208,100 @@ def print_pb(pb: dict[str, Optional[Any]]):
     print("num_segments:        ", num_segments)
     print("timecodes:           ", timecodes[:100])
     print("Speaker:             ", person)
+    if issues is not None:
+        print("Issues:              ", "; ".join(issues) or "-", f"(score {score(issues)})")
     print(
         "############################################################################################################################################"
     )
     print("\n")
 
 
+def review(
+    rows: list[dict[str, Any]],
+    cache: Optional[PdfCache] = None,
+    max_workers: Optional[int] = None,
+    min_score: int = 0,
+    verdicts_path: str = VERDICTS_PATH,
+) -> list[str]:
+    """Review the press briefings without a verdict interactively while the next ones are parsed.
+
+    Args:
+        rows (list[dict[str, Any]]): Rows from pressbriefing metadata table.
+        cache (Optional[PdfCache], optional): Cache for the extracted pdf lines. Defaults to None.
+        max_workers (Optional[int], optional): Number of worker processes. Defaults to the number of CPUs.
+        min_score (int, optional): Skip press briefings with a lower score. Defaults to 0.
+        verdicts_path (str, optional): Path to the saved verdicts. Defaults to VERDICTS_PATH.
+
+    Returns:
+        list[str]: pdf paths of all denied parses, including earlier sessions.
+    """
+    verdicts = load_verdicts(verdicts_path)
+    hashes = {}
+    todo = []
+    for row in rows:
+        path = os.path.join(ROOT, row["pdf_path"])
+        hashes[row["pdf_path"]] = file_sha256(path) if os.path.exists(path) else None
+        verdict = verdicts.get(row["pdf_path"])
+        if not verdict or verdict["sha256"] != hashes[row["pdf_path"]]:
+            todo.append(row)
+    print(len(rows) - len(todo), "of", len(rows), "press briefings already reviewed.")
+
+    for num, (row, pb, error) in enumerate(iter_pbs(todo, cache, max_workers)):
+        issues = check_pb(pb)
+        if score(issues) < min_score:
+            continue
+        print("Num:             ", str(num), "of", len(todo))
+        if pb is None:
+            print("ERROR: Could not read pdf:", row["pdf_path"], error, "\n")
+        else:
+            print_pb(pb, issues)
+        command = input()
+        if command == "q":
+            break
+        elif command in ("y", "n"):
+            verdicts[row["pdf_path"]] = {"verdict": command, "sha256": hashes[row["pdf_path"]]}
+            save_verdicts(verdicts, verdicts_path)
+        os.system("clear")  # Linux - OSX
+    return [path for path, verdict in verdicts.items() if verdict["verdict"] == "n"]
+
+
+def report(
+    rows: list[dict[str, Any]],
+    cache: Optional[PdfCache] = None,
+    max_workers: Optional[int] = None,
+    path: str = REPORT_PATH,
+) -> list[dict[str, Any]]:
+    """Parse and score all press briefings in parallel and write a csv report ranked by score.
+
+    Args:
+        rows (list[dict[str, Any]]): Rows from pressbriefing metadata table.
+        cache (Optional[PdfCache], optional): Cache for the extracted pdf lines. Defaults to None.
+        max_workers (Optional[int], optional): Number of worker processes. Defaults to the number of CPUs.
+        path (str, optional): Path to the csv report. Defaults to REPORT_PATH.
+
+    Returns:
+        list[dict[str, Any]]: Report rows, highest score first.
+    """
+    results = []
+    for row, pb, error in iter_pbs(rows, cache, max_workers):
+        issues = check_pb(pb)
+        results.append(
+            {
+                "score": score(issues),
+                "pdf_path": row["pdf_path"],
+                "title": pb.get("title") if pb else None,
+                "num_segments": len(pb["segments"]) if pb else 0,
+                "issues": "; ".join(issues + ([error] if error else [])),
+            }
+        )
+    results.sort(key=lambda result: -result["score"])  # stable, keeps the metadata order
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, ["score", "pdf_path", "title", "num_segments", "issues"])
+        writer.writeheader()
+        writer.writerows(results)
+    return results
+
+
 def done(no):
     with open("parse_errors.txt", "w") as outFile:
         for pdf in no:
@@ -109,23 +315,24 @@ if __name__ == "__main__":
     BASE_DIR = "../data/SMC_dataset"
     METADATA_PATH = os.path.join(BASE_DIR, "metadata.csv")
     DB_PATH = os.path.join(BASE_DIR, "dataset.db")
+    PDF_CACHE_PATH = os.path.join(BASE_DIR, "pdf_cache.db")
+
+    parser = argparse.ArgumentParser(description="Check press briefing parses for database import.")
+    parser.add_argument("--report", nargs="?", const=REPORT_PATH, help="write a ranked csv report")
+    parser.add_argument("--min-score", type=int, default=0, help="only review parses with issues")
+    parser.add_argument("--workers", type=int, default=None, help="number of parser processes")
+    parser.add_argument("--verdicts", default=VERDICTS_PATH, help="path to the saved verdicts")
+    args = parser.parse_args()
 
     metadata = pd.read_csv(METADATA_PATH)
     metadata = metadata.dropna().reset_index(drop=True)  # delete na rows
+    rows = metadata.to_dict("records")
 
-    no: list = []
-    for pdf in metadata.iterrows():
-        print("Num:             ", str(pdf[0]))
-        data = prepare_data(pdf)
-        print_pb(data)
-        command = input()
-        if command == "q":
-            done(no)
-            break
-        elif command == "y":
-            continue
-        elif command == "n":
-            no.append(pdf[1]["pdf_path"])
-        os.system("clear")  # Linux - OSX
-
-    done(no)
+    cache = PdfCache(PDF_CACHE_PATH)
+    if args.report:
+        results = report(rows, cache, args.workers, args.report)
+        suspicious = sum(1 for result in results if result["score"] > 0)
+        print(suspicious, "of", len(results), "parses with issues written to", args.report)
+    else:
+        done(review(rows, cache, args.workers, args.min_score, args.verdicts))
+    cache.close()
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""Entry point for `python -m src`, see `src.cli`."""
+
+import sys
+
+from src.cli import main
+
+sys.exit(main())
@@ -0,0 +1,544 @@
+# -*- coding: utf-8 -*-
+"""Incremental build of the dataset. The steps of create_dataset.ipynb form a stage graph:
+
+    scrape -> download -> parse -> import -> segment -> wikify_sentence
+                                         |          |-> dedup
+                                         |          \\-> export
+                                         |-> resolve ---/
+                                         |-> wikify_title
+                                         \\-> wikify_intro
+
+Every stage plans its dirty artifacts before it runs. The parse stage hashes the pdf content and
+extraction parameters, the import stage the parsed record of every transcript, and both record
+the hashes in the `Build_State` table, so only changed transcripts are parsed and re-imported,
+and transcripts removed from the metadata or added to `EXCLUDED_PDFS` are deleted. Press
+briefings imported before the build state existed are adopted by their pdf path.
+Segmentation, speaker resolution and wikification are incremental by themselves, the sentence
+clusters are recomputed when sentences were added or deleted. Stages whose dependencies are done
+run concurrently. A dry run only reads: it opens the database read only, parses only the lines
+already in the pdf cache and does not migrate the database.
+
+Examples:
+    build.build(dry_run=True)  # print what would be rebuilt
+    build.build()
+    build.build(stages=["import", "segment"])
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+
+from config import (
+    BASE_DIR,
+    CRAWL_MAX_WORKERS,
+    DB_PATH,
+    METADATA_PATH,
+    PDF_CACHE_PATH,
+    PDF_DIR,
+    SNAPSHOT_PATH,
+    TOKEN_VARIABLES,
+    WIKIFY_CACHE_PATH,
+)
+from src import create_db, metrics
+from src.metadata import read_metadata, write_metadata
+
+DB_TIMEOUT = 60.0  # seconds to wait for the lock of a concurrently writing stage
+EXPORT_PATH = os.path.join(BASE_DIR, "SMC_claim_sentences.csv")
+WIKIFY_SERVICES = {"sentence": "tagme", "title": "dandaleon", "intro": "dandaleon"}
+UNPARSED = "unparsed"  # import hash of a transcript a dry run finds no cached lines for
+
+# dirty artifacts of a stage: artifact -> input hash (None for artifacts to remove) for tracked
+# stages, artifact -> source or None for the others
+Plan = dict[str, Optional[str]]
+
+
+@dataclass
+class BuildContext:
+    db_path: str = DB_PATH
+    metadata_path: str = METADATA_PATH
+    scrape: bool = False  # the sites can not be checked for changes, so scraping is opt in
+    workers: Optional[int] = None
+    read_only: bool = False  # dry run
+    records: dict[str, dict[str, Any]] = field(default_factory=dict)  # parsed by plan_import
+    _hashes: dict[tuple[str, float, int], str] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def connect(self) -> sqlite3.Connection:
+        return create_db.create_connection(self.db_path, self.read_only, DB_TIMEOUT)
+
+    def file_hash(self, path: str) -> Optional[str]:
+        """SHA-256 of a file, memoized by path, modification time and size."""
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        key = (path, stat.st_mtime, stat.st_size)
+        with self._lock:
+            if key in self._hashes:
+                return self._hashes[key]
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b""):
+                sha.update(chunk)
+        with self._lock:
+            self._hashes[key] = sha.hexdigest()
+        return sha.hexdigest()
+
+
+class Stage(NamedTuple):
+    deps: tuple[str, ...]
+    plan: Callable[[BuildContext], Plan]
+    run: Callable[[BuildContext, Plan], Iterable[str]]  # returns the built artifacts
+    tracked: bool = False  # record the input hashes of the built artifacts
+
+
+def _hash(*values) -> str:
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _recorded(ctx: BuildContext, stage: str) -> dict[str, str]:
+    connection = ctx.connect()
+    recorded = dict(
+        connection.execute(
+            "SELECT artifact, input_hash FROM Build_State WHERE stage=?", (stage,)
+        ).fetchall()
+    )
+    connection.close()
+    return recorded
+
+
+def _source_hash(module: str) -> str:
+    """Hash of a module in `src`, changes to the export invalidate the exported files."""
+    with open(os.path.join(os.path.dirname(__file__), module + ".py"), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _metadata(ctx: BuildContext) -> list[dict[str, str]]:
+    return read_metadata(ctx.metadata_path) if os.path.exists(ctx.metadata_path) else []
+
+
+# scrape
+
+
+def plan_scrape(ctx: BuildContext) -> Plan:
+    if ctx.scrape or not os.path.exists(ctx.metadata_path):
+        return {ctx.metadata_path: None}
+    return {}
+
+
+def run_scrape(ctx: BuildContext, plan: Plan) -> Iterable[str]:
+    from src import sync
+
+    results = sync.sync_pressbriefings(max_workers=ctx.workers or CRAWL_MAX_WORKERS)
+    write_metadata(results, ctx.metadata_path)
+    return plan
+
+
+# download
+
+
+def plan_download(ctx: BuildContext) -> Plan:
+    return {
+        row["pdf_path"]: row["pdf_url"]
+        for row in _metadata(ctx)
+        if not os.path.exists(row["pdf_path"])
+    }
+
+
+def run_download(ctx: BuildContext, plan: Plan) -> Iterable[str]:
+    from src import load_data
+
+    paths = load_data.load_pdfs_from_urls(
+        list(plan.values()), PDF_DIR, max_workers=ctx.workers or CRAWL_MAX_WORKERS  # type: ignore
+    )
+    return [path for path in paths if path]
+
+
+# parse
+
+
+def _parse_hashes(ctx: BuildContext) -> dict[str, str]:
+    from src.pdf_cache import extraction_params
+
+    params = extraction_params()
+    return {
+        row["pdf_path"]: _hash(ctx.file_hash(row["pdf_path"]), params)
+        for row in _metadata(ctx)
+        if os.path.exists(row["pdf_path"])
+    }
+
+
+def plan_parse(ctx: BuildContext) -> Plan:
+    recorded = _recorded(ctx, "parse")
+    return {path: h for path, h in _parse_hashes(ctx).items() if recorded.get(path) != h}
+
+
+def run_parse(ctx: BuildContext, plan: Plan) -> Iterable[str]:
+    from src import parse_pdf, pdf_cache
+
+    cache = pdf_cache.PdfCache(PDF_CACHE_PATH)
+    built = []
+    for result in parse_pdf.read_pdfs(list(plan), max_workers=ctx.workers, cache=cache):
+        if result.error:
+            print("ERROR: Could not read pdf:", result.path, result.error)
+        else:
+            built.append(result.path)
+    cache.close()
+    return built
+
+
+# import
+
+
+def _parse_records(
+    ctx: BuildContext, rows: list[dict[str, str]]
+) -> Iterator[tuple[str, str, Optional[dict[str, Any]]]]:
+    """Parse every transcript and hash its record, so changes to the parser only invalidate the
+    transcripts whose records change. The lines come from the pdf cache filled by the parse
+    stage, unreadable pdfs and transcripts without a title are skipped. A dry run does not
+    extract pdfs missing in the cache, they are dirty, and returns no records."""
+    from src import parse_pdf, pdf_cache
+
+    if ctx.read_only:
+        cache = None
+        if os.path.exists(PDF_CACHE_PATH):
+            cache = pdf_cache.PdfCache(PDF_CACHE_PATH, read_only=True)
+        params = pdf_cache.extraction_params()
+        for row in rows:
+            lines = cache.get(ctx.file_hash(row["pdf_path"]), params) if cache else None  # type: ignore
+            if lines is None:
+                yield row["pdf_path"], UNPARSED, None
+            elif record := parse_pdf.parse_press_briefing(row, *lines):
+                yield row["pdf_path"], _hash(record), None
+        if cache:
+            cache.close()
+        return
+
+    cache = pdf_cache.PdfCache(PDF_CACHE_PATH)
+    try:
+        for record in parse_pdf.parse_press_briefings(rows, cache, [], max_workers=ctx.workers):
+            yield record["pdf_path"], _hash(record), record
+    finally:
+        cache.close()
+
+
+def plan_import(ctx: BuildContext) -> Plan:
+    """Plan the changed transcripts. Their records are kept in the context for `run_import`, so
+    every transcript is parsed once per build."""
+    recorded = _recorded(ctx, "import")
+    rows = [row for row in _metadata(ctx) if os.path.exists(row["pdf_path"])]
+    plan: Plan = {}
+    for path, h, record in _parse_records(ctx, rows):
+        if recorded.get(path) != h:
+            plan[path] = h
+            if record is not None:
+                ctx.records[path] = record
+    listed = {row["pdf_path"] for row in rows}
+    plan.update({path: None for path in recorded if path not in listed})  # removed or excluded
+    return plan
+
+
+def run_import(ctx: BuildContext, plan: Plan) -> Iterable[str]:
+    connection = ctx.connect()
+    recorded = _recorded(ctx, "import")
+    paths = list(plan)
+    imported = [
+        (pb_ID, pdf_path)
+        for i in range(0, len(paths), 500)
+        for pb_ID, pdf_path in connection.execute(
+            f"SELECT pb_ID, pdf_path FROM Press_Briefing WHERE pdf_path IN ({', '.join('?' * len(paths[i : i + 500]))})",
+            paths[i : i + 500],
+        )
+    ]
+    # press briefings imported before the build state existed are adopted, not imported again
+    adopted = {path for _, path in imported if path not in recorded and plan[path] is not None}
+    create_db.delete_press_briefings(
+        connection, [pb_ID for pb_ID, path in imported if path not in adopted]
+    )
+
+    records = (ctx.records.pop(path) for path in paths if path in ctx.records)
+    create_db.import_press_briefings(
+        connection,
+        (record for record in records if record["pdf_path"] not in adopted),
+        bulk_load=True,
+    )
+    connection.close()
+    return paths
+
+
+# segment
+
+
+def plan_segment(ctx: BuildContext) -> Plan:
+    connection = ctx.connect()
+    (count,) = connection.execute("SELECT COUNT(*) FROM Segment WHERE split = 0").fetchone()
+    connection.close()
+    return {f"{count} segments": None} if count else {}
+
+
+def run_segment(ctx: BuildContext, plan: Plan) -> Iterable[str]:
+    from src import split_sentences
+
+    connection = ctx.connect()
+    split_sentences.split_sentences(connection, max_workers=ctx.workers)
+    connection.close()
+    return plan
+
+
+# resolve
+
+
+def plan_resolve(ctx: BuildContext) -> Plan:
+    connection = ctx.connect()
+    (persons,) = connection.execute(
+        "SELECT COUNT(*) FROM Person WHERE person_ID NOT IN (SELECT person_ID FROM Person_Alias)"
+    ).fetchone()
+    (head_persons,) = connection.execute(
+        "SELECT COUNT(*) FROM Head_Person WHERE person_ID IS NULL"
+    ).fetchone()
+    connection.close()
+    plan: Plan = {}
+    if persons:
+        plan[f"{persons} persons"] = None
+    if head_persons:
+        plan[f"{head_persons} title page persons"] = None
+    return plan
+
+
+def run_resolve(ctx: BuildContext, plan: Plan) -> Iterable[str]:
+    from src import resolve_speakers
+
+    connection = ctx.connect()
+    resolve_speakers.resolve_speakers(connection)
+    connection.close()
+    return plan
+
+
+# dedup
+
+
+def plan_dedup(ctx: BuildContext) -> Plan:
+    connection = ctx.connect()
+    (unclustered,) = connection.execute(
+        "SELECT COUNT(*) FROM Sentence WHERE sentence_ID NOT IN (SELECT sentence_ID FROM Sentence_Cluster)"
+    ).fetchone()
+    (orphaned,) = connection.execute(
+        "SELECT COUNT(*) FROM Sentence_Cluster WHERE cluster_ID NOT IN (SELECT sentence_ID FROM Sentence)"
+    ).fetchone()
+    connection.close()
+    plan: Plan = {}
+    if unclustered:
+        plan[f"{unclustered} sentences"] = None
+    if orphaned:
+        plan[f"{orphaned} clustered sentences without representative"] = None
+    return plan
+
+
+def run_dedup(ctx: BuildContext, plan: Plan) -> Iterable[str]:
+    from src import dedup
+
+    connection = ctx.connect()
+    dedup.cluster_sentences(connection)
+    connection.close()
+    return plan
+
+
+# wikify
+
+
+def _plan_wikify(target: str) -> Callable[[BuildContext], Plan]:
+    def plan(ctx: BuildContext) -> Plan:
+        from src.wikify_jobs import TARGETS
+
+        spec = TARGETS[target]
+        connection = ctx.connect()
+        (count,) = connection.execute(
+            f"""SELECT COUNT(*) FROM {spec.source_table} WHERE NOT EXISTS (
+                SELECT 1 FROM Wikification_Job WHERE target=? AND service=? AND status IN ('done', 'failed')
+                AND target_ID = {spec.source_table}.{spec.id_column})""",
+            (target, WIKIFY_SERVICES[target]),
+        ).fetchone()
+        connection.close()
+        return {f"{count} {target} jobs": None} if count else {}
+
+    return plan
+
+
+def _run_wikify(target: str) -> Callable[[BuildContext, Plan], Iterable[str]]:
+    def run(ctx: BuildContext, plan: Plan) -> Iterable[str]:
+        service = WIKIFY_SERVICES[target]
+        token = os.environ.get(TOKEN_VARIABLES[service])
+        if not token:
+            print(f"Skipping {target} wikification, {TOKEN_VARIABLES[service]} is not set.")
+            return []
+
+        from src import wikify, wikify_cache, wikify_jobs
+
+        connection = ctx.connect()
+        cache = wikify_cache.WikifyCache(WIKIFY_CACHE_PATH)
+        wikify_jobs.enqueue(connection, target, service)
+        with wikify.WikifyClient(service, token) as client:
+            wikify_jobs.run(connection, target, client, cache, pack=target == "sentence")
+        cache.close()
+        connection.close()
+        return plan
+
+    return run
+
+
+# export
+
+
+def plan_export(ctx: BuildContext) -> Plan:
+    connection = ctx.connect()
+    sentences = connection.execute("SELECT COUNT(*), MAX(sentence_ID) FROM Sentence").fetchone()
+    imported = connection.execute(
+        "SELECT group_concat(input_hash) FROM (SELECT input_hash FROM Build_State WHERE stage='import' ORDER BY artifact)"
+    ).fetchone()
+    connection.close()
+    h = _hash(sentences, imported, _source_hash("export"))
+    recorded = _recorded(ctx, "export")
+    return {
+        path: h
+        for path in (EXPORT_PATH, SNAPSHOT_PATH)
+        if not (os.path.exists(path) and recorded.get(path) == h)
+    }
+
+
+def run_export(ctx: BuildContext, plan: Plan) -> Iterable[str]:
+    from src import export
+
+    connection = ctx.connect()
+    if EXPORT_PATH in plan:
+        export.write_csv(connection, EXPORT_PATH)
+    if SNAPSHOT_PATH in plan:
+        export.write_snapshot(connection, SNAPSHOT_PATH)
+    connection.close()
+    return plan
+
+
+STAGES: dict[str, Stage] = {
+    "scrape": Stage((), plan_scrape, run_scrape),
+    "download": Stage(("scrape",), plan_download, run_download),
+    "parse": Stage(("download",), plan_parse, run_parse, tracked=True),
+    "import": Stage(("parse",), plan_import, run_import, tracked=True),
+    "segment": Stage(("import",), plan_segment, run_segment),
+    "resolve": Stage(("import",), plan_resolve, run_resolve),
+    "dedup": Stage(("segment",), plan_dedup, run_dedup),
+    "wikify_title": Stage(("import",), _plan_wikify("title"), _run_wikify("title")),
+    "wikify_intro": Stage(("import",), _plan_wikify("intro"), _run_wikify("intro")),
+    "wikify_sentence": Stage(("segment",), _plan_wikify("sentence"), _run_wikify("sentence")),
+    "export": Stage(("segment", "resolve"), plan_export, run_export, tracked=True),
+}
+
+
+def _ancestors(name: str) -> set[str]:
+    ancestors = set()
+    for dep in STAGES[name].deps:
+        ancestors |= {dep} | _ancestors(dep)
+    return ancestors
+
+
+def _record(ctx: BuildContext, stage: str, plan: Plan, built: Iterable[str]):
+    """Record the input hashes of the built artifacts of a stage."""
+    built = set(built)
+    connection = ctx.connect()
+    with connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO Build_State (stage, artifact, input_hash) VALUES (?, ?, ?)",
+            [(stage, a, h) for a, h in plan.items() if a in built and h is not None],
+        )
+        connection.executemany(
+            "DELETE FROM Build_State WHERE stage=? AND artifact=?",
+            [(stage, a) for a, h in plan.items() if a in built and h is None],
+        )
+    connection.close()
+
+
+def _run_stage(ctx: BuildContext, name: str) -> Plan:
+    stage = STAGES[name]
+    plan = stage.plan(ctx)
+    if not plan:
+        print(f"{name}: up to date")
+        return plan
+    print(f"{name}: building {len(plan)} artifacts")
+    with metrics.timer("stage_seconds", stage=name):
+        built = stage.run(ctx, plan)
+    metrics.inc("stage_artifacts_total", len(plan), stage=name)
+    if stage.tracked:
+        _record(ctx, name, plan, built)
+    return plan
+
+
+def build(
+    db_path: str = DB_PATH,
+    metadata_path: str = METADATA_PATH,
+    stages: Optional[Iterable[str]] = None,
+    dry_run: bool = False,
+    scrape: bool = False,
+    jobs: int = 3,
+    workers: Optional[int] = None,
+) -> dict[str, Plan]:
+    """Run the dirty stages of the build.
+
+    Args:
+        db_path (str, optional): Path to the database. Defaults to DB_PATH.
+        metadata_path (str, optional): Path to the metadata table. Defaults to METADATA_PATH.
+        stages (Optional[Iterable[str]], optional): Stages to run, the others are skipped. Defaults to all stages.
+        dry_run (bool, optional): Only print the plan of each stage. Defaults to False.
+        scrape (bool, optional): Synchronize with the SMC website. Defaults to False.
+        jobs (int, optional): Maximum number of stages running at once. Defaults to 3.
+        workers (Optional[int], optional): Number of workers within a stage. Defaults to the stage default.
+
+    Returns:
+        dict[str, Plan]: Dirty artifacts of each stage that was run or planned.
+
+    Raises:
+        ValueError: If a stage does not exist.
+    """
+    stages = None if stages is None else set(stages)
+    if stages is not None and (unknown := stages - set(STAGES)):
+        raise ValueError(f"unknown stages: {', '.join(sorted(unknown))}")
+    selected = [name for name in STAGES if stages is None or name in stages]
+    ctx = BuildContext(db_path, metadata_path, scrape, workers, read_only=dry_run)
+
+    if dry_run:  # plans of later stages do not include the changes of earlier stages
+        if not os.path.exists(db_path):
+            print(f"No database at {db_path}, the build creates it and runs all stages.")
+            return {}
+        connection = ctx.connect()
+        version, latest = create_db.schema_version(connection), create_db.MIGRATIONS[-1][0]
+        connection.close()
+        if version < latest:
+            print(f"Schema version {version} of {latest}, the build migrates the database first.")
+            return {}
+        plans = {name: STAGES[name].plan(ctx) for name in selected}
+        for name, plan in plans.items():
+            print(f"{name}: {len(plan)} dirty" if plan else f"{name}: up to date")
+            for artifact, h in list(plan.items())[:10]:
+                print("   ", "remove" if h is None and STAGES[name].tracked else "build ", artifact)
+        return plans
+
+    connection = ctx.connect()
+    create_db.migrate(connection)
+    connection.close()
+    plans: dict[str, Plan] = {}
+    running: dict[Future, str] = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while len(plans) < len(selected):
+            for name in selected:
+                deps = [dep for dep in _ancestors(name) if dep in selected]
+                if (
+                    name not in plans
+                    and name not in running.values()
+                    and all(dep in plans for dep in deps)
+                ):
+                    running[executor.submit(_run_stage, ctx, name)] = name
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                plans[running.pop(future)] = future.result()
+    return plans
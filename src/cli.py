@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""Command line interface for the dataset creation. Every subcommand runs one step of
+create_dataset.ipynb. The heavy dependencies (requests, bs4, pdfminer, nltk) are only imported
+by the subcommands that need them, so e.g. `check` starts without loading any of them.
+
+Usage:
+    python -m src scrape      # synchronize the press briefing sites and pdfs, write metadata.csv
+    python -m src download    # download pdfs from metadata.csv that are missing on disk
+    python -m src parse       # extract the text of all pdfs into the pdf cache
+    python -m src import      # parse and import the press briefings not yet in the database
+    python -m src segment     # split the new segments into sentences
+    python -m src resolve     # merge duplicate speakers, link them to the title pages
+    python -m src dedup       # cluster near-duplicate sentences, see `src.dedup`
+    python -m src wikify --target sentence --service tagme --representatives
+    python -m src export      # write SMC_claim_sentences.csv
+    python -m src export --format snapshot  # columnar snapshot for training, see `src.export`
+    python -m src check       # check schema version and query plans
+    python -m src build --dry-run  # show which stages and transcripts changed, see `src.build`
+    python -m src --metrics metrics.prom --profile profiles parse  # see `src.metrics`
+"""
+
+import argparse
+import csv
+import os
+import sys
+from typing import Optional
+
+from config import (
+    BASE_DIR,
+    CRAWL_MAX_WORKERS,
+    DB_PATH,
+    METADATA_PATH,
+    PDF_CACHE_PATH,
+    PDF_DIR,
+    TOKEN_VARIABLES,
+)
+from src import metrics
+from src.metadata import read_metadata, write_metadata
+
+EXPORT_FILES = {
+    "csv": "SMC_claim_{}.csv",
+    "jsonl": "SMC_claim_{}.jsonl",
+    "snapshot": "SMC_claim_{}.snapshot",
+}
+
+
+def cmd_scrape(args: argparse.Namespace) -> int:
+    from src import sync
+
+    results = sync.sync_pressbriefings(max_workers=args.workers or CRAWL_MAX_WORKERS)
+    write_metadata(results, args.metadata)
+    print(sum(pb["changed"] for pb in results), "of", len(results), "press briefings changed.")
+    return 0
+
+
+def cmd_download(args: argparse.Namespace) -> int:
+    from src import load_data
+
+    with open(args.metadata, newline="", encoding="utf-8") as f:
+        missing = [
+            row["pdf_url"]
+            for row in csv.DictReader(f)
+            if row.get("pdf_url") and not (row.get("pdf_path") and os.path.exists(row["pdf_path"]))
+        ]
+    paths = load_data.load_pdfs_from_urls(
+        missing, PDF_DIR, max_workers=args.workers or CRAWL_MAX_WORKERS
+    )
+    failed = paths.count(None)
+    print(len(paths) - failed, "pdfs downloaded,", failed, "failed.")
+    return 1 if failed else 0
+
+
+def cmd_parse(args: argparse.Namespace) -> int:
+    from src import parse_pdf, pdf_cache
+
+    paths = [row["pdf_path"] for row in read_metadata(args.metadata)]
+    cache = pdf_cache.PdfCache(PDF_CACHE_PATH)
+    errors = 0
+    for result in parse_pdf.read_pdfs(paths, max_workers=args.workers, cache=cache):
+        if result.error:
+            print("ERROR: Could not read pdf:", result.path, result.error)
+            errors += 1
+    cache.close()
+    print(len(paths) - errors, "pdfs parsed,", errors, "failed.")
+    return 1 if errors else 0
+
+
+def cmd_import(args: argparse.Namespace) -> int:
+    from src import create_db, parse_pdf, pdf_cache
+
+    connection = create_db.create_connection(args.db)
+    create_db.migrate(connection)
+    imported = {path for (path,) in connection.execute("SELECT pdf_path FROM Press_Briefing")}
+    rows = [row for row in read_metadata(args.metadata) if row["pdf_path"] not in imported]
+
+    cache = pdf_cache.PdfCache(PDF_CACHE_PATH)
+    errors: list[tuple[str, str]] = []
+    records = parse_pdf.parse_press_briefings(rows, cache, errors, max_workers=args.workers)
+    pb_IDs = create_db.import_press_briefings(connection, records, bulk_load=True)
+    cache.close()
+    connection.close()
+    for path, error in errors:
+        print("ERROR: Could not read pdf:", path, error)
+    print(len(pb_IDs), "press briefings imported.")
+    return 1 if errors else 0
+
+
+def cmd_segment(args: argparse.Namespace) -> int:
+    from src import create_db, split_sentences
+
+    connection = create_db.create_connection(args.db)
+    create_db.migrate(connection)
+    inserted = split_sentences.split_sentences(connection, max_workers=args.workers)
+    connection.close()
+    print(inserted, "sentences inserted.")
+    return 0
+
+
+def cmd_resolve(args: argparse.Namespace) -> int:
+    from src import create_db, resolve_speakers
+
+    connection = create_db.create_connection(args.db)
+    create_db.migrate(connection)
+    read = create_db.backfill_head_persons(connection)
+    report = resolve_speakers.resolve_speakers(connection)
+    connection.close()
+    print(
+        f"{read} title page persons read, {report['merged']} duplicate persons merged, "
+        f"{report['review']} similar persons to review in Person_Review, "
+        f"{report['linked']} title page persons linked ({report['relinked']} speakers relinked, "
+        f"{report['created']} persons added)."
+    )
+    return 0
+
+
+def cmd_dedup(args: argparse.Namespace) -> int:
+    from src import create_db, dedup
+
+    connection = create_db.create_connection(args.db)
+    create_db.migrate(connection)
+    report = dedup.cluster_sentences(connection)
+    connection.close()
+    print(
+        f"{report['duplicates']} of {report['sentences']} sentences are near duplicates "
+        f"in {report['clusters']} clusters."
+    )
+    return 0
+
+
+def cmd_wikify(args: argparse.Namespace) -> int:
+    from config import WIKIFY_CACHE_PATH
+    from src import create_db, wikify, wikify_cache, wikify_jobs
+
+    token = os.environ.get(TOKEN_VARIABLES[args.service])
+    if not token:
+        print("ERROR: Set the environment variable", TOKEN_VARIABLES[args.service])
+        return 2
+
+    connection = create_db.create_connection(args.db)
+    create_db.migrate(connection)
+    cache = wikify_cache.WikifyCache(WIKIFY_CACHE_PATH)
+    wikify_jobs.enqueue(connection, args.target, args.service, args.representatives)
+    with wikify.WikifyClient(args.service, token) as client:
+        report = wikify_jobs.run(connection, args.target, client, cache, pack=args.pack)
+    cache.close()
+    connection.close()
+    print(report)
+    return 0 if report["pending"] == 0 else 1
+
+
+def cmd_export(args: argparse.Namespace) -> int:
+    from src import create_db, export
+
+    output = args.output or os.path.join(BASE_DIR, EXPORT_FILES[args.format].format(args.query))
+    writer = {
+        "csv": export.write_csv,
+        "jsonl": export.write_jsonl,
+        "snapshot": export.write_snapshot,
+    }
+    if not os.path.exists(args.db):
+        print("ERROR: No database at", args.db)
+        return 1
+    connection = create_db.create_connection(args.db, read_only=True)
+    rows = writer[args.format](connection, output, args.query)
+    connection.close()
+    print(rows, "rows exported to", output)
+    return 0
+
+
+def cmd_check(args: argparse.Namespace) -> int:
+    from src import create_db
+
+    if not os.path.exists(args.db):
+        print("ERROR: No database at", args.db)
+        return 1
+    # read only, the check must not create or migrate anything
+    connection = create_db.create_connection(args.db, read_only=True)
+    version = create_db.schema_version(connection)
+    latest = create_db.MIGRATIONS[-1][0]
+    print("schema version:", version, "of", latest)
+    if version < latest:
+        connection.close()
+        print("ERROR: Run `python -m src import` to migrate the database.")
+        return 1
+    results = create_db.check_query_plans(connection)
+    connection.close()
+    for name, (uses_indexes, plan) in results.items():
+        print("ok  " if uses_indexes else "SCAN", name, "|", "; ".join(plan))
+    return 0 if all(uses_indexes for uses_indexes, _ in results.values()) else 1
+
+
+def cmd_build(args: argparse.Namespace) -> int:
+    from src import build
+
+    unknown = set(args.stages) - set(build.STAGES)
+    if unknown:
+        print("ERROR: Unknown stages:", ", ".join(sorted(unknown)), "of", ", ".join(build.STAGES))
+        return 1
+    build.build(
+        args.db,
+        args.metadata,
+        stages=args.stages or None,
+        dry_run=args.dry_run,
+        scrape=args.scrape,
+        jobs=args.jobs,
+        workers=args.workers,
+    )
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Argument parser with one subparser per pipeline step."""
+    parser = argparse.ArgumentParser(
+        prog="python -m src", description="Create the SMC press briefing claim dataset."
+    )
+    parser.add_argument("--db", default=DB_PATH, help="path to the sqlite database")
+    parser.add_argument("--metadata", default=METADATA_PATH, help="path to metadata.csv")
+    parser.add_argument("--workers", type=int, default=None, help="number of workers")
+    parser.add_argument("--metrics", default=None, help="write metrics to a .json or .prom file")
+    parser.add_argument("--profile", default=None, help="save cProfile profiles to a directory")
+    parser.add_argument("--profile-top", type=int, default=10, help="profiles kept per stage")
+    parser.add_argument("--profile-memory", action="store_true", help="also run tracemalloc")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("scrape", help="synchronize the sites and pdfs").set_defaults(
+        func=cmd_scrape
+    )
+    subparsers.add_parser("download", help="download missing pdfs").set_defaults(func=cmd_download)
+    subparsers.add_parser("parse", help="extract the pdfs into the cache").set_defaults(
+        func=cmd_parse
+    )
+    subparsers.add_parser("import", help="import new press briefings").set_defaults(func=cmd_import)
+    subparsers.add_parser("segment", help="split new segments into sentences").set_defaults(
+        func=cmd_segment
+    )
+    subparsers.add_parser("resolve", help="merge duplicate speakers").set_defaults(func=cmd_resolve)
+    subparsers.add_parser("dedup", help="cluster near-duplicate sentences").set_defaults(
+        func=cmd_dedup
+    )
+
+    wikify_parser = subparsers.add_parser("wikify", help="run the wikification jobs")
+    wikify_parser.add_argument(
+        "--target", choices=["sentence", "title", "intro"], default="sentence"
+    )
+    wikify_parser.add_argument("--service", choices=sorted(TOKEN_VARIABLES), default="tagme")
+    wikify_parser.add_argument("--pack", action="store_true", help="pack sentences of a segment")
+    wikify_parser.add_argument(
+        "--representatives", action="store_true", help="skip near-duplicate sentences"
+    )
+    wikify_parser.set_defaults(func=cmd_wikify)
+
+    export_parser = subparsers.add_parser("export", help="export a query, see `src.export`")
+    export_parser.add_argument(
+        "--query", default="sentences", help="name in export.QUERIES or sql (with --output)"
+    )
+    export_parser.add_argument("--format", choices=sorted(EXPORT_FILES), default="csv")
+    export_parser.add_argument("--output", default=None, help="defaults to data/SMC_dataset")
+    export_parser.set_defaults(func=cmd_export)
+
+    subparsers.add_parser("check", help="check schema and query plans").set_defaults(func=cmd_check)
+
+    build_parser_ = subparsers.add_parser("build", help="run all stages with changed inputs")
+    build_parser_.add_argument("stages", nargs="*", help="stages to run, defaults to all")
+    build_parser_.add_argument("--dry-run", action="store_true", help="only show what is dirty")
+    build_parser_.add_argument("--scrape", action="store_true", help="sync with the website")
+    build_parser_.add_argument("--jobs", type=int, default=3, help="stages running at once")
+    build_parser_.set_defaults(func=cmd_build)
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.profile:
+        metrics.enable_profiling(args.profile, args.profile_top, args.profile_memory)
+    try:
+        with metrics.profile(args.command, "batch"), metrics.timer(
+            "command_seconds", command=args.command
+        ):
+            return args.func(args)
+    finally:
+        if args.metrics:
+            metrics.write(args.metrics)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
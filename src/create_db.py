@@ -1,19 +1,33 @@
 # -*- coding: utf-8 -*-
 """Create and interact with a sqlite database for the SMC Dataset."""
 
+import os
+import pathlib
 import sqlite3
+from typing import Any, Callable, Iterable
 
+from config import WIKIFYED_PATH
+from src import metrics
 
-def create_connection(path: str) -> sqlite3.Connection:
+
+def create_connection(
+    path: str, read_only: bool = False, timeout: float = 5.0
+) -> sqlite3.Connection:
     """Create a connection and if not allready existing a database at a given path.
 
     Args:
         path (str): Path to sqlite database.
+        read_only (bool, optional): Open the database read only, e.g. for checks and dry runs. A
+            missing database then raises `sqlite3.OperationalError` instead of being created. Defaults to False.
+        timeout (float, optional): Seconds to wait for the lock of another connection. Defaults to 5.0.
 
     Returns:
         sqlite3.Connection: Connection object to interact with the database.
     """
-    return sqlite3.connect(path)
+    if read_only:
+        uri = f"{pathlib.Path(path).resolve().as_uri()}?mode=ro"
+        return sqlite3.connect(uri, uri=True, timeout=timeout)
+    return sqlite3.connect(path, timeout=timeout)
 
 
 def db_execute(command: str, connection: sqlite3.Connection):
@@ -29,10 +43,11 @@ def db_execute(command: str, connection: sqlite3.Connection):
 
 
 def create_tables(connection: sqlite3.Connection):
-    """Create the tables for the SMC dataset."""
+    """Create the tables for the SMC dataset. Existing tables are left untouched, use `migrate`
+    to bring a database to the latest schema version."""
 
     # Person Table
-    command = """CREATE TABLE Person
+    command = """CREATE TABLE IF NOT EXISTS Person
     (
         person_ID INTEGER PRIMARY KEY autoincrement,
         name text NOT NULL,
@@ -43,7 +58,7 @@ def create_tables(connection: sqlite3.Connection):
     db_execute(command, connection)
 
     # Press_Briefing Table
-    command = """CREATE TABLE Press_Briefing
+    command = """CREATE TABLE IF NOT EXISTS Press_Briefing
     (
         pb_ID INTEGER PRIMARY KEY autoincrement,
         title text,
@@ -61,7 +76,7 @@ def create_tables(connection: sqlite3.Connection):
     db_execute(command, connection)
 
     # is guest table
-    command = """CREATE TABLE is_guest
+    command = """CREATE TABLE IF NOT EXISTS is_guest
     (
         pb_ID int,
         person_ID int,
@@ -72,7 +87,7 @@ def create_tables(connection: sqlite3.Connection):
     db_execute(command, connection)
 
     # segment table
-    command = """CREATE TABLE Segment
+    command = """CREATE TABLE IF NOT EXISTS Segment
     (
         segment_ID INTEGER PRIMARY KEY autoincrement,
         pb_ID int NOT NULL,
@@ -87,7 +102,7 @@ def create_tables(connection: sqlite3.Connection):
     db_execute(command, connection)
 
     # sentences table
-    command = """CREATE TABLE Sentence
+    command = """CREATE TABLE IF NOT EXISTS Sentence
     (
         sentence_ID INTEGER PRIMARY KEY autoincrement,
         pb_ID int,
@@ -101,7 +116,7 @@ def create_tables(connection: sqlite3.Connection):
     db_execute(command, connection)
 
     # Sentence wikification table
-    command = """CREATE TABLE Sentence_Wikification
+    command = """CREATE TABLE IF NOT EXISTS Sentence_Wikification
     (
         sentence_wikification_ID INTEGER PRIMARY KEY autoincrement,
         sentence_ID int,
@@ -116,7 +131,7 @@ def create_tables(connection: sqlite3.Connection):
     db_execute(command, connection)
 
     # Sentence wikification table
-    command = """CREATE TABLE pb_Wikification_title
+    command = """CREATE TABLE IF NOT EXISTS pb_Wikification_title
     (
         pb_wiki_title_ID INTEGER PRIMARY KEY autoincrement,
         pb_ID int,
@@ -131,7 +146,7 @@ def create_tables(connection: sqlite3.Connection):
     db_execute(command, connection)
 
     # Sentence wikification table
-    command = """CREATE TABLE pb_Wikification_intro
+    command = """CREATE TABLE IF NOT EXISTS pb_Wikification_intro
     (
         pb_wiki_intro_ID INTEGER PRIMARY KEY autoincrement,
         pb_ID int,
@@ -144,3 +159,635 @@ def create_tables(connection: sqlite3.Connection):
     )
     """
     db_execute(command, connection)
+
+
+def normalize_name(name: str) -> str:
+    """Normalize a person name for lookups: collapse whitespace and lowercase.
+
+    Args:
+        name (str): Person name.
+
+    Returns:
+        str: Normalized name.
+    """
+    return " ".join(name.split()).lower()
+
+
+def create_indexes(connection: sqlite3.Connection):
+    """Create the secondary indexes for the joins and lookups of the import, analysis and export."""
+    for command in [
+        "CREATE INDEX IF NOT EXISTS idx_sentence_segment ON Sentence (segment_ID, sentence_ID)",
+        "CREATE INDEX IF NOT EXISTS idx_sentence_pb ON Sentence (pb_ID, sentence_ID)",
+        "CREATE INDEX IF NOT EXISTS idx_segment_pb ON Segment (pb_ID, speaker)",
+        "CREATE INDEX IF NOT EXISTS idx_segment_speaker ON Segment (speaker, pb_ID)",
+        "CREATE INDEX IF NOT EXISTS idx_is_guest_pb ON is_guest (pb_ID, person_ID)",
+        "CREATE INDEX IF NOT EXISTS idx_is_guest_person ON is_guest (person_ID, pb_ID)",
+        "CREATE INDEX IF NOT EXISTS idx_sentence_wikification_sentence ON Sentence_Wikification (sentence_ID)",
+        "CREATE INDEX IF NOT EXISTS idx_pb_wikification_title_pb ON pb_Wikification_title (pb_ID)",
+        "CREATE INDEX IF NOT EXISTS idx_pb_wikification_intro_pb ON pb_Wikification_intro (pb_ID)",
+        "CREATE INDEX IF NOT EXISTS idx_person_name ON Person (lower(trim(name)))",
+    ]:
+        db_execute(command, connection)
+
+
+def create_job_table(connection: sqlite3.Connection):
+    """Create the queue of wikification jobs, one job per (target, target_ID, service),
+    see `wikify_jobs`."""
+    db_execute(
+        """CREATE TABLE IF NOT EXISTS Wikification_Job
+    (
+        job_ID INTEGER PRIMARY KEY autoincrement,
+        target text NOT NULL,
+        target_ID int NOT NULL,
+        service text NOT NULL,
+        status text NOT NULL DEFAULT 'pending',
+        attempts int NOT NULL DEFAULT 0,
+        last_error text,
+        claimed_at real,
+        finished_at real,
+
+        UNIQUE (target, target_ID, service)
+    )
+    """,
+        connection,
+    )
+    db_execute(
+        "CREATE INDEX IF NOT EXISTS idx_wikification_job_status ON Wikification_Job (target, service, status, job_ID)",
+        connection,
+    )
+
+
+def create_build_state_table(connection: sqlite3.Connection):
+    """Create the table with the input hash of every artifact built by `build`."""
+    db_execute(
+        """CREATE TABLE IF NOT EXISTS Build_State
+    (
+        stage text NOT NULL,
+        artifact text NOT NULL,
+        input_hash text NOT NULL,
+        built_at text DEFAULT CURRENT_TIMESTAMP,
+
+        PRIMARY KEY (stage, artifact)
+    )
+    """,
+        connection,
+    )
+
+
+def create_speaker_tables(connection: sqlite3.Connection):
+    """Create the tables of the speaker resolution, see `resolve_speakers`: the persons listed on
+    the title page of each press briefing and the known name variants of each person."""
+    db_execute(
+        """CREATE TABLE IF NOT EXISTS Head_Person
+    (
+        head_person_ID INTEGER PRIMARY KEY autoincrement,
+        pb_ID int NOT NULL,
+        name text NOT NULL,
+        description text,
+        person_ID int,
+
+        FOREIGN KEY (pb_ID) REFERENCES Press_Briefing (pb_ID)
+        FOREIGN KEY (person_ID) REFERENCES Person (person_ID)
+    )
+    """,
+        connection,
+    )
+    db_execute(
+        """CREATE TABLE IF NOT EXISTS Person_Alias
+    (
+        name text PRIMARY KEY,
+        person_ID int NOT NULL,
+
+        FOREIGN KEY (person_ID) REFERENCES Person (person_ID)
+    )
+    """,
+        connection,
+    )
+    for command in [
+        "CREATE INDEX IF NOT EXISTS idx_head_person_pb ON Head_Person (pb_ID)",
+        "CREATE INDEX IF NOT EXISTS idx_head_person_unlinked ON Head_Person (person_ID, pb_ID)",
+        "CREATE INDEX IF NOT EXISTS idx_person_alias_person ON Person_Alias (person_ID)",
+    ]:
+        db_execute(command, connection)
+
+
+def create_cluster_table(connection: sqlite3.Connection):
+    """Create the table of the near-duplicate sentence clusters, see `dedup`. The cluster of a
+    sentence is named after its representative, the lowest `sentence_ID` of the cluster."""
+    db_execute(
+        """CREATE TABLE IF NOT EXISTS Sentence_Cluster
+    (
+        sentence_ID INTEGER PRIMARY KEY,
+        cluster_ID int NOT NULL,
+
+        FOREIGN KEY (sentence_ID) REFERENCES Sentence (sentence_ID)
+    )
+    """,
+        connection,
+    )
+    db_execute(
+        "CREATE INDEX IF NOT EXISTS idx_sentence_cluster ON Sentence_Cluster (cluster_ID, sentence_ID)",
+        connection,
+    )
+
+
+def create_person_name_keys(connection: sqlite3.Connection):
+    """Store the normalized name of every person (see `normalize_name`) and replace the index on
+    `lower(trim(name))`, whose SQLite normalization differs from `normalize_name` in whitespace
+    and non ASCII case, by an index on the stored key. Persons with the same key are left to
+    `resolve_speakers`, a migration only changes the schema."""
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(Person)")]
+    if "name_key" not in columns:
+        db_execute("ALTER TABLE Person ADD COLUMN name_key text", connection)
+    with connection:
+        connection.executemany(
+            "UPDATE Person SET name_key=? WHERE person_ID=?",
+            [
+                (normalize_name(name), person_ID)
+                for person_ID, name in connection.execute("SELECT person_ID, name FROM Person")
+            ],
+        )
+    db_execute("DROP INDEX IF EXISTS idx_person_name", connection)
+    db_execute("CREATE INDEX IF NOT EXISTS idx_person_name_key ON Person (name_key)", connection)
+
+
+def seed_wikification_jobs(connection: sqlite3.Connection):
+    """Enqueue the sentences the notebook wikified before the job queue existed as done tagme
+    jobs, so `wikify_jobs.run` does not wikify them again. The notebook kept their ids in
+    `WIKIFYED_PATH`, sentences with results are also seeded by `wikify_jobs.enqueue`."""
+    if not os.path.exists(WIKIFYED_PATH):
+        return
+    with open(WIKIFYED_PATH, encoding="utf-8") as f:
+        ids = [(int(line),) for line in f if line.strip()]
+    with connection:
+        connection.executemany(
+            """INSERT OR IGNORE INTO Wikification_Job (target, target_ID, service, status)
+            SELECT 'sentence', sentence_ID, 'tagme', 'done' FROM Sentence WHERE sentence_ID=?""",
+            ids,
+        )
+
+
+def create_segment_split_flags(connection: sqlite3.Connection):
+    """Flag the segments that were split into sentences, see `split_sentences`. Segments that
+    give no sentence, e.g. only whitespace, are flagged too and not split again on every run."""
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(Segment)")]
+    if "split" not in columns:
+        db_execute("ALTER TABLE Segment ADD COLUMN split int NOT NULL DEFAULT 0", connection)
+    db_execute(
+        """UPDATE Segment SET split=1
+        WHERE EXISTS (SELECT 1 FROM Sentence WHERE Sentence.segment_ID = Segment.segment_ID)""",
+        connection,
+    )
+    db_execute(
+        "CREATE INDEX IF NOT EXISTS idx_segment_unsplit ON Segment (segment_ID) WHERE split = 0",
+        connection,
+    )
+
+
+def create_person_review_table(connection: sqlite3.Connection):
+    """Create the table of the person pairs whose names are similar but not equal, e.g. typos or
+    an initial, which `resolve_speakers` leaves to a curator instead of merging them."""
+    db_execute(
+        """CREATE TABLE IF NOT EXISTS Person_Review
+    (
+        person_ID int NOT NULL,
+        other_ID int NOT NULL,
+        kind text NOT NULL,
+
+        PRIMARY KEY (person_ID, other_ID)
+        FOREIGN KEY (person_ID) REFERENCES Person (person_ID)
+        FOREIGN KEY (other_ID) REFERENCES Person (person_ID)
+    )
+    """,
+        connection,
+    )
+
+
+def _head_person_rows(pb_ID: int, guests: Iterable[dict[str, str]]) -> list[tuple[int, str, Any]]:
+    """Head_Person rows of the persons of a title page, see `parse_pdf.parse_head`."""
+    return [
+        (pb_ID, guest["name"].strip(), guest.get("description", "").strip() or None)
+        for guest in guests
+        if guest.get("name", "").strip()
+    ]
+
+
+# Schema migrations as (version, description, function). Every function has to be idempotent.
+MIGRATIONS: list[tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "create tables", create_tables),
+    (2, "create indexes", create_indexes),
+    (3, "create wikification job queue", create_job_table),
+    (4, "create build state", create_build_state_table),
+    (5, "create speaker resolution tables", create_speaker_tables),
+    (6, "create sentence clusters", create_cluster_table),
+    (7, "store normalized person names", create_person_name_keys),
+    (8, "seed wikification jobs of the notebook", seed_wikification_jobs),
+    (9, "flag split segments", create_segment_split_flags),
+    (10, "create person review table", create_person_review_table),
+]
+
+
+def create_version_table(connection: sqlite3.Connection):
+    """Create the table of the applied migrations."""
+    db_execute(
+        """CREATE TABLE IF NOT EXISTS Schema_Version
+    (
+        version INTEGER PRIMARY KEY,
+        description text,
+        applied_at text DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+        connection,
+    )
+
+
+def schema_version(connection: sqlite3.Connection) -> int:
+    """Get the schema version of the database.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+
+    Returns:
+        int: Latest applied migration, 0 for an empty database.
+    """
+    if not connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='Schema_Version'"
+    ).fetchone():
+        return 0  # nothing is written, the connection may be read only
+    return connection.execute("SELECT COALESCE(MAX(version), 0) FROM Schema_Version").fetchone()[0]
+
+
+def migrate(connection: sqlite3.Connection) -> int:
+    """Bring the database to the latest schema version. Only migrations newer than the current
+    version are applied, so the function can be run on every start.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+
+    Returns:
+        int: Schema version after the migration.
+    """
+    create_version_table(connection)
+    version = schema_version(connection)
+    for migration_version, description, migration in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        migration(connection)
+        connection.execute(
+            "INSERT INTO Schema_Version (version, description) VALUES (?, ?)",
+            (migration_version, description),
+        )
+        connection.commit()
+        version = migration_version
+    return version
+
+
+# Queries on the hot paths of the import, analysis and export, checked by `check_query_plans`.
+HOT_QUERIES: dict[str, str] = {
+    "sentences of segment": "SELECT sentence_ID, sentence FROM Sentence WHERE segment_ID = 1",
+    "sentences of press briefing": "SELECT sentence_ID, sentence FROM Sentence WHERE pb_ID = 1",
+    "segments of speaker": "SELECT segment_ID, text FROM Segment WHERE speaker = 1",
+    "segments with speaker of press briefing": """SELECT Segment.segment_ID, Person.name, Person.afiliation
+        FROM Segment JOIN Person ON Person.person_ID = Segment.speaker WHERE Segment.pb_ID = 1""",
+    "guests of press briefing": """SELECT Person.name FROM is_guest
+        JOIN Person ON Person.person_ID = is_guest.person_ID WHERE is_guest.pb_ID = 1""",
+    "wikification of sentence": "SELECT term, url FROM Sentence_Wikification WHERE sentence_ID = 1",
+    "person by name": "SELECT person_ID FROM Person WHERE name_key = 'x'",
+    "sentences with speaker": """SELECT Sentence.sentence_ID, Person.afiliation FROM Sentence
+        JOIN Segment ON Segment.segment_ID = Sentence.segment_ID
+        JOIN Person ON Person.person_ID = Segment.speaker WHERE Sentence.pb_ID = 1""",
+    "unlinked title page persons": """SELECT head_person_ID, name FROM Head_Person
+        WHERE person_ID IS NULL ORDER BY pb_ID""",
+    "sentences of cluster": "SELECT sentence_ID FROM Sentence_Cluster WHERE cluster_ID = 1",
+    "unsplit segments": """SELECT segment_ID, pb_ID, text FROM Segment
+        WHERE segment_ID > 0 AND split = 0 ORDER BY segment_ID LIMIT 500""",
+    "claim wikification jobs": """SELECT job_ID, target_ID FROM Wikification_Job
+        WHERE target = 'sentence' AND service = 'tagme' AND status = 'pending' ORDER BY job_ID LIMIT 500""",
+}
+
+
+def check_query_plans(connection: sqlite3.Connection) -> dict[str, tuple[bool, list[str]]]:
+    """Check with EXPLAIN QUERY PLAN that the hot queries do not scan a full table.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+
+    Returns:
+        dict[str, tuple[bool, list[str]]]: For each query whether it only uses indexes and its plan.
+    """
+    results = {}
+    for name, query in HOT_QUERIES.items():
+        plan = [row[3] for row in connection.execute("EXPLAIN QUERY PLAN " + query)]
+        uses_indexes = not any(step.startswith("SCAN") and "INDEX" not in step for step in plan)
+        results[name] = (uses_indexes, plan)
+    return results
+
+
+# German text: umlauts and ß carry meaning (schon/schön), so diacritics are kept and only the case
+# is folded. The prefix indexes make prefix queries on long compound words (e.g. "Impf*") fast.
+FTS_TOKENIZE = "unicode61 remove_diacritics 0"
+FTS_PREFIX = "2 3 4"
+FTS_TABLES = {  # fts table: (content table, id column, text column)
+    "Sentence_fts": ("Sentence", "sentence_ID", "sentence"),
+    "Segment_fts": ("Segment", "segment_ID", "text"),
+}
+
+
+def create_fulltext_index(connection: sqlite3.Connection):
+    """Create the optional FTS5 full text indexes over `Sentence.sentence` and `Segment.text`.
+    The indexes are kept in sync with their tables by triggers and filled from the existing rows.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+
+    Raises:
+        RuntimeError: If the SQLite library is compiled without FTS5.
+    """
+    for fts, (table, id_column, text_column) in FTS_TABLES.items():
+        try:
+            db_execute(
+                f"""CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5
+            (
+                {text_column},
+                content='{table}',
+                content_rowid='{id_column}',
+                tokenize='{FTS_TOKENIZE}',
+                prefix='{FTS_PREFIX}'
+            )
+            """,
+                connection,
+            )
+        except sqlite3.OperationalError as e:
+            raise RuntimeError(f"SQLite FTS5 is not available: {e}") from e
+
+        for command in [
+            f"""CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, {text_column}) VALUES (new.{id_column}, new.{text_column});
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {text_column}) VALUES ('delete', old.{id_column}, old.{text_column});
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {text_column} ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {text_column}) VALUES ('delete', old.{id_column}, old.{text_column});
+                INSERT INTO {fts} (rowid, {text_column}) VALUES (new.{id_column}, new.{text_column});
+            END""",
+        ]:
+            db_execute(command, connection)
+    rebuild_fulltext_index(connection)
+
+
+def rebuild_fulltext_index(connection: sqlite3.Connection):
+    """Rebuild the full text indexes from their tables, e.g. after a bulk load without triggers.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+    """
+    for fts in FTS_TABLES:
+        db_execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')", connection)
+        db_execute(f"INSERT INTO {fts} ({fts}) VALUES ('optimize')", connection)
+
+
+def fts_query(query: str) -> str:
+    """Quote every whitespace separated term of a user query as an FTS5 string, so that
+    hyphens, colons or question marks are matched as text instead of being parsed as FTS5
+    syntax. A trailing `*` is kept as a prefix query and all terms have to match.
+
+    Args:
+        query (str): Search terms, e.g. `SARS-CoV-2 Impf*`.
+
+    Returns:
+        str: FTS5 query, e.g. `"SARS-CoV-2" "Impf"*`.
+    """
+    terms = []
+    for term in query.split():
+        prefix = term.endswith("*") and len(term.rstrip("*")) > 0
+        term = term.rstrip("*") if prefix else term
+        terms.append('"' + term.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def search_sentences(
+    connection: sqlite3.Connection, query: str, limit: int = 20, raw: bool = False
+) -> list[dict[str, Any]]:
+    """Full text search over all sentences, ranked by BM25.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        query (str): Search terms, e.g. `Corona-Virus` or `Impf*`, see `fts_query`.
+        limit (int, optional): Maximum number of results. Defaults to 20.
+        raw (bool, optional): Pass the query unchanged as FTS5 syntax, e.g.
+            `Impfstoff AND Wirksamkeit` or `NEAR(Maske Pflicht)`. Defaults to False.
+
+    Returns:
+        list[dict[str, Any]]: Matching sentences with the press briefing title, speaker, timecode and score.
+    """
+    cur = connection.execute(
+        """SELECT Sentence.sentence_ID, Sentence.sentence, Press_Briefing.pb_ID, Press_Briefing.title,
+            Person.name AS speaker, Segment.timecode, bm25(Sentence_fts) AS score
+        FROM Sentence_fts
+        JOIN Sentence ON Sentence.sentence_ID = Sentence_fts.rowid
+        LEFT JOIN Press_Briefing ON Press_Briefing.pb_ID = Sentence.pb_ID
+        LEFT JOIN Segment ON Segment.segment_ID = Sentence.segment_ID
+        LEFT JOIN Person ON Person.person_ID = Segment.speaker
+        WHERE Sentence_fts MATCH ?
+        ORDER BY score
+        LIMIT ?
+        """,
+        (query if raw else fts_query(query), limit),
+    )
+    columns = [c[0] for c in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+def search_segments(
+    connection: sqlite3.Connection, query: str, limit: int = 20, raw: bool = False
+) -> list[dict[str, Any]]:
+    """Full text search over all segments, ranked by BM25.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        query (str): Search terms, see `search_sentences`.
+        limit (int, optional): Maximum number of results. Defaults to 20.
+        raw (bool, optional): Pass the query unchanged as FTS5 syntax. Defaults to False.
+
+    Returns:
+        list[dict[str, Any]]: Matching segments with the press briefing title, speaker, timecode and score.
+    """
+    cur = connection.execute(
+        """SELECT Segment.segment_ID, Segment.text, Press_Briefing.pb_ID, Press_Briefing.title,
+            Person.name AS speaker, Segment.timecode, bm25(Segment_fts) AS score
+        FROM Segment_fts
+        JOIN Segment ON Segment.segment_ID = Segment_fts.rowid
+        LEFT JOIN Press_Briefing ON Press_Briefing.pb_ID = Segment.pb_ID
+        LEFT JOIN Person ON Person.person_ID = Segment.speaker
+        WHERE Segment_fts MATCH ?
+        ORDER BY score
+        LIMIT ?
+        """,
+        (query if raw else fts_query(query), limit),
+    )
+    columns = [c[0] for c in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+def _set_bulk_load_pragmas(connection: sqlite3.Connection) -> int:
+    """Switch the database to WAL mode and disable syncing for a bulk load.
+
+    Returns:
+        int: Previous value of `PRAGMA synchronous` to restore after the load.
+    """
+    synchronous = connection.execute("PRAGMA synchronous").fetchone()[0]
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=OFF")
+    return synchronous
+
+
+def import_press_briefings(
+    connection: sqlite3.Connection, records: Iterable[dict[str, Any]], bulk_load: bool = False
+) -> list[int]:
+    """Import parsed press briefings into the database. Each press briefing is loaded in a single
+    transaction with its guests and segments. Speakers are resolved through an in memory map from
+    normalized name (and the name variants found by `resolve_speakers`) to `person_ID`, new
+    speakers are added to the Person table.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        records (Iterable[dict[str, Any]]): Press briefings with the keys `pdf_path`, `pdf_url`,
+            `introduction_text`, `fulltext`, `fulltext_clean`, `title`, `date`, `video_url`,
+            `segments`, a list of segments as returned by `parse_pdf.parse_body`, and optionally
+            `guests`, the persons of the title page as returned by `parse_pdf.parse_head`.
+        bulk_load (bool, optional): Use WAL mode and `synchronous=OFF` during the load. Defaults to False.
+
+    Returns:
+        list[int]: IDs of the imported press briefings.
+    """
+    person_ids: dict[str, int] = {}
+    for name, person_ID in connection.execute(
+        "SELECT name, person_ID FROM Person ORDER BY person_ID"
+    ):
+        person_ids.setdefault(normalize_name(name), person_ID)
+    for name, person_ID in connection.execute("SELECT name, person_ID FROM Person_Alias"):
+        person_ids.setdefault(name, person_ID)
+    synchronous = _set_bulk_load_pragmas(connection) if bulk_load else None
+    pb_IDs: list[int] = []
+
+    try:
+        for record in records:
+            segments = record.get("segments", [])
+            persons = [p for p in dict.fromkeys(s.get("speaker") for s in segments) if p]
+            keys = {person: normalize_name(person) for person in persons}
+
+            # one transaction per press briefing
+            with metrics.timer("db_commit_seconds", table="Press_Briefing"), connection:
+                cur = connection.execute(
+                    """INSERT INTO Press_Briefing(
+                        pdf_path, pdf_url, introduction_text, fulltext, fulltext_clean, title, date, video_url)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        record.get("pdf_path"),
+                        record.get("pdf_url"),
+                        record.get("introduction_text"),
+                        record.get("fulltext"),
+                        record.get("fulltext_clean"),
+                        record.get("title"),
+                        record.get("date"),
+                        record.get("video_url"),
+                    ),
+                )
+                pb_ID = cur.lastrowid
+
+                for person in persons:
+                    if keys[person] not in person_ids:  # add person
+                        cur = connection.execute(
+                            "INSERT INTO Person (name, name_key) VALUES (?, ?)",
+                            (person, keys[person]),
+                        )
+                        person_ids[keys[person]] = cur.lastrowid  # type: ignore
+                        metrics.inc("db_rows_inserted_total", table="Person")
+                guest_rows = list(
+                    dict.fromkeys((pb_ID, person_ids[keys[person]]) for person in persons)
+                )
+                connection.executemany(
+                    "INSERT INTO is_guest (pb_ID, person_ID) VALUES (?, ?)", guest_rows
+                )
+                rows = [
+                    (pb_ID, person_ids.get(keys.get(s.get("speaker"))), s.get("text"), s.get("timecode"))  # type: ignore
+                    for s in segments
+                    if s.get("text")  # db constarint
+                ]
+                connection.executemany(
+                    "INSERT INTO Segment (pb_ID, speaker, text, timecode) VALUES (?, ?, ?, ?)", rows
+                )
+                connection.executemany(
+                    "INSERT INTO Head_Person (pb_ID, name, description) VALUES (?, ?, ?)",
+                    _head_person_rows(pb_ID, record.get("guests", [])),  # type: ignore
+                )
+            pb_IDs.append(pb_ID)  # type: ignore
+            metrics.inc("db_rows_inserted_total", table="Press_Briefing")
+            metrics.inc("db_rows_inserted_total", len(guest_rows), table="is_guest")
+            metrics.inc("db_rows_inserted_total", len(rows), table="Segment")
+    finally:
+        if synchronous is not None:
+            connection.execute(f"PRAGMA synchronous={int(synchronous)}")
+
+    return pb_IDs
+
+
+def delete_press_briefings(connection: sqlite3.Connection, pb_IDs: Iterable[int]):
+    """Delete press briefings with their guests, segments, sentences, wikifications and
+    wikification jobs in one transaction, e.g. before a changed transcript is imported again.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        pb_IDs (Iterable[int]): IDs of the press briefings to delete.
+    """
+    params = [(pb_ID,) for pb_ID in pb_IDs]
+    with connection:
+        for command in [
+            "DELETE FROM Sentence_Wikification WHERE sentence_ID IN (SELECT sentence_ID FROM Sentence WHERE pb_ID=?)",
+            "DELETE FROM Wikification_Job WHERE target='sentence' AND target_ID IN (SELECT sentence_ID FROM Sentence WHERE pb_ID=?)",
+            "DELETE FROM Wikification_Job WHERE target IN ('title', 'intro') AND target_ID=?",
+            "DELETE FROM Sentence_Cluster WHERE sentence_ID IN (SELECT sentence_ID FROM Sentence WHERE pb_ID=?)",
+            "DELETE FROM Sentence WHERE pb_ID=?",
+            "DELETE FROM Segment WHERE pb_ID=?",
+            "DELETE FROM is_guest WHERE pb_ID=?",
+            "DELETE FROM Head_Person WHERE pb_ID=?",
+            "DELETE FROM pb_Wikification_title WHERE pb_ID=?",
+            "DELETE FROM pb_Wikification_intro WHERE pb_ID=?",
+            "DELETE FROM Press_Briefing WHERE pb_ID=?",
+        ]:
+            connection.executemany(command, params)
+
+
+def backfill_head_persons(connection: sqlite3.Connection) -> int:
+    """Read the title page persons of the press briefings imported before the `Head_Person` table
+    existed from their pdfs, so `resolve_speakers` can link them. Only the first page of every pdf
+    is read, briefings whose pdf is missing are skipped. Run by `python -m src resolve`.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+
+    Returns:
+        int: Number of title page persons read.
+    """
+    from src import parse_pdf
+
+    rows = []
+    for pb_ID, pdf_path in connection.execute(
+        """SELECT pb_ID, pdf_path FROM Press_Briefing
+        WHERE pb_ID NOT IN (SELECT pb_ID FROM Head_Person) ORDER BY pb_ID"""
+    ).fetchall():
+        if not pdf_path or not os.path.exists(pdf_path):
+            continue
+        try:
+            head = parse_pdf.read_head(pdf_path)
+        except Exception as e:  # e.g. a damaged pdf, its briefing stays without title page
+            print("ERROR: Could not read pdf:", pdf_path, e)
+            continue
+        rows += _head_person_rows(pb_ID, parse_pdf.parse_head(head)["person"])  # type: ignore
+    with connection:
+        connection.executemany(
+            "INSERT INTO Head_Person (pb_ID, name, description) VALUES (?, ?, ?)", rows
+        )
+    return len(rows)
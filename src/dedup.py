@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""Near-duplicate detection for the sentences. Recurring moderator phrases, repeated questions
+and fragments split differently by the sentence tokenizer make many sentences near identical.
+`cluster_sentences` groups them, so the wikification and the labeling can take one
+representative per cluster:
+
+1. every sentence is normalized (case, whitespace, punctuation) and cut into overlapping
+   `DEDUP_SHINGLE_SIZE` byte shingles,
+2. the MinHash signature of `DEDUP_NUM_PERM` bins is computed with NumPy for a batch of
+   sentences at once by one permutation hashing: every shingle is hashed once and lands in one
+   bin, empty bins of short sentences are filled from their neighbours (`signatures`),
+3. the signatures are cut into `DEDUP_BANDS` bands, sentences with an equal band are candidates
+   (LSH). Candidates with an estimated Jaccard similarity of at least `DEDUP_THRESHOLD` are
+   linked and the connected components become the clusters.
+
+The clusters are stored in the `Sentence_Cluster` table, named after their representative, the
+sentence with the lowest `sentence_ID`. Every sentence has a row, singletons are their own
+cluster.
+
+Examples:
+    report = dedup.cluster_sentences(connection)
+    records = dedup.representatives(connection, labeled_data.JsonlDataset(path))
+    wikify_jobs.enqueue(connection, "sentence", "tagme", representatives=True)
+"""
+
+import re
+import sqlite3
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+
+from config import (
+    DEDUP_BANDS,
+    DEDUP_BATCH_SIZE,
+    DEDUP_NUM_PERM,
+    DEDUP_SHINGLE_SIZE,
+    DEDUP_THRESHOLD,
+)
+from src import metrics
+
+SEED = 42  # of the hash functions, signatures are only comparable with the same seed
+SQL_CHUNK_SIZE = 500  # host parameters per query
+EMPTY = np.iinfo(np.uint32).max  # bin without a shingle
+DENSIFY_OFFSET = 0x9E3779B1  # added per bin a value is borrowed over
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def normalize(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(re.sub(r"[^\w\s]+", " ", text.lower()).split())
+
+
+def _hash_functions(num_perm: int, seed: int = SEED) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) | np.uint64(1)  # odd
+    b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def signatures(
+    texts: list[str],
+    num_perm: int = DEDUP_NUM_PERM,
+    shingle_size: int = DEDUP_SHINGLE_SIZE,
+    seed: int = SEED,
+) -> np.ndarray:
+    """One permutation MinHash signatures of texts. The shingles of all texts are extracted from
+    one byte buffer and hashed once, the minimum per bin is the signature value. Empty bins are
+    densified by rotation, they take the value of the next filled bin.
+
+    Args:
+        texts (list[str]): Texts, e.g. one batch of sentences.
+        num_perm (int, optional): Number of bins. Defaults to DEDUP_NUM_PERM.
+        shingle_size (int, optional): Bytes per shingle, at most 8. Defaults to DEDUP_SHINGLE_SIZE.
+        seed (int, optional): Seed of the hash functions. Defaults to SEED.
+
+    Returns:
+        np.ndarray: Signatures, uint32 array of shape (len(texts), num_perm).
+    """
+    if not texts:
+        return np.empty((0, num_perm), dtype=np.uint32)
+    encoded = [normalize(text).ljust(shingle_size).encode("utf-8") for text in texts]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+
+    # start of every shingle in the buffer, shingles do not cross the end of a text
+    counts = lengths - shingle_size + 1
+    text_starts = np.cumsum(lengths) - lengths
+    shingle_starts = np.cumsum(counts) - counts
+    positions = np.arange(counts.sum()) + np.repeat(text_starts - shingle_starts, counts)
+
+    shingles = np.zeros(len(positions), dtype=np.uint64)
+    for i in range(shingle_size):
+        shingles |= buffer[positions + i] << np.uint64(8 * i)
+    a, b = _hash_functions(2, seed)
+    hashes = (shingles ^ b[0]) * GOLDEN  # spread the bytes over all 64 bits
+    hashes ^= hashes >> np.uint64(29)
+    hashes *= a[1]
+    hashes ^= hashes >> np.uint64(32)
+
+    # one permutation hashing: the high bits pick the bin, the low bits are the value
+    bins = (hashes >> np.uint64(32)) % np.uint64(num_perm)
+    flat = np.repeat(np.arange(len(texts), dtype=np.uint64) * np.uint64(num_perm), counts) + bins
+    result = np.full(len(texts) * num_perm, EMPTY, dtype=np.uint32)
+    np.minimum.at(result, flat.astype(np.int64), hashes.astype(np.uint32))
+    result = result.reshape(len(texts), num_perm)
+
+    # densification: an empty bin takes the value of the next filled bin, shifted by the distance
+    empty = result == EMPTY
+    rows = np.flatnonzero(empty.any(axis=1))
+    bins = np.arange(2 * num_perm)
+    filled = np.where(np.tile(empty[rows], 2), 2 * num_perm, bins)  # wraps around once
+    donors = np.minimum.accumulate(filled[:, ::-1], axis=1)[:, ::-1][:, :num_perm]
+    distance = (donors - bins[:num_perm]).astype(np.uint32)
+    borrowed = np.take_along_axis(result[rows], donors % num_perm, axis=1)
+    result[rows] = borrowed + distance * np.uint32(DENSIFY_OFFSET)
+    return result
+
+
+def candidate_pairs(signature: np.ndarray, bands: int = DEDUP_BANDS) -> np.ndarray:
+    """Pairs of rows with an equal band. Each row of a bucket is paired with the first row of
+    the bucket only, the clusters are the connected components.
+
+    Args:
+        signature (np.ndarray): Signatures, see `signatures`.
+        bands (int, optional): Number of bands, must divide the number of hash functions. Defaults to DEDUP_BANDS.
+
+    Returns:
+        np.ndarray: Unique pairs (i, j) with i < j, int64 array of shape (n, 2).
+    """
+    if len(signature) < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    rows = signature.shape[1] // bands
+    multipliers = _hash_functions(rows, SEED + 1)[0]
+    pairs = []
+    for band in range(bands):
+        keys = (signature[:, band * rows : (band + 1) * rows].astype(np.uint64) * multipliers).sum(
+            axis=1, dtype=np.uint64
+        )
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        is_first = np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))
+        firsts = order[np.flatnonzero(is_first)][np.cumsum(is_first) - 1]
+        pairs.append(np.stack([firsts[~is_first], order[~is_first]], axis=1))
+    return np.unique(np.sort(np.concatenate(pairs), axis=1), axis=0)
+
+
+def connected_components(n: int, pairs: np.ndarray) -> np.ndarray:
+    """Label the connected components of a graph by their lowest node (min-label hooking and
+    pointer jumping).
+
+    Args:
+        n (int): Number of nodes.
+        pairs (np.ndarray): Edges, int array of shape (m, 2).
+
+    Returns:
+        np.ndarray: Lowest node of the component of every node.
+    """
+    labels = np.arange(n)
+    i, j = pairs[:, 0], pairs[:, 1]
+    while True:
+        li, lj = labels[i], labels[j]
+        low = np.minimum(li, lj)
+        hooked = labels.copy()
+        np.minimum.at(hooked, li, low)
+        np.minimum.at(hooked, lj, low)
+        while not np.array_equal(jumped := hooked[hooked], hooked):
+            hooked = jumped
+        if np.array_equal(hooked, labels):
+            return labels
+        labels = hooked
+
+
+def cluster_sentences(
+    connection: sqlite3.Connection,
+    threshold: float = DEDUP_THRESHOLD,
+    bands: int = DEDUP_BANDS,
+    batch_size: int = DEDUP_BATCH_SIZE,
+) -> dict[str, int]:
+    """Cluster all sentences and replace the `Sentence_Cluster` table in one transaction. The
+    representatives stay the same as long as their sentences are not deleted.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        threshold (float, optional): Minimum estimated Jaccard similarity of linked sentences. Defaults to DEDUP_THRESHOLD.
+        bands (int, optional): Number of LSH bands. Defaults to DEDUP_BANDS.
+        batch_size (int, optional): Sentences hashed at once. Defaults to DEDUP_BATCH_SIZE.
+
+    Returns:
+        dict[str, int]: Number of sentences, clusters with more than one sentence and sentences
+            that are not the representative of their cluster.
+    """
+    with metrics.timer("dedup_seconds", step="signatures"):
+        ids: list[int] = []
+        batches = []
+        cur = connection.execute("SELECT sentence_ID, sentence FROM Sentence ORDER BY sentence_ID")
+        while rows := cur.fetchmany(batch_size):
+            ids.extend(row[0] for row in rows)
+            batches.append(signatures([row[1] for row in rows]))
+        signature = np.concatenate(batches) if batches else signatures([])
+
+    with metrics.timer("dedup_seconds", step="lsh"):
+        pairs = candidate_pairs(signature, bands)
+        similarity = (signature[pairs[:, 0]] == signature[pairs[:, 1]]).mean(axis=1)
+        pairs = pairs[similarity >= threshold]
+        labels = connected_components(len(ids), pairs)
+    sentence_ids = np.asarray(ids, dtype=np.int64)
+    cluster_ids = sentence_ids[labels]  # ids are sorted, the lowest node has the lowest id
+
+    with metrics.timer("dedup_seconds", step="store"), connection:
+        connection.execute("DELETE FROM Sentence_Cluster")
+        connection.executemany(
+            "INSERT INTO Sentence_Cluster (sentence_ID, cluster_ID) VALUES (?, ?)",
+            zip(sentence_ids.tolist(), cluster_ids.tolist()),
+        )
+
+    duplicates = int((labels != np.arange(len(ids))).sum())
+    clusters = len(np.unique(labels[labels != np.arange(len(ids))]))
+    metrics.inc("dedup_candidate_pairs_total", len(similarity))
+    metrics.inc("dedup_duplicates_total", duplicates)
+    return {"sentences": len(ids), "clusters": clusters, "duplicates": duplicates}
+
+
+def representatives(
+    connection: sqlite3.Connection,
+    records: Iterable[dict[str, Any]],
+    id_key: str = "sentence_ID",
+) -> Iterator[dict[str, Any]]:
+    """Drop the records of sentences that are not the representative of their cluster, e.g. of
+    a pre labeled slice. Records of unclustered sentences are kept.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        records (Iterable[dict[str, Any]]): Records, e.g. from `labeled_data.JsonlDataset.select`.
+        id_key (str, optional): Key of the sentence id in the records. Defaults to "sentence_ID".
+
+    Yields:
+        Iterator[dict[str, Any]]: Records of representatives.
+    """
+    batch: list[dict[str, Any]] = []
+
+    def _flush() -> Iterator[dict[str, Any]]:
+        ids = [record[id_key] for record in batch]
+        duplicates = {
+            sentence_ID
+            for (sentence_ID,) in connection.execute(
+                f"""SELECT sentence_ID FROM Sentence_Cluster
+                WHERE sentence_ID IN ({', '.join('?' * len(ids))}) AND cluster_ID != sentence_ID""",
+                ids,
+            )
+        }
+        return (record for record in batch if record[id_key] not in duplicates)
+
+    for record in records:
+        batch.append(record)
+        if len(batch) >= SQL_CHUNK_SIZE:
+            yield from _flush()
+            batch = []
+    if batch:
+        yield from _flush()
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+"""Export query results of the dataset to flat files at constant memory. The rows are streamed
+from the SQLite cursor in chunks of `EXPORT_CHUNK_SIZE` instead of loading the full join into a
+DataFrame first.
+
+Besides csv and jsonl, a columnar snapshot can be written that training jobs can memory-map and
+read column by column without touching SQLite:
+
+- with pyarrow installed, an Arrow IPC file (Feather V2) with one record batch per chunk and
+  compressed buffers (`SNAPSHOT_COMPRESSION`),
+- otherwise a directory with `schema.json` and one raw little-endian file per numeric column
+  (`<column>.bin`) and two per text column (`<column>.offsets`, `<column>.data`). Columns with
+  NULLs get a validity mask with one byte per row (`<column>.valid`). These files are
+  uncompressed, so that numpy can memory-map them.
+
+The column types are taken from the storage classes of all values of a column (`typeof`), not
+from the first chunk: columns of only integers give int64, columns with reals (also mixed with
+integers) are widened to float64, and columns with any text or blob, or only NULLs, give text.
+
+Examples:
+    connection = sqlite3.connect(DB_PATH)
+    export.write_csv(connection, "SMC_claim_sentences.csv")
+    export.write_jsonl(connection, "sentences.jsonl", query="sentence_details")
+    export.write_snapshot(connection, SNAPSHOT_PATH)
+
+    columns = export.read_snapshot(SNAPSHOT_PATH, columns=["sentence_ID", "sentence"])
+"""
+
+import csv
+import json
+import os
+import shutil
+import sqlite3
+import sys
+from array import array
+from typing import Any, Iterator, Optional, Union
+
+from config import EXPORT_CHUNK_SIZE, SNAPSHOT_COMPRESSION
+
+# name: query, the names can be used instead of sql everywhere in this module
+QUERIES = {
+    "sentences": """SELECT Sentence.sentence_ID, title, sentence
+        FROM Sentence
+        JOIN Press_Briefing ON Sentence.pb_ID = Press_Briefing.pb_ID""",
+    "metadata": "SELECT pb_ID, title, date FROM Press_Briefing",
+    "sentence_details": """SELECT Sentence.sentence_ID, Sentence.pb_ID, Sentence.segment_ID,
+            Person.name AS speaker, Person.afiliation, Segment.timecode, sentence
+        FROM Sentence
+        JOIN Segment ON Segment.segment_ID = Sentence.segment_ID
+        LEFT JOIN Person ON Person.person_ID = Segment.speaker""",
+    "sentence_clusters": "SELECT sentence_ID, cluster_ID FROM Sentence_Cluster",
+    "representative_sentences": """SELECT Sentence.sentence_ID, title, sentence
+        FROM Sentence
+        JOIN Press_Briefing ON Sentence.pb_ID = Press_Briefing.pb_ID
+        LEFT JOIN Sentence_Cluster ON Sentence_Cluster.sentence_ID = Sentence.sentence_ID
+        WHERE COALESCE(cluster_ID, Sentence.sentence_ID) = Sentence.sentence_ID""",
+}
+ARRAY_CODES = {"int64": "q", "float64": "d"}
+# placeholder of NULL in the fallback format, the validity masks tell them from real values
+MISSING = {"int64": 0, "float64": float("nan"), "text": ""}
+
+
+def iter_chunks(
+    connection: sqlite3.Connection,
+    query: str = "sentences",
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> tuple[list[str], Iterator[list[tuple[Any, ...]]]]:
+    """Run a query and stream its rows in chunks. SQLite steps the statement lazily, so at most
+    one chunk is held in memory.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        query (str, optional): Name of one of `QUERIES` or sql. Defaults to "sentences".
+        chunk_size (int, optional): Number of rows per chunk. Defaults to EXPORT_CHUNK_SIZE.
+
+    Returns:
+        tuple[list[str], Iterator[list[tuple[Any, ...]]]]: Column names and chunks of rows.
+    """
+    cur = connection.execute(QUERIES.get(query, query))
+    columns = [c[0] for c in cur.description]
+
+    def _chunks():
+        while chunk := cur.fetchmany(chunk_size):
+            yield chunk
+
+    return columns, _chunks()
+
+
+def write_csv(
+    connection: sqlite3.Connection,
+    path: str,
+    query: str = "sentences",
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> int:
+    """Stream the result of a query to a csv file with a header row.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        path (str): Path to the csv file.
+        query (str, optional): Name of one of `QUERIES` or sql. Defaults to "sentences".
+        chunk_size (int, optional): Number of rows per chunk. Defaults to EXPORT_CHUNK_SIZE.
+
+    Returns:
+        int: Number of exported rows.
+    """
+    columns, chunks = iter_chunks(connection, query, chunk_size)
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            rows += len(chunk)
+    return rows
+
+
+def write_jsonl(
+    connection: sqlite3.Connection,
+    path: str,
+    query: str = "sentences",
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> int:
+    """Stream the result of a query to a jsonl file with one object per row, like
+    `DataFrame.to_json(orient="records", lines=True)`.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        path (str): Path to the jsonl file.
+        query (str, optional): Name of one of `QUERIES` or sql. Defaults to "sentences".
+        chunk_size (int, optional): Number of rows per chunk. Defaults to EXPORT_CHUNK_SIZE.
+
+    Returns:
+        int: Number of exported rows.
+    """
+    columns, chunks = iter_chunks(connection, query, chunk_size)
+    rows = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.writelines(
+                json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in chunk
+            )
+            rows += len(chunk)
+    return rows
+
+
+def _column_types(
+    connection: sqlite3.Connection, query: str, columns: list[str]
+) -> tuple[list[str], list[bool]]:
+    """Snapshot type and nullability of every column, taken from the storage classes of all
+    values of the query in one extra pass in SQLite."""
+    names = [f"c{i}" for i in range(len(columns))]  # the column names need not be unique
+    storage = connection.execute(
+        f"""WITH q({', '.join(names)}) AS ({QUERIES.get(query, query)})
+        SELECT {', '.join(f"group_concat(DISTINCT typeof({name}))" for name in names)} FROM q"""
+    ).fetchone()
+    types, nullable = [], []
+    for classes in storage:
+        classes = set(classes.split(",")) if classes else set()
+        if classes & {"text", "blob"} or not classes - {"null"}:
+            types.append("text")
+        else:
+            types.append("float64" if "real" in classes else "int64")
+        nullable.append("null" in classes)
+    return types, nullable
+
+
+def _write_arrow(
+    path: str,
+    columns: list[str],
+    types: list[str],
+    chunks: Iterator[list[tuple[Any, ...]]],
+    compression: Optional[str],
+) -> int:
+    import pyarrow as pa  # type: ignore
+
+    arrow_types = {"int64": pa.int64(), "float64": pa.float64(), "text": pa.string()}
+    schema = pa.schema([(name, arrow_types[t]) for name, t in zip(columns, types)])
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    rows = 0
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, schema, options=options) as writer:
+        for chunk in chunks:
+            writer.write_batch(
+                pa.record_batch(
+                    [pa.array(values, field.type) for values, field in zip(zip(*chunk), schema)],
+                    schema=schema,
+                )
+            )
+            rows += len(chunk)
+    return rows
+
+
+def _write_columns(
+    path: str,
+    columns: list[str],
+    types: list[str],
+    nullable: list[bool],
+    chunks: Iterator[list[tuple[Any, ...]]],
+) -> int:
+    files = []
+    for name, t, has_nulls in zip(columns, types, nullable):
+        valid = open(os.path.join(path, name + ".valid"), "wb") if has_nulls else None
+        if t == "text":
+            offsets = open(os.path.join(path, name + ".offsets"), "wb")
+            offsets.write(bytes(8))  # start offset of the first value
+            files.append((offsets, open(os.path.join(path, name + ".data"), "wb"), valid))
+        else:
+            files.append((open(os.path.join(path, name + ".bin"), "wb"), None, valid))
+
+    rows = 0
+    try:
+        for chunk in chunks:
+            for values, t, (f, data, valid) in zip(zip(*chunk), types, files):
+                if valid:
+                    valid.write(bytes(v is not None for v in values))
+                values = [MISSING[t] if v is None else v for v in values]
+                if t == "text":  # end offsets of the utf-8 encoded values
+                    column, end = array("q"), data.tell()
+                    for value in values:
+                        end += data.write(str(value).encode("utf-8"))
+                        column.append(end)
+                else:
+                    column = array(ARRAY_CODES[t], values)
+                if sys.byteorder == "big":
+                    column.byteswap()
+                column.tofile(f)
+            rows += len(chunk)
+    finally:
+        for f, data, valid in files:
+            f.close()
+            if data:
+                data.close()
+            if valid:
+                valid.close()
+
+    schema = {
+        "rows": rows,
+        "columns": [
+            {"name": n, "type": t, "nullable": has_nulls}
+            for n, t, has_nulls in zip(columns, types, nullable)
+        ],
+    }
+    with open(os.path.join(path, "schema.json"), "w", encoding="utf-8") as f:
+        json.dump(schema, f, indent=1)
+    return rows
+
+
+def write_snapshot(
+    connection: sqlite3.Connection,
+    path: str,
+    query: str = "sentences",
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+    compression: Optional[str] = SNAPSHOT_COMPRESSION,
+) -> int:
+    """Stream the result of a query to a columnar snapshot, see the module docstring for the
+    formats. The snapshot is written next to `path` and moved into place when complete, so
+    readers never see a partial snapshot.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        path (str): Path to the snapshot file (pyarrow) or directory (fallback).
+        query (str, optional): Name of one of `QUERIES` or sql. Defaults to "sentences".
+        chunk_size (int, optional): Number of rows per chunk and record batch. Defaults to EXPORT_CHUNK_SIZE.
+        compression (Optional[str], optional): Buffer compression of the arrow file, "zstd", "lz4"
+            or None. Ignored by the fallback format. Defaults to SNAPSHOT_COMPRESSION.
+
+    Returns:
+        int: Number of exported rows.
+    """
+    columns, chunks = iter_chunks(connection, query, chunk_size)
+    types, nullable = _column_types(connection, query, columns)
+    tmp_path = path + ".tmp"
+    try:
+        import pyarrow  # type: ignore  # noqa: F401
+    except ImportError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        rows = _write_columns(tmp_path, columns, types, nullable, chunks)
+    else:
+        rows = _write_arrow(tmp_path, columns, types, chunks, compression)
+
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.isdir(tmp_path) and os.path.exists(path):
+        os.remove(path)
+    os.replace(tmp_path, path)
+    return rows
+
+
+class TextColumn:
+    """Memory-mapped text column of the fallback snapshot format. Values are decoded on access,
+    NULLs are None."""
+
+    def __init__(self, offsets: Any, data: Any, valid: Any = None):
+        self.offsets = offsets
+        self.data = data
+        self.valid = valid
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[Optional[str], list[Optional[str]]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]  # type: ignore
+        if i < 0:
+            i += len(self)
+        if self.valid is not None and not self.valid[i]:
+            return None
+        return bytes(self.data[self.offsets[i] : self.offsets[i + 1]]).decode("utf-8")
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        return (self[i] for i in range(len(self)))  # type: ignore
+
+
+def _memmap(path: str, dtype: str, shape: int) -> Any:
+    import numpy as np  # type: ignore
+
+    if shape == 0:  # numpy can not map empty files
+        return np.zeros(0, dtype)
+    return np.memmap(path, dtype, mode="r", shape=(shape,))
+
+
+def _masked(values: Any, valid: Any) -> Any:
+    import numpy as np  # type: ignore
+
+    return np.ma.masked_array(values, mask=valid == 0)
+
+
+def read_snapshot(path: str, columns: Optional[list[str]] = None) -> dict[str, Any]:
+    """Memory-map the columns of a snapshot. Only the requested columns are read.
+
+    Args:
+        path (str): Path to the snapshot written by `write_snapshot`.
+        columns (Optional[list[str]], optional): Columns to read. Defaults to all columns.
+
+    Returns:
+        dict[str, Any]: Column name -> `pyarrow.ChunkedArray` for arrow snapshots, numpy memmap
+            (masked array for columns with NULLs) or `TextColumn` for the fallback format.
+    """
+    if not os.path.isdir(path):
+        from pyarrow import feather  # type: ignore
+
+        table = feather.read_table(path, columns=columns, memory_map=True)
+        return {name: table.column(name) for name in table.column_names}
+
+    with open(os.path.join(path, "schema.json"), encoding="utf-8") as f:
+        schema = json.load(f)
+    rows = schema["rows"]
+    result = {}
+    for column in schema["columns"]:
+        name, t = column["name"], column["type"]
+        if columns is not None and name not in columns:
+            continue
+        valid = None
+        if column.get("nullable"):
+            valid = _memmap(os.path.join(path, name + ".valid"), "u1", rows)
+        if t == "text":
+            offsets = _memmap(os.path.join(path, name + ".offsets"), "<i8", rows + 1)
+            data_path = os.path.join(path, name + ".data")
+            data = _memmap(data_path, "u1", os.path.getsize(data_path))
+            result[name] = TextColumn(offsets, data, valid)
+        else:
+            values = _memmap(os.path.join(path, name + ".bin"), "<" + t[0] + "8", rows)
+            result[name] = values if valid is None else _masked(values, valid)
+    return result
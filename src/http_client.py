@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+"""Shared HTTP session with per-host politeness. Instead of sleeping a random amount of time
+between requests, every request acquires a slot from a per-host concurrency limit and a token
+from a per-host token bucket. The underlying `requests.Session` is reused, so connections are
+kept alive across requests.
+
+Files are downloaded in chunks to a `.part` file, resumed with HTTP Range requests after an
+interruption, verified against Content-Length and an optional checksum and only then renamed
+into place.
+
+Examples:
+    session = http_client.PoliteSession(host_concurrency=4, rate=2.0)
+    responds = session.get("https://www.sciencemediacenter.de/")
+    result = http_client.download_file(session, pdf_url, "data/SMC_dataset/pdf/transcript.pdf")
+"""
+
+import email.utils
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import NamedTuple, Optional, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src import metrics
+
+DEFAULT_TIMEOUT = 30.0  # seconds
+CHUNK_SIZE = 64 * 1024  # bytes
+RETRY_STATUS = {429, 500, 502, 503, 504}
+MAX_RETRY_AFTER = 300.0  # seconds, longer Retry-After waits are capped
+
+
+class TokenBucket:
+    """Thread safe token bucket. Tokens are refilled continuously with `rate` tokens per second
+    up to `capacity` tokens. Each call to `acquire` blocks until a token is available.
+
+    Args:
+        rate (float): Number of tokens refilled per second.
+        capacity (Optional[float], optional): Maximum burst size. Defaults to max(1, rate).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until `tokens` tokens are available and take them.
+
+        Args:
+            tokens (float, optional): Number of tokens to take. Defaults to 1.0.
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class _Slot:
+    """Slot of the per-host concurrency limit, acquired on creation and released once."""
+
+    def __init__(self, semaphore: threading.BoundedSemaphore):
+        self._semaphore = semaphore
+        self._lock = threading.Lock()
+        self._held = True
+        semaphore.acquire()
+
+    def release(self):
+        with self._lock:
+            if self._held:
+                self._held = False
+                self._semaphore.release()
+
+    def hold(self, responds: requests.Response):
+        """Keep the slot until the streamed body of the response is read to the end or the
+        response is closed, e.g. by leaving its `with` block."""
+        close, iter_content = responds.close, responds.iter_content
+
+        def _close():
+            try:
+                close()
+            finally:
+                self.release()
+
+        def _iter_content(*args, **kwargs):
+            try:
+                yield from iter_content(*args, **kwargs)
+            finally:
+                self.release()
+
+        responds.close = _close  # type: ignore
+        responds.iter_content = _iter_content  # type: ignore
+
+
+class PoliteSession:
+    """Wrapper around a pooled `requests.Session` that limits the number of concurrent requests
+    and the request rate per host.
+
+    Args:
+        host_concurrency (int, optional): Maximum number of requests in flight per host. Defaults to 4.
+        rate (float, optional): Requests per second per host. Defaults to 2.0.
+        burst (Optional[float], optional): Token bucket capacity per host. Defaults to max(1, rate).
+        timeout (float, optional): Default timeout for each request in seconds. Defaults to 30.
+        session (Optional[requests.Session], optional): Session to reuse. Defaults to a new session.
+    """
+
+    def __init__(
+        self,
+        host_concurrency: int = 4,
+        rate: float = 2.0,
+        burst: Optional[float] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        session: Optional[requests.Session] = None,
+    ):
+        self.host_concurrency = host_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.timeout = timeout
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=host_concurrency, pool_maxsize=host_concurrency)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+
+        self._hosts: dict[str, tuple[threading.BoundedSemaphore, TokenBucket]] = {}
+        self._lock = threading.Lock()
+
+    def _limits(self, url: str) -> tuple[threading.BoundedSemaphore, TokenBucket]:
+        """Get or create the concurrency limit and token bucket for the host of an url."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = (
+                    threading.BoundedSemaphore(self.host_concurrency),
+                    TokenBucket(self.rate, self.burst),
+                )
+            return self._hosts[host]
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request once a slot and a token for the host are available. The slot of a
+        streamed request (`stream=True`) is held until its body is read or the response is
+        closed, so close streamed responses, e.g. with a `with` block.
+
+        Args:
+            method (str): HTTP method.
+            url (str): URL to request.
+
+        Returns:
+            requests.Response: Response object.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlsplit(url).netloc
+        semaphore, bucket = self._limits(url)
+        slot = _Slot(semaphore)
+        try:
+            bucket.acquire()
+            with metrics.timer("http_request_seconds", host=host):
+                responds = self.session.request(method, url, **kwargs)
+        except BaseException as e:
+            slot.release()
+            if isinstance(e, requests.RequestException):
+                metrics.inc("http_requests_total", host=host, status=type(e).__name__)
+            raise
+        metrics.inc("http_requests_total", host=host, status=responds.status_code)
+        if kwargs.get("stream"):  # streamed bodies are counted by their reader
+            slot.hold(responds)
+        else:
+            slot.release()
+            metrics.inc("http_downloaded_bytes", len(responds.content), host=host)
+        return responds
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Send a GET request, see `request`."""
+        return self.request("GET", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self) -> "PoliteSession":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DownloadResult(NamedTuple):
+    path: Optional[str]  # None if the server answered 304
+    status: int
+    size: int
+    sha256: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class IncompleteDownload(IOError):
+    """Raised if fewer bytes than announced were received."""
+
+
+def _file_sha256(path: str) -> str:
+    """Hash a file in chunks."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _total_size(responds: requests.Response) -> Optional[int]:
+    """Total size of the file from Content-Range or Content-Length."""
+    content_range = responds.headers.get("Content-Range")
+    if responds.status_code == 206 and content_range:
+        match = re.search(r"/(\d+)$", content_range)
+        return int(match.group(1)) if match else None
+    content_length = responds.headers.get("Content-Length")
+    return int(content_length) if content_length else None
+
+
+def _range_start(responds: requests.Response) -> Optional[int]:
+    """First byte of a partial response from Content-Range."""
+    match = re.match(r"bytes (\d+)-", responds.headers.get("Content-Range", ""))
+    return int(match.group(1)) if match else None
+
+
+def retry_after(responds: Optional[requests.Response]) -> Optional[float]:
+    """Seconds to wait from the Retry-After header, given as seconds or as http date."""
+    value = responds.headers.get("Retry-After", "").strip() if responds is not None else ""
+    if value.isdigit():
+        return min(float(value), MAX_RETRY_AFTER)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return min(max(date.timestamp() - time.time(), 0.0), MAX_RETRY_AFTER)
+
+
+def download_file(
+    session: Union[PoliteSession, requests.Session],
+    url: str,
+    dest: str,
+    headers: Optional[dict[str, str]] = None,
+    expected_sha256: Optional[str] = None,
+    retries: int = 3,
+    backoff: float = 1.0,
+    timeout: float = DEFAULT_TIMEOUT,
+    chunk_size: int = CHUNK_SIZE,
+) -> DownloadResult:
+    """Stream a file to `dest + ".part"` and atomically rename it to `dest` once it is complete.
+    An interrupted download is resumed with a Range request, the validator (ETag or Last-Modified)
+    of the first response is sent as If-Range, so a file that changed in between is downloaded
+    again from the start, as is a part whose partial response does not start at its end.
+    Connection errors, timeouts, truncated bodies and 429/5xx responses are retried with
+    exponential backoff or after the time the server asks for with Retry-After.
+
+    Args:
+        session (Union[PoliteSession, requests.Session]): Session to send the requests with.
+        url (str): URL of the file.
+        dest (str): Path to save the file to.
+        headers (Optional[dict[str, str]], optional): Additional headers, e.g. for conditional requests. Defaults to None.
+        expected_sha256 (Optional[str], optional): Checksum the file has to match. Defaults to None.
+        retries (int, optional): Number of retries. Defaults to 3.
+        backoff (float, optional): Initial backoff in seconds. Defaults to 1.0.
+        timeout (float, optional): Connect and read timeout in seconds. Defaults to 30.
+        chunk_size (int, optional): Size of the chunks written to disk. Defaults to 64 KiB.
+
+    Raises:
+        IncompleteDownload: If the file is still incomplete after all retries.
+        ValueError: If the checksum does not match.
+        requests.HTTPError: On a non retryable HTTP error.
+
+    Returns:
+        DownloadResult: Path, status, size, checksum and validators of the file.
+    """
+    host = urlsplit(url).netloc
+    part = dest + ".part"
+    validator_path = part + ".validator"
+    validator = None
+    if os.path.exists(part) and os.path.exists(validator_path):
+        with open(validator_path) as f:
+            validator = f.read() or None
+    elif os.path.exists(part):  # a part without validator can not be resumed safely
+        os.remove(part)
+
+    error: Exception = IncompleteDownload(url)
+    delay: Optional[float] = None  # overrides the backoff before the next attempt
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1) if delay is None else delay)
+        delay = None
+
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        request_headers = {"Accept-Encoding": "identity", **(headers or {})}
+        if offset and validator:
+            request_headers.pop("If-None-Match", None)  # the part already belongs to a changed file
+            request_headers.pop("If-Modified-Since", None)
+            request_headers["Range"] = f"bytes={offset}-"
+            request_headers["If-Range"] = validator
+
+        try:
+            with session.get(url, headers=request_headers, stream=True, timeout=timeout) as responds:
+                if responds.status_code == 304:
+                    return DownloadResult(None, 304, 0, None, None, None)
+                if responds.status_code == 416:  # range not satisfiable, start over
+                    os.remove(part)
+                    raise IncompleteDownload(url)
+                if responds.status_code in RETRY_STATUS:
+                    raise requests.HTTPError(f"{responds.status_code} for url: {url}", response=responds)
+                responds.raise_for_status()
+                if responds.status_code == 206 and _range_start(responds) != offset:
+                    os.remove(part)  # the body does not continue the part, download it again
+                    os.remove(validator_path)
+                    validator = None
+                    delay = 0.0
+                    raise IncompleteDownload(f"{url}: partial response does not start at {offset}")
+
+                etag = responds.headers.get("ETag")
+                last_modified = responds.headers.get("Last-Modified")
+                os.makedirs(os.path.dirname(part) or ".", exist_ok=True)
+                if responds.status_code != 206:  # full body, restart the part
+                    offset = 0
+                    validator = etag or last_modified
+                    with open(validator_path, "w") as f:
+                        f.write(validator or "")
+                total = _total_size(responds)
+
+                with open(part, "ab" if offset else "wb") as f:
+                    for chunk in responds.iter_content(chunk_size):
+                        f.write(chunk)
+                        metrics.inc("http_downloaded_bytes", len(chunk), host=host)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            error = e
+            continue
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code in RETRY_STATUS:
+                error = e
+                delay = retry_after(e.response)
+                continue
+            raise
+        except IncompleteDownload as e:
+            error = e
+            continue
+
+        size = os.path.getsize(part)
+        if total is not None and size != total:
+            if size > total:  # corrupt part, start over
+                os.remove(part)
+            error = IncompleteDownload(f"{url}: received {size} of {total} bytes")
+            continue
+
+        sha256 = _file_sha256(part)
+        if expected_sha256 and sha256 != expected_sha256:
+            os.remove(part)
+            raise ValueError(f"{url}: checksum mismatch")
+
+        os.replace(part, dest)
+        if os.path.exists(validator_path):
+            os.remove(validator_path)
+        return DownloadResult(dest, responds.status_code, size, sha256, etag, last_modified)
+
+    raise error
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""Indexed reader for the labeled and pre labeled jsonl slices. Instead of parsing a whole slice
+with `pd.read_json(..., lines=True)` and filtering in memory, the reader keeps a sidecar index
+for every file (`<file>-<path hash>.idx`, a SQLite database) with the byte offset of each line,
+its `sentence_ID`, `prob` and labels. Probability slices, label filters and lookups by
+`sentence_ID` are answered from the index, only the matching lines are read from the
+memory-mapped file and parsed. The index is built on first use and rebuilt when the file
+changes. The indexes are kept in `LABELED_INDEX_DIR`, a cache outside the dataset
+(`~/.cache/smc_dataset/index`, set `SMC_INDEX_DIR` to move it).
+
+Examples:
+    slice_99 = labeled_data.JsonlDataset("data/SMC_dataset/pre_labeled/SMC_claim_sentences_claims_99.jsonl")
+    records = slice_99.select(min_prob=0.99)  # like data[data["prob"] >= 0.99]
+    records = slice_99.select(min_prob=0.2, max_prob=0.8)  # like data["prob"].between(0.2, 0.8)
+    record = slice_99.get(1251)
+
+    labeled = labeled_data.JsonlDataset("data/SMC_dataset/labeled/SMC_claim_sentences_claims_99_labeled.jsonl")
+    claims = labeled.select(labels=["complete_claim", "No_claim"])
+    claims = labeled_data.join_sentences(connection, claims)  # adds pb_ID, segment_ID, ...
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+from typing import Any, Iterable, Iterator, Optional
+
+from config import LABELED_INDEX_DIR
+
+SQL_CHUNK_SIZE = 500  # host parameters per query
+INDEX_VERSION = 1  # bump to rebuild existing indexes
+
+
+def default_index_path(path: str) -> str:
+    """Path of the index of a jsonl file in `LABELED_INDEX_DIR`, the hash of the absolute path
+    tells apart slices with the same file name. The directory is created if missing."""
+    os.makedirs(LABELED_INDEX_DIR, exist_ok=True)
+    digest = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(LABELED_INDEX_DIR, f"{os.path.basename(path)}-{digest}.idx")
+
+
+class JsonlDataset:
+    """Jsonl slice with a sidecar index for filtered and random access.
+
+    Args:
+        path (str): Path to the jsonl file.
+        index_path (Optional[str], optional): Path to the index database. Defaults to a file in LABELED_INDEX_DIR.
+        id_key (str, optional): Key of the record id. Defaults to "sentence_ID".
+    """
+
+    def __init__(self, path: str, index_path: Optional[str] = None, id_key: str = "sentence_ID"):
+        self.path = path
+        self.index_path = index_path or default_index_path(path)
+        self.id_key = id_key
+        self.connection = sqlite3.connect(self.index_path)
+        if self._stale():
+            self.build_index()
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def _fingerprint(self) -> str:
+        stat = os.stat(self.path)
+        return f"{INDEX_VERSION}:{self.id_key}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def _stale(self) -> bool:
+        try:
+            (fingerprint,) = self.connection.execute("SELECT fingerprint FROM Meta").fetchone()
+        except (sqlite3.OperationalError, TypeError):  # no index or an empty one
+            return True
+        return fingerprint != self._fingerprint()
+
+    def build_index(self):
+        """Scan the file once and (re)build the index. Every line is parsed here, later reads
+        only parse the lines they return."""
+        fingerprint = self._fingerprint()
+        with self.connection:
+            self.connection.executescript(
+                """DROP TABLE IF EXISTS Meta;
+                DROP TABLE IF EXISTS Line;
+                DROP TABLE IF EXISTS Label;
+                CREATE TABLE Meta (fingerprint text NOT NULL);
+                CREATE TABLE Line
+                (
+                    line INTEGER PRIMARY KEY,
+                    offset int NOT NULL,
+                    length int NOT NULL,
+                    record_ID int,
+                    prob real
+                );
+                CREATE TABLE Label (line int NOT NULL, label text NOT NULL);"""
+            )
+            lines, labels = [], []
+            with open(self.path, "rb") as f:
+                offset = 0
+                for raw in f:
+                    if raw.strip():
+                        record = json.loads(raw)
+                        line = len(lines)
+                        lines.append(
+                            (line, offset, len(raw), record.get(self.id_key), record.get("prob"))
+                        )
+                        label = record.get("label")
+                        for value in label if isinstance(label, list) else [label]:
+                            if value is not None:
+                                labels.append((line, value))
+                    offset += len(raw)
+            self.connection.executemany("INSERT INTO Line VALUES (?, ?, ?, ?, ?)", lines)
+            self.connection.executemany("INSERT INTO Label VALUES (?, ?)", labels)
+            self.connection.executescript(
+                """CREATE INDEX idx_line_prob ON Line (prob);
+                CREATE INDEX idx_line_record ON Line (record_ID);
+                CREATE INDEX idx_label_label ON Label (label, line);"""
+            )
+            self.connection.execute("INSERT INTO Meta VALUES (?)", (fingerprint,))
+
+    def _read(self, offset: int, length: int) -> dict[str, Any]:
+        return json.loads(self._mmap[offset : offset + length])  # type: ignore
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM Line").fetchone()[0]
+
+    def __getitem__(self, line: int) -> dict[str, Any]:
+        """Record of the nth non empty line."""
+        row = self.connection.execute(
+            "SELECT offset, length FROM Line WHERE line=?",
+            (line if line >= 0 else len(self) + line,),
+        ).fetchone()
+        if row is None:
+            raise IndexError(line)
+        return self._read(*row)
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        for offset, length in self.connection.execute(
+            "SELECT offset, length FROM Line ORDER BY line"
+        ):
+            yield self._read(offset, length)
+
+    def get(self, record_id: int) -> Optional[dict[str, Any]]:
+        """Record by its id (`sentence_ID`).
+
+        Args:
+            record_id (int): Id of the record.
+
+        Returns:
+            Optional[dict[str, Any]]: First record with the id or None.
+        """
+        row = self.connection.execute(
+            "SELECT offset, length FROM Line WHERE record_ID=? ORDER BY line LIMIT 1", (record_id,)
+        ).fetchone()
+        return self._read(*row) if row else None
+
+    def _where(
+        self,
+        min_prob: Optional[float] = None,
+        max_prob: Optional[float] = None,
+        labels: Optional[Iterable[str]] = None,
+    ) -> tuple[str, list[Any]]:
+        where, params = ["1=1"], []
+        if min_prob is not None:
+            where.append("prob >= ?")
+            params.append(min_prob)
+        if max_prob is not None:
+            where.append("prob <= ?")
+            params.append(max_prob)
+        if labels is not None:
+            labels = list(labels)
+            where.append(
+                f"line IN (SELECT line FROM Label WHERE label IN ({', '.join('?' * len(labels))}))"
+            )
+            params.extend(labels)
+        return " AND ".join(where), params
+
+    def select(
+        self,
+        min_prob: Optional[float] = None,
+        max_prob: Optional[float] = None,
+        labels: Optional[Iterable[str]] = None,
+        order_by_prob: bool = False,
+    ) -> Iterator[dict[str, Any]]:
+        """Stream the records in a probability range and/or with one of the labels. The bounds are
+        inclusive, like `Series.between`.
+
+        Args:
+            min_prob (Optional[float], optional): Minimum probability. Defaults to None.
+            max_prob (Optional[float], optional): Maximum probability. Defaults to None.
+            labels (Optional[Iterable[str]], optional): Only records with any of these labels.
+                Defaults to None.
+            order_by_prob (bool, optional): Yield by ascending probability instead of file order.
+                Defaults to False.
+
+        Yields:
+            Iterator[dict[str, Any]]: Matching records.
+        """
+        where, params = self._where(min_prob, max_prob, labels)
+        order = "prob, line" if order_by_prob else "line"
+        for offset, length in self.connection.execute(
+            f"SELECT offset, length FROM Line WHERE {where} ORDER BY {order}", params
+        ).fetchall():
+            yield self._read(offset, length)
+
+    def ids(
+        self,
+        min_prob: Optional[float] = None,
+        max_prob: Optional[float] = None,
+        labels: Optional[Iterable[str]] = None,
+    ) -> list[int]:
+        """Ids of the records `select` would yield, answered from the index alone."""
+        where, params = self._where(min_prob, max_prob, labels)
+        return [
+            record_id
+            for (record_id,) in self.connection.execute(
+                f"SELECT record_ID FROM Line WHERE {where} ORDER BY line", params
+            )
+        ]
+
+    def count(
+        self,
+        min_prob: Optional[float] = None,
+        max_prob: Optional[float] = None,
+        labels: Optional[Iterable[str]] = None,
+    ) -> int:
+        """Number of records `select` would yield, answered from the index alone."""
+        where, params = self._where(min_prob, max_prob, labels)
+        return self.connection.execute(
+            f"SELECT COUNT(*) FROM Line WHERE {where}", params
+        ).fetchone()[0]
+
+    def label_counts(self) -> dict[str, int]:
+        """Number of records per label, like `explode("label").groupby("label").count()`."""
+        return dict(
+            self.connection.execute(
+                "SELECT label, COUNT(*) FROM Label GROUP BY label ORDER BY label"
+            )
+        )
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+        self.connection.close()
+
+    def __enter__(self) -> "JsonlDataset":
+        return self
+
+    def __exit__(self, *exc: Any):
+        self.close()
+
+
+def join_sentences(
+    connection: sqlite3.Connection,
+    records: Iterable[dict[str, Any]],
+    id_key: str = "sentence_ID",
+) -> Iterator[dict[str, Any]]:
+    """Add the columns of the `Sentence` table to records, looked up by id in batches. Keys the
+    record already has are kept.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        records (Iterable[dict[str, Any]]): Records, e.g. from `JsonlDataset.select`.
+        id_key (str, optional): Key of the sentence id in the records. Defaults to "sentence_ID".
+
+    Yields:
+        Iterator[dict[str, Any]]: Records with pb_ID, segment_ID and sentence.
+    """
+    batch: list[dict[str, Any]] = []
+
+    def _flush() -> list[dict[str, Any]]:
+        ids = [record[id_key] for record in batch]
+        rows = {
+            row[0]: row
+            for row in connection.execute(
+                f"""SELECT sentence_ID, pb_ID, segment_ID, sentence FROM Sentence
+                WHERE sentence_ID IN ({', '.join('?' * len(ids))})""",
+                ids,
+            )
+        }
+        for record in batch:
+            row = rows.get(record[id_key])
+            if row:
+                for key, value in zip(("pb_ID", "segment_ID", "sentence"), row[1:]):
+                    record.setdefault(key, value)
+        return batch
+
+    for record in records:
+        batch.append(record)
+        if len(batch) >= SQL_CHUNK_SIZE:
+            yield from _flush()
+            batch = []
+    if batch:
+        yield from _flush()
@@ -8,47 +8,73 @@ import os
 import random
 import re
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from importlib.util import find_spec
+from typing import Optional, Union
 
 import requests
-from bs4 import BeautifulSoup  # type: ignore
+from bs4 import BeautifulSoup, SoupStrainer  # type: ignore
 
-from config import DEBUG, BASE_URL
+from config import BASE_URL, CRAWL_HOST_CONCURRENCY, CRAWL_MAX_WORKERS, CRAWL_RATE, DEBUG
+from src.http_client import PoliteSession, download_file
 
 PATTERN = re.compile(r"Transkript")  # search pattern for the <p> containing the url
+HTML_PARSER = "lxml" if find_spec("lxml") else "html.parser"  # prefer the faster C parser
+ARTICLE_TAGS = ["main", "article"]  # container of the briefing, without navigation and footer
+ARTICLE_STRAINER = SoupStrainer(ARTICLE_TAGS)
+CONTENT_TAGS = ["p", "h1", "time"]
+CONTENT_STRAINER = SoupStrainer(CONTENT_TAGS)  # fallback for sites without article container
+OVERVIEW_PATH = "/alle-angebote/press-briefing/"
+LISTING_PATH = (
+    OVERVIEW_PATH
+    + "?tx_news_pi1%5B%40widget_0%5D%5BcurrentPage%5D={}&cHash=1af09de0bd1dee82e5c45c74c125b7cd#tab_c235"
+)
 
 
-def extrect_all_pressbriefing_links() -> list[str]:
-    """Retrieve all links to pressbriefing sites from the SMC site.
+def _extrect_max_pages(html: bytes) -> int:
+    """Extract the maximum number of pressbriefing pages from html.
+
+    Args:
+        html (bytes): HTML of the pressbriefing overview page.
 
     Returns:
-        List[str]: List of unique links.
+        int: Maximum number of pressbriefing pages
     """
+    bs = BeautifulSoup(html, "html.parser")
+    num_pages_str = bs.find(class_="last page-item").text
+    num_pages = int(re.findall(r"\d+", num_pages_str)[0])
+    return num_pages
 
-    def _extrect_max_pages() -> int:
-        """Extract the maximum number of pressbriefing pages from html.
 
-        Returns:
-            int: Maximum number of pressbriefing pages
-        """
-        responds = requests.get("https://www.sciencemediacenter.de/alle-angebote/press-briefing/")
-        bs = BeautifulSoup(responds.content, "html.parser")
-        num_pages_str = bs.find(class_="last page-item").text
-        num_pages = int(re.findall(r"\d+", num_pages_str)[0])
-        return num_pages
+def _extrect_listing_links(html: bytes, base_url: str = BASE_URL) -> list[str]:
+    """Extract the links to the pressbriefing sites from one overview page.
+
+    Args:
+        html (bytes): HTML of the overview page.
+        base_url (str, optional): Base URL the relative links are joined with. Defaults to BASE_URL.
+
+    Returns:
+        list[str]: Links on the page.
+    """
+    bs = BeautifulSoup(html, "html.parser")
+    return [base_url + link["href"] for link in bs.find_all(class_="m-news-list__link")]
+
+
+def extrect_all_pressbriefing_links() -> list[str]:
+    """Retrieve all links to pressbriefing sites from the SMC site.
 
-    page = 1
-    url = "https://www.sciencemediacenter.de/alle-angebote/press-briefing/?tx_news_pi1%5B%40widget_0%5D%5BcurrentPage%5D={}&cHash=1af09de0bd1dee82e5c45c74c125b7cd#tab_c235"
+    Returns:
+        List[str]: List of unique links.
+    """
     links: list[str] = []
 
-    responds = requests.get(url)
-    while page <= _extrect_max_pages():
-        page += 1
-        responds = requests.get(url.format(page))
+    responds = requests.get(BASE_URL + OVERVIEW_PATH)
+    max_pages = _extrect_max_pages(responds.content)  # only fetched once
+
+    for page in range(1, max_pages + 1):
+        responds = requests.get(BASE_URL + LISTING_PATH.format(page))
         time.sleep(random.randint(1, 7))  # random sleep
-        bs = BeautifulSoup(responds.content, "html.parser")
-        for link in bs.find_all(class_="m-news-list__link"):
-            pdf_url = BASE_URL + link["href"]
-            links.append(pdf_url)
+        links.extend(_extrect_listing_links(responds.content))
         if DEBUG:
             print(f"On page {str(page)} right now.")
             print(str(len(links)), "collected.")
@@ -56,6 +82,86 @@ def extrect_all_pressbriefing_links() -> list[str]:
     return list(set(links))
 
 
+def crawl_pressbriefing_links(
+    session: PoliteSession, base_url: str = BASE_URL, max_workers: int = CRAWL_MAX_WORKERS
+) -> list[str]:
+    """Concurrently retrieve all links to pressbriefing sites. The number of overview pages
+    is fetched once, then all overview pages are requested through the given session.
+
+    Args:
+        session (PoliteSession): Session that enforces the per host limits.
+        base_url (str, optional): Base URL of the SMC site. Defaults to BASE_URL.
+        max_workers (int, optional): Number of worker threads. Defaults to CRAWL_MAX_WORKERS.
+
+    Returns:
+        list[str]: List of unique links in the order they appear on the overview pages.
+    """
+    responds = session.get(base_url + OVERVIEW_PATH)
+    responds.raise_for_status()
+    max_pages = _extrect_max_pages(responds.content)
+
+    def _fetch(page: int) -> list[str]:
+        responds = session.get(base_url + LISTING_PATH.format(page))
+        responds.raise_for_status()
+        return _extrect_listing_links(responds.content, base_url)
+
+    links: list[str] = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for page, page_links in enumerate(executor.map(_fetch, range(1, max_pages + 1)), start=1):
+            links.extend(page_links)
+            if DEBUG:
+                print(f"Page {str(page)} of {str(max_pages)} done,", str(len(links)), "collected.")
+
+    return list(dict.fromkeys(links))
+
+
+def crawl_pressbriefings(
+    base_url: str = BASE_URL,
+    max_workers: int = CRAWL_MAX_WORKERS,
+    host_concurrency: int = CRAWL_HOST_CONCURRENCY,
+    rate: float = CRAWL_RATE,
+    session: Optional[PoliteSession] = None,
+) -> dict[str, bytes]:
+    """Crawl all pressbriefing sites concurrently. Overview pages and pressbriefing sites are
+    fetched over one reused HTTP session. Politeness is enforced by a per host concurrency limit
+    and a token bucket rate instead of random sleeps.
+
+    Args:
+        base_url (str, optional): Base URL of the SMC site. Defaults to BASE_URL.
+        max_workers (int, optional): Number of worker threads. Defaults to CRAWL_MAX_WORKERS.
+        host_concurrency (int, optional): Maximum requests in flight per host. Defaults to CRAWL_HOST_CONCURRENCY.
+        rate (float, optional): Requests per second per host. Defaults to CRAWL_RATE.
+        session (Optional[PoliteSession], optional): Session to reuse. Defaults to a new session.
+
+    Returns:
+        dict[str, bytes]: HTML of each pressbriefing site by its URL. Sites that could not be loaded are left out.
+    """
+    own_session = session is None
+    if session is None:
+        session = PoliteSession(host_concurrency=host_concurrency, rate=rate)
+
+    def _fetch(url: str) -> Optional[bytes]:
+        try:
+            responds = session.get(url)  # type: ignore
+            responds.raise_for_status()
+            return responds.content
+        except requests.RequestException as e:
+            print("ERROR: Could not load pressbriefing:", url, e)
+            return None
+
+    try:
+        links = crawl_pressbriefing_links(session, base_url, max_workers)
+        pages: dict[str, bytes] = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for url, html in zip(links, executor.map(_fetch, links)):
+                if html is not None:
+                    pages[url] = html
+    finally:
+        if own_session:
+            session.close()
+    return pages
+
+
 def extrect_introduction(bs: BeautifulSoup) -> str:
     """Extract the introduction text from the HTML site.
 
@@ -93,6 +199,67 @@ def extrect_pdf_url(bs: BeautifulSoup) -> str:
     return pdf_url
 
 
+def extrect_pressbriefing(html: Union[str, bytes]) -> dict[str, Optional[str]]:
+    """Extract all information from a pressbriefing site in a single pass. Only the article
+    container (the first `<main>` or `<article>`) is parsed, with the faster lxml backend if
+    installed, and its content elements (`<p>`, `<h1>` and `<time>`) are walked once. Sites
+    without container fall back to the content elements of the whole page.
+
+    Args:
+        html (Union[str, bytes]): HTML of the pressbriefing site.
+
+    Returns:
+        dict[str, Optional[str]]: Dictionary with the keys `introduction`, `pdf_url`, `title` and `date`.
+            Unlike `extrect_introduction`, the introduction has no paragraphs outside the article.
+    """
+    bs = BeautifulSoup(html, HTML_PARSER, parse_only=ARTICLE_STRAINER)
+    article = bs.find(ARTICLE_TAGS)
+    if article is None:
+        article = BeautifulSoup(html, HTML_PARSER, parse_only=CONTENT_STRAINER)
+    paragraphs: list[str] = []
+    pdf_url = str()
+    title = None
+    date = None
+
+    for element in article.find_all(CONTENT_TAGS):
+        if element.name == "p":
+            text = element.text
+            paragraphs.append(text)
+            if PATTERN.search(text):
+                a = element.find("a")  # try to get an <a> from the <p>
+                if a and a.get("href"):
+                    pdf_url = a["href"]
+        elif element.name == "h1" and title is None:
+            title = element.get_text(" ", strip=True) or None
+        elif element.name == "time" and date is None:
+            date = element.get("datetime") or element.get_text(strip=True) or None
+
+    return {
+        "introduction": "".join(paragraph + "\n" for paragraph in paragraphs),
+        "pdf_url": pdf_url,
+        "title": title,
+        "date": date,
+    }
+
+
+def extrect_pressbriefings(
+    pages: list[Union[str, bytes]], max_workers: Optional[int] = None
+) -> list[dict[str, Optional[str]]]:
+    """Extract many pressbriefing sites in a process pool, see `extrect_pressbriefing`.
+
+    Args:
+        pages (list[Union[str, bytes]]): HTML of the pressbriefing sites.
+        max_workers (Optional[int], optional): Number of worker processes. Defaults to the number of CPUs.
+
+    Returns:
+        list[dict[str, Optional[str]]]: Extracted information in the order of the pages.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    chunksize = max(1, len(pages) // (4 * max_workers))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(extrect_pressbriefing, pages, chunksize=chunksize))
+
+
 def extrect_all_pdf_urls(press_briefing_links: list[str]) -> list[str]:
     """DEPRECATED: Get the pdf URLs from the PressBriefing pages.
 
@@ -124,25 +291,60 @@ def extrect_all_pdf_urls(press_briefing_links: list[str]) -> list[str]:
     return results
 
 
-def load_pdf_from_url(pdf_url: str, save_dir: str) -> str:
+def load_pdf_from_url(pdf_url: str, save_dir: str, session: Optional[requests.Session] = None) -> str:
     """Get a pdf file from a url and save it to a given directory. Since some urls start
-    with the domane and others are just the relative path, this is checked as well.
+    with the domane and others are just the relative path, this is checked as well. The pdf
+    is streamed to disk and only renamed into place once it is complete.
 
     Args:
         pdf_url (str): URL to the pdf on the website.
         save_dir (str): directory to save the pdfs to.
+        session (Optional[requests.Session], optional): Session to reuse. Defaults to a new session.
 
     Returns:
         str: Path to saved file.
     """
     filename: str = pdf_url.split("/")[-1:][0]  # get the name from the url of the pdf file
 
-    base_url = "https://www.sciencemediacenter.de"
     if not pdf_url.startswith("http"):
-        pdf_url = base_url + pdf_url
+        pdf_url = BASE_URL + pdf_url
+
+    if session is None:
+        with requests.Session() as session:
+            result = download_file(session, pdf_url, os.path.join(save_dir, filename))
+    else:
+        result = download_file(session, pdf_url, os.path.join(save_dir, filename))
+    return result.path  # type: ignore
+
+
+def load_pdfs_from_urls(
+    pdf_urls: list[str],
+    save_dir: str,
+    max_workers: int = CRAWL_MAX_WORKERS,
+    host_concurrency: int = CRAWL_HOST_CONCURRENCY,
+    rate: float = CRAWL_RATE,
+) -> list[Optional[str]]:
+    """Download many pdfs in parallel. Every download is streamed in fixed size chunks, so the
+    memory use is bounded by the number of workers.
+
+    Args:
+        pdf_urls (list[str]): URLs to the pdfs on the website.
+        save_dir (str): directory to save the pdfs to.
+        max_workers (int, optional): Number of worker threads. Defaults to CRAWL_MAX_WORKERS.
+        host_concurrency (int, optional): Maximum requests in flight per host. Defaults to CRAWL_HOST_CONCURRENCY.
+        rate (float, optional): Requests per second per host. Defaults to CRAWL_RATE.
+
+    Returns:
+        list[Optional[str]]: Path to each saved file in the order of the urls, None if the download failed.
+    """
 
-    responds = requests.get(pdf_url)  # request th pdf
+    def _load(pdf_url: str) -> Optional[str]:
+        try:
+            return load_pdf_from_url(pdf_url, save_dir, session)  # type: ignore
+        except (requests.RequestException, IOError, ValueError) as e:
+            print("ERROR: Could not load pdf:", pdf_url, e)
+            return None
 
-    with open(os.path.join(save_dir, filename), "wb") as f:
-        f.write(responds.content)
-        return os.path.join(save_dir, filename)
+    with PoliteSession(host_concurrency=host_concurrency, rate=rate) as session:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_load, pdf_urls))
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Read and write the metadata table (`metadata.csv`) of the press briefings, one row per
+transcript with its introduction, pdf path and urls. Used by the command line interface and the
+build.
+
+Examples:
+    rows = metadata.read_metadata()
+    metadata.write_metadata(sync.sync_pressbriefings())
+"""
+
+import csv
+import os
+from typing import Any, Iterable
+
+from config import EXCLUDED_PDFS, METADATA_PATH
+
+METADATA_FIELDS = ["introduction", "pdf_path", "pdf_url", "url"]
+
+
+def read_metadata(
+    path: str = METADATA_PATH, exclude: Iterable[str] = EXCLUDED_PDFS
+) -> list[dict[str, str]]:
+    """Read the metadata table. Like `pd.read_csv(...).dropna()` rows with an empty field are
+    dropped, as well as the rows of excluded pdfs.
+
+    Args:
+        path (str, optional): Path to the metadata table. Defaults to METADATA_PATH.
+        exclude (Iterable[str], optional): File names of pdfs to drop. Defaults to EXCLUDED_PDFS.
+
+    Returns:
+        list[dict[str, str]]: Metadata rows.
+    """
+    exclude = set(exclude)
+    with open(path, newline="", encoding="utf-8") as f:
+        return [
+            row
+            for row in csv.DictReader(f)
+            if all(row.get(field) for field in METADATA_FIELDS)
+            and os.path.basename(row["pdf_path"]) not in exclude
+        ]
+
+
+def write_metadata(rows: Iterable[dict[str, Any]], path: str = METADATA_PATH):
+    """Write the metadata table.
+
+    Args:
+        rows (Iterable[dict[str, Any]]): Metadata rows, additional keys are ignored.
+        path (str, optional): Path to the metadata table. Defaults to METADATA_PATH.
+    """
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, METADATA_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
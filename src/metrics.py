@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""Metrics and profiling hooks for the pipeline stages. The modules record counters (pages
+parsed, bytes downloaded, api calls, cache hits, rows inserted), timers and histograms (per file
+and per request latency) in a process wide registry. A snapshot of the registry can be written
+as json or in the Prometheus text format.
+
+Worker processes record into their own registry, `collect` captures the metrics of a task so
+the parent can `merge` them, see `parse_pdf.read_pdfs`.
+
+Profiling is opt-in: after `enable_profiling`, every `profile` block runs under cProfile (and
+tracemalloc with `memory=True`) and the profiles of the slowest `top_n` inputs per block name are
+kept in the profile directory, e.g. `0001234ms-read_pdf-Transkript_xyz.pdf.prof`. Open them with
+`python -m pstats` or snakeviz.
+
+Examples:
+    metrics.inc("pdf_pages_total")
+    with metrics.timer("pdf_read_seconds"):
+        ...
+    print(metrics.to_prometheus())
+
+    metrics.enable_profiling("profiles", top_n=5)
+    with metrics.profile("read_pdf", path):
+        ...
+"""
+
+import bisect
+import contextlib
+import cProfile
+import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+from typing import Any, Iterator, Optional
+
+# upper bounds of the histogram buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+PROFILE_DIR_VARIABLE = "METRICS_PROFILE_DIR"  # inherited by worker processes
+PROFILE_TOP_VARIABLE = "METRICS_PROFILE_TOP"
+PROFILE_MEMORY_VARIABLE = "METRICS_PROFILE_MEMORY"
+
+Labels = tuple[tuple[str, str], ...]
+_profile_lock = threading.Lock()
+_profiling_pid: Optional[int] = None  # one profiler per process, nested blocks are not profiled
+
+
+def _labels(labels: dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Registry:
+    """Thread safe store of counters and histograms, keyed by name and labels."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.histograms: dict[tuple[str, Labels], list[float]] = {}  # bucket counts, sum, count
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: Any):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            histogram[bisect.bisect_left(self.buckets, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        """Counters and histograms as json serializable dictionary, see `merge`."""
+        with self._lock:
+            return {
+                "buckets": list(self.buckets),
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "histograms": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "buckets": histogram[:-2],
+                        "sum": histogram[-2],
+                        "count": histogram[-1],
+                    }
+                    for (name, labels), histogram in sorted(self.histograms.items())
+                ],
+            }
+
+    def merge(self, snapshot: dict[str, Any]):
+        """Add the metrics of a snapshot, e.g. recorded in a worker process."""
+        with self._lock:
+            for counter in snapshot["counters"]:
+                key = (counter["name"], _labels(counter["labels"]))
+                self.counters[key] = self.counters.get(key, 0) + counter["value"]
+            for entry in snapshot["histograms"]:
+                key = (entry["name"], _labels(entry["labels"]))
+                histogram = self.histograms.setdefault(
+                    key, [0] * (len(self.buckets) + 1) + [0.0, 0]
+                )
+                for i, count in enumerate(entry["buckets"]):
+                    histogram[i] += count
+                histogram[-2] += entry["sum"]
+                histogram[-1] += entry["count"]
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+REGISTRY = Registry()
+
+
+def inc(name: str, value: float = 1, **labels: Any):
+    """Increase a counter of the process wide registry.
+
+    Args:
+        name (str): Metric name, by convention ending in `_total` or the unit.
+        value (float, optional): Increment. Defaults to 1.
+        **labels: Label values, e.g. `service="tagme"`.
+    """
+    REGISTRY.inc(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels: Any):
+    """Record a value, e.g. a latency in seconds, in a histogram of the process wide registry.
+
+    Args:
+        name (str): Metric name, by convention ending in the unit.
+        value (float): Observed value.
+        **labels: Label values.
+    """
+    REGISTRY.observe(name, value, **labels)
+
+
+@contextlib.contextmanager
+def timer(name: str, **labels: Any) -> Iterator[None]:
+    """Observe the wall time of the block in seconds, also if the block raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(name, time.perf_counter() - start, **labels)
+
+
+def snapshot() -> dict[str, Any]:
+    return REGISTRY.snapshot()
+
+
+def merge(snapshot: Optional[dict[str, Any]]):
+    """Add the metrics of a snapshot to the process wide registry. None is ignored."""
+    if snapshot:
+        REGISTRY.merge(snapshot)
+
+
+def reset():
+    REGISTRY.reset()
+
+
+@contextlib.contextmanager
+def collect() -> Iterator[dict[str, Any]]:
+    """Record the metrics of the block into a separate registry. The yielded dictionary is filled
+    with its snapshot when the block ends. Only for single threaded worker processes, other
+    threads would record into the separate registry too.
+    """
+    global REGISTRY
+    outer, REGISTRY = REGISTRY, Registry(REGISTRY.buckets)
+    collected: dict[str, Any] = {}
+    try:
+        yield collected
+    finally:
+        collected.update(REGISTRY.snapshot())
+        REGISTRY = outer
+
+
+def to_json(snapshot: Optional[dict[str, Any]] = None) -> str:
+    """Snapshot of the registry as json."""
+    return json.dumps(snapshot or REGISTRY.snapshot(), indent=1)
+
+
+def _format_labels(labels: dict[str, Any], **extra: Any) -> str:
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    values = (
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(values) + "}"
+
+
+def to_prometheus(snapshot: Optional[dict[str, Any]] = None) -> str:
+    """Snapshot of the registry in the Prometheus text exposition format."""
+    snapshot = snapshot or REGISTRY.snapshot()
+    lines = []
+    typed = set()
+    for counter in snapshot["counters"]:
+        if counter["name"] not in typed:
+            lines.append(f"# TYPE {counter['name']} counter")
+            typed.add(counter["name"])
+        lines.append(f"{counter['name']}{_format_labels(counter['labels'])} {counter['value']}")
+    for histogram in snapshot["histograms"]:
+        name, labels = histogram["name"], histogram["labels"]
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        cumulative = 0
+        for bound, count in zip([*snapshot["buckets"], "+Inf"], histogram["buckets"]):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def write(path: str):
+    """Write a snapshot of the registry, in the Prometheus format for `.prom` files, else as json."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(to_prometheus() if path.endswith(".prom") else to_json())
+
+
+def enable_profiling(directory: str, top_n: int = 10, memory: bool = False):
+    """Enable the `profile` hooks in this process and in worker processes started afterwards.
+
+    Args:
+        directory (str): Directory to save the profiles in.
+        top_n (int, optional): Number of profiles kept per block name. Defaults to 10.
+        memory (bool, optional): Also trace memory allocations with tracemalloc. Defaults to False.
+    """
+    os.makedirs(directory, exist_ok=True)
+    os.environ[PROFILE_DIR_VARIABLE] = directory
+    os.environ[PROFILE_TOP_VARIABLE] = str(top_n)
+    os.environ[PROFILE_MEMORY_VARIABLE] = "1" if memory else ""
+
+
+def disable_profiling():
+    for variable in (PROFILE_DIR_VARIABLE, PROFILE_TOP_VARIABLE, PROFILE_MEMORY_VARIABLE):
+        os.environ.pop(variable, None)
+
+
+def _prune(directory: str, name: str, top_n: int):
+    """Delete all but the slowest `top_n` profiles of a block name. The file names start with the
+    zero padded duration, so the slowest sort last."""
+    pattern = re.compile(rf"^\d+ms-{re.escape(name)}-.*\.prof$")
+    profiles = sorted(f for f in os.listdir(directory) if pattern.match(f))
+    for filename in profiles[: max(len(profiles) - top_n, 0)]:
+        for path in (filename, filename[: -len(".prof")] + ".mem.txt"):
+            with contextlib.suppress(FileNotFoundError):  # pruned by another process
+                os.remove(os.path.join(directory, path))
+
+
+@contextlib.contextmanager
+def profile(name: str, key: str = "") -> Iterator[None]:
+    """Profile the block if profiling is enabled, see `enable_profiling`. Without profiling, and
+    inside another profiled block of the process, the block runs unchanged.
+
+    Args:
+        name (str): Name of the block, e.g. "read_pdf".
+        key (str, optional): Input of the block, e.g. the pdf path. Part of the file name.
+    """
+    global _profiling_pid
+    directory = os.environ.get(PROFILE_DIR_VARIABLE)
+    with _profile_lock:
+        busy = _profiling_pid == os.getpid()  # a forked worker does not inherit the profiler
+        if directory and not busy:
+            _profiling_pid = os.getpid()
+    if not directory or busy:
+        yield
+        return
+
+    memory = bool(os.environ.get(PROFILE_MEMORY_VARIABLE))
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    elif memory:  # still tracing in a worker forked from a profiled block
+        tracemalloc.clear_traces()
+        tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        milliseconds = int(1000 * (time.perf_counter() - start))
+        slug = re.sub(r"[^\w.-]+", "_", os.path.basename(key))[:80]
+        base = os.path.join(directory, f"{milliseconds:07d}ms-{name}-{slug}")
+        profiler.dump_stats(base + ".prof")
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            ignore = [tracemalloc.Filter(False, m.__file__) for m in (cProfile, tracemalloc)]
+            stats = tracemalloc.take_snapshot().filter_traces(ignore).statistics("lineno")[:25]
+            if started:
+                tracemalloc.stop()
+            with open(base + ".mem.txt", "w", encoding="utf-8") as f:
+                f.write(f"current {current} bytes, peak {peak} bytes\n")
+                f.writelines(f"{stat}\n" for stat in stats)
+        _profiling_pid = None
+        _prune(directory, name, int(os.environ.get(PROFILE_TOP_VARIABLE) or 10))
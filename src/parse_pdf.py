@@ -7,57 +7,284 @@ Examples:
     metadata = parse_pdf.parse_head(head)
     passages = parse_pdf.parse_body(body)
 
+    metadata = parse_pdf.parse_head(parse_pdf.read_head("path/to/pdf"))  # first page only
+    passages = parse_pdf.parse_body(parse_pdf.iter_body_lines("path/to/pdf"))  # stops at the imprint
+
+    cache = pdf_cache.PdfCache("data/SMC_dataset/pdf_cache.db")
+    for result in parse_pdf.read_pdfs(["path/to/pdf", "path/to/other/pdf"], max_workers=4, cache=cache):
+        if not result.error:
+            metadata = parse_pdf.parse_head(result.head)
+
 """
 
 import io
+import os
 import re
-from typing import Any
+import signal
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator, NamedTuple, Optional, Union
 
 from pdfminer.converter import TextConverter  # type: ignore
-from pdfminer.layout import LAParams  # type: ignore
+from pdfminer.layout import LAParams, LTChar, LTContainer  # type: ignore
 from pdfminer.pdfdocument import PDFDocument  # type: ignore
 from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager  # type: ignore
 from pdfminer.pdfpage import PDFPage  # type: ignore
 from pdfminer.pdfparser import PDFParser  # type: ignore
 
+from config import PDF_TIMEOUT
+from src import metrics
+from src.pdf_cache import PdfCache, extraction_params, file_sha256
 
-def read_pdf(path: str) -> tuple[list[str], list[str]]:
-    """Open a PDF file from a given path and return seperate lists of strings for the first page and the remaining pages.
+TIMECODE_PATTERN = re.compile(
+    r"\[\d\d:\d\d\]|\(\d\d:\d\d\)|\[\d\d:\d\d:\d\d\]"
+)  # Re pattern for timecode: [00:00] [00:00:00] (00:00)
+
+
+class _RawTextConverter(TextConverter):
+    """Text converter for the layout free extraction mode. The expensive layout analysis
+    (grouping characters into text boxes) is skipped. Characters are joined into lines by their
+    baseline in content stream order, a blank line is written between lines that are further
+    apart than half a line height, like between the text boxes of the layout analysis.
+    """
+
+    def receive_layout(self, ltpage):
+        chars: list[LTChar] = []
+        stack = [ltpage]
+        while stack:  # collect characters, including those nested in figures
+            for item in stack.pop():
+                if isinstance(item, LTChar):
+                    chars.append(item)
+                elif isinstance(item, LTContainer):
+                    stack.append(item)
+
+        line: list[str] = []
+        prev: Optional[LTChar] = None
+        for char in chars:
+            if prev is not None:
+                if abs(char.y0 - prev.y0) > prev.height / 2 or char.x0 < prev.x0:  # new line
+                    self.write_text("".join(line) + "\n")
+                    if prev.y0 - char.y1 > prev.height / 2:  # new block
+                        self.write_text("\n")
+                    line = []
+                elif char.x0 - prev.x1 > 0.1 * max(char.width, char.height) and line[-1] != " ":
+                    line.append(" ")
+            line.append(char.get_text())
+            prev = char
+        if line:
+            self.write_text("".join(line) + "\n\n")
+        self.write_text("\f")
+
+
+def _iter_page_texts(path: str, layout: bool = True, maxpages: int = 0) -> Iterator[str]:
+    """Extract the text of a PDF file page by page. Pages are only processed when requested.
 
     Args:
         path (str): Path to the PDF file to read.
+        layout (bool, optional): Use the pdfminer layout analysis. Defaults to True.
+        maxpages (int, optional): Maximum number of pages to process, 0 for all. Defaults to 0.
 
-    Returns:
-        list[str]: List of all lines from the first page as string.
-        list[str]: List of all lines from the remaining pages as string.
+    Yields:
+        str: Text of each page.
     """
-    head_string = io.StringIO()  # output strings
-    body_string = io.StringIO()
-
+    output = io.StringIO()
     with open(path, "rb") as in_file:
         parser = PDFParser(in_file)
         doc = PDFDocument(parser)
         rsrcmgr = PDFResourceManager()
 
-        device_head = TextConverter(rsrcmgr, head_string, laparams=LAParams())
-        interpreter_head = PDFPageInterpreter(rsrcmgr, device_head)
+        if layout:
+            device = TextConverter(rsrcmgr, output, laparams=LAParams())
+        else:
+            device = _RawTextConverter(rsrcmgr, output, laparams=None)
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+
+        for pageno, page in enumerate(PDFPage.create_pages(doc), start=1):
+            interpreter.process_page(page)
+            metrics.inc("pdf_pages_total")
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+            if pageno == maxpages:
+                break
+
+
+def _iter_lines(page_texts: Iterator[str]) -> Iterator[str]:
+    """Split page texts into lines. A line that continues on the next page is yielded once,
+    so the lines are equal to splitting the concatenated text of all pages.
+    """
+    rest = str()
+    for text in page_texts:
+        lines = (rest + text).split("\n")
+        rest = lines.pop()
+        yield from lines
+    yield rest
 
-        device_body = TextConverter(rsrcmgr, body_string, laparams=LAParams())
-        interpreter_body = PDFPageInterpreter(rsrcmgr, device_body)
 
-        firstpage = True
-        for page in PDFPage.create_pages(doc):
-            if firstpage:
-                interpreter_head.process_page(page)
-                firstpage = False
-            else:
-                interpreter_body.process_page(page)
+def read_head(path: str, layout: bool = True) -> list[str]:
+    """Header only fast path: read just the first page of a PDF file, e.g. for `parse_head`.
+
+    Args:
+        path (str): Path to the PDF file to read.
+        layout (bool, optional): Use the pdfminer layout analysis. Defaults to True.
+
+    Returns:
+        list[str]: List of all lines from the first page as string.
+    """
+    return next(_iter_page_texts(path, layout, maxpages=1), str()).split("\n")
+
+
+def iter_body_lines(path: str, layout: bool = True) -> Iterator[str]:
+    """Lazily read the lines of all but the first page of a PDF file. Pages are extracted one
+    at a time when the lines are consumed, so a consumer like `parse_body` that stops at the
+    imprint page leaves the remaining pages unprocessed.
+
+    Args:
+        path (str): Path to the PDF file to read.
+        layout (bool, optional): Use the pdfminer layout analysis. Defaults to True.
+
+    Yields:
+        str: Lines from the remaining pages, equal to the body of `read_pdf`.
+    """
+    pages = _iter_page_texts(path, layout)
+    if next(pages, None) is None:  # skip the first page
+        yield str()
+        return
+    yield from _iter_lines(pages)
+
 
-    head = head_string.getvalue().split("\n")
-    body = body_string.getvalue().split("\n")
+def read_pdf(
+    path: str, cache: Optional[PdfCache] = None, layout: bool = True
+) -> tuple[list[str], list[str]]:
+    """Open a PDF file from a given path and return seperate lists of strings for the first page and the remaining pages.
+
+    Args:
+        path (str): Path to the PDF file to read.
+        cache (Optional[PdfCache], optional): Cache for the extracted lines. Defaults to None.
+        layout (bool, optional): Use the pdfminer layout analysis, the layout free mode is faster
+            but only approximates the line and block breaks. Defaults to True.
+
+    Returns:
+        list[str]: List of all lines from the first page as string.
+        list[str]: List of all lines from the remaining pages as string.
+    """
+    if cache is not None:
+        sha256, params = file_sha256(path), extraction_params(mode="full" if layout else "raw")
+        if cached := cache.get(sha256, params):
+            metrics.inc("pdf_cache_hits_total")
+            return cached
+        metrics.inc("pdf_cache_misses_total")
+
+    with metrics.profile("read_pdf", path), metrics.timer("pdf_read_seconds"):
+        pages = _iter_page_texts(path, layout)
+        head = next(pages, str()).split("\n")
+        body = list(_iter_lines(pages))
+
+    if cache is not None:
+        cache.put(sha256, params, head, body)
     return (head, body)
 
 
+class PdfResult(NamedTuple):
+    path: str
+    head: list[str]
+    body: list[str]
+    error: Optional[str]  # None if the pdf was read successfully
+    metrics: Optional[dict[str, Any]] = None  # recorded in the worker, see `metrics.collect`
+
+
+class PdfTimeout(Exception):
+    """Raised if reading a pdf takes longer than the timeout."""
+
+
+def _raise_timeout(signum, frame):
+    raise PdfTimeout()
+
+
+def _read_pdf_worker(path: str, timeout: Optional[float], layout: bool = True) -> PdfResult:
+    """Read a pdf in a worker process. Reading is interrupted after `timeout` seconds. The
+    metrics recorded while reading are returned with the result."""
+    if timeout:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    with metrics.collect() as collected:
+        try:
+            head, body = read_pdf(path, layout=layout)
+            result = PdfResult(path, head, body, None)
+        except PdfTimeout:
+            result = PdfResult(path, [], [], f"timeout after {timeout}s")
+        except Exception as e:
+            result = PdfResult(path, [], [], f"{type(e).__name__}: {e}")
+        finally:
+            if timeout:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    return result._replace(metrics=collected)
+
+
+def read_pdfs(
+    paths: Iterable[str],
+    max_workers: Optional[int] = None,
+    timeout: Optional[float] = PDF_TIMEOUT,
+    cache: Optional[PdfCache] = None,
+    layout: bool = True,
+) -> Iterator[PdfResult]:
+    """Read many pdf files in a process pool. The results are yielded in the order of the
+    paths as soon as they are available. A pdf that fails or takes longer than `timeout`
+    seconds does not abort the run, its error is returned in the result instead.
+
+    Args:
+        paths (Iterable[str]): Paths to the PDF files to read.
+        max_workers (Optional[int], optional): Number of worker processes. Defaults to the number of CPUs.
+        timeout (Optional[float], optional): Timeout per file in seconds, None to disable. Defaults to PDF_TIMEOUT.
+        cache (Optional[PdfCache], optional): Cache for the extracted lines, only misses are sent to the pool. Defaults to None.
+        layout (bool, optional): Use the pdfminer layout analysis, see `read_pdf`. Defaults to True.
+
+    Yields:
+        PdfResult: Head and body lines like `read_pdf` or an error for each path.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = 2 * max_workers  # bounds the number of parsed pdfs held in memory
+    params = extraction_params(mode="full" if layout else "raw")
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending: deque[tuple[str, Optional[str], Union[Future, PdfResult]]] = deque()
+
+        def _collect() -> PdfResult:
+            path, sha256, future = pending.popleft()
+            if isinstance(future, PdfResult):  # cache hit
+                return future
+            try:
+                result = future.result()
+            except Exception as e:  # e.g. a crashed worker process
+                result = PdfResult(path, [], [], f"{type(e).__name__}: {e}")
+            metrics.merge(result.metrics)
+            if result.error:
+                metrics.inc("pdf_errors_total")
+            elif cache is not None:
+                cache.put(sha256, params, result.head, result.body)  # type: ignore
+            return result
+
+        def _submit(path: str) -> tuple[str, Optional[str], Union[Future, PdfResult]]:
+            if cache is None:
+                return path, None, executor.submit(_read_pdf_worker, path, timeout, layout)
+            try:
+                sha256 = file_sha256(path)
+            except OSError as e:
+                return path, None, PdfResult(path, [], [], f"{type(e).__name__}: {e}")
+            if cached := cache.get(sha256, params):
+                metrics.inc("pdf_cache_hits_total")
+                return path, sha256, PdfResult(path, cached[0], cached[1], None)
+            metrics.inc("pdf_cache_misses_total")
+            return path, sha256, executor.submit(_read_pdf_worker, path, timeout, layout)
+
+        for path in paths:
+            pending.append(_submit(path))
+            if len(pending) >= max_pending:  # also for cache hits, see max_pending
+                yield _collect()
+        while pending:
+            yield _collect()
+
+
 def parse_head(lines: str) -> dict[str, Any]:
     metadata: dict[str, Any] = {"person": []}
     person: dict[str, str] = {}
@@ -105,55 +332,97 @@ def parse_head(lines: str) -> dict[str, Any]:
     return metadata
 
 
-def parse_body(lines: list[str]) -> list[dict[str, str]]:
-    """Parse the transcript body into segments with a speaker, starting timecode and text.capitalize
+@dataclass
+class Segment:
+    """Transcript segment with the speaker, starting timecode, timecode in seconds and text.
+    Segments before the first speaker line have no speaker and timecode, segments without
+    text lines have no text.
+    """
+
+    __slots__ = ("speaker", "timecode", "seconds", "text")
+    speaker: Optional[str]
+    timecode: Optional[str]
+    seconds: Optional[int]
+    text: Optional[str]
+
+    def to_dict(self) -> dict[str, str]:
+        """Segment as dictionary like returned by `parse_body`."""
+        segment = {}
+        if self.speaker is not None:
+            segment["speaker"] = self.speaker
+            segment["timecode"] = self.timecode
+        if self.text is not None:
+            segment["text"] = self.text
+        return segment  # type: ignore
+
+
+def timecode_seconds(timecode: str) -> int:
+    """Convert a timecode like [01:30], (01:30) or [01:02:30] to seconds.
 
     Args:
-        lines (list[str]): List of transcript lines.
+        timecode (str): Timecode with brackets.
 
     Returns:
-        list[dict[str, str]]: List of segments.
+        int: Seconds since the start of the press briefing.
     """
-    timecode_pattern = re.compile(
-        r"\[\d\d:\d\d\]|\(\d\d:\d\d\)|\[\d\d:\d\d:\d\d\]"
-    )  # Re pattern for timecode: [00:00] [00:00:00] (00:00)
-
-    def _get_timecode(line: str):
-        """Extract the timecode of a line."""
-        result = timecode_pattern.search(line)  # check if match exists
-        if result:
-            timecode = re.findall(timecode_pattern, line)
-            return timecode[0]
-
-    def _get_name(line: str):
-        """Extract the speaker name of a line."""
-        result = timecode_pattern.search(line)  # check if match exists
-        if result:
-            line_split = timecode_pattern.split(line)  # split at match
-            name = line_split[0].strip().replace(":", "")
-            return name
-
-    passages: list[dict[str, str]] = []
-    current_passage: dict[str, str] = {}
+    seconds = 0
+    for part in timecode.strip("[]()").split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def iter_segments(lines: Iterable[str]) -> Iterator[Segment]:
+    """Split transcript lines into segments. Each line is matched once against the timecode
+    pattern and the text of a segment is joined once, so parsing is linear in the number of lines.
+    Parsing stops at the imprint page.
+
+    Args:
+        lines (Iterable[str]): Transcript lines, e.g. a list or `iter_body_lines`.
+
+    Yields:
+        Segment: Segments in the order of the transcript.
+    """
+    speaker: Optional[str] = None
+    timecode: Optional[str] = None
+    text: list[str] = []
+    has_text = False
+
+    def _segment() -> Segment:
+        seconds = timecode_seconds(timecode) if timecode else None
+        return Segment(speaker, timecode, seconds, "".join(text) if has_text else None)
 
     for line in lines:
         if "in der Redaktion" in line:  # stop at imprint page
             break
-        if name := _get_name(line):
-            if current_passage:  # Save recent passage
-                passages.append(current_passage)
-                current_passage = {}
+        match = TIMECODE_PATTERN.search(line)
+        name = line[: match.start()].strip().replace(":", "") if match else None
+        if name:
+            if speaker is not None or has_text:  # Save recent segment
+                yield _segment()
+            speaker, timecode = name, match.group(0)  # type: ignore
+            text = []
+            has_text = False
+        else:
+            text.append(line.lstrip())
+            has_text = True
 
-            current_passage["speaker"] = name
-            current_passage["timecode"] = _get_timecode(line)
+    if speaker is not None or has_text:  # save last segment
+        yield _segment()
 
-        else:
-            if current_passage.get("text"):
-                current_passage["text"] += line.lstrip()
-            else:
-                current_passage["text"] = line.lstrip()
 
-    passages.append(current_passage)  # save last passage
+def parse_body(lines: Iterable[str]) -> list[dict[str, str]]:
+    """Parse the transcript body into segments with a speaker, starting timecode and text.capitalize
+    Parsing stops at the imprint page, so with `iter_body_lines` the remaining pages are never extracted.
+
+    Args:
+        lines (Iterable[str]): Transcript lines, e.g. a list or `iter_body_lines`.
+
+    Returns:
+        list[dict[str, str]]: List of segments, see `iter_segments` for `Segment` records.
+    """
+    passages = [segment.to_dict() for segment in iter_segments(lines)]
+    if not passages:  # an empty transcript results in a single empty segment
+        passages.append({})
     return passages
 
 
@@ -173,3 +442,68 @@ def sanetize(text: str) -> str:
     text = re.sub(" +", " ", text)
     text = text.replace("\uf075 ", "")
     return text
+
+
+def parse_press_briefings(
+    rows: Iterable[dict[str, Any]],
+    cache: Optional[PdfCache] = None,
+    errors: Optional[list[tuple[str, str]]] = None,
+    max_workers: Optional[int] = None,
+) -> Iterator[dict[str, Any]]:
+    """Parse the transcripts of many press briefings into records for
+    `create_db.import_press_briefings`. The pdfs are read in a process pool, see `read_pdfs`.
+    Transcripts without a title are skipped.
+
+    Args:
+        rows (Iterable[dict[str, Any]]): Metadata rows with the keys `pdf_path`, `pdf_url` and `introduction`.
+        cache (Optional[PdfCache], optional): Cache for the extracted lines. Defaults to None.
+        errors (Optional[list[tuple[str, str]]], optional): List to collect the (pdf_path, error) of unreadable pdfs. Defaults to None.
+        max_workers (Optional[int], optional): Number of worker processes. Defaults to the number of CPUs.
+
+    Yields:
+        dict[str, Any]: Parsed press briefing.
+    """
+    rows = list(rows)
+    results = read_pdfs([row["pdf_path"] for row in rows], max_workers=max_workers, cache=cache)
+    for row, result in zip(rows, results):
+        if result.error:
+            if errors is not None:
+                errors.append((row["pdf_path"], result.error))
+            continue
+        if record := parse_press_briefing(row, result.head, result.body):
+            yield record
+
+
+def parse_press_briefing(
+    row: dict[str, Any], head: list[str], body: list[str]
+) -> Optional[dict[str, Any]]:
+    """Parse the extracted lines of one transcript into a record for
+    `create_db.import_press_briefings`.
+
+    Args:
+        row (dict[str, Any]): Metadata row with the keys `pdf_path`, `pdf_url` and `introduction`.
+        head (list[str]): Lines of the first page, see `read_pdf`.
+        body (list[str]): Lines of the remaining pages.
+
+    Returns:
+        Optional[dict[str, Any]]: Parsed press briefing, None for a transcript without a title.
+    """
+    fulltext = " ".join(body)
+
+    # parse head
+    head_metadata = parse_head(head)  # type: ignore
+    if not head_metadata.get("title"):
+        return None
+
+    return {
+        "pdf_path": row["pdf_path"],
+        "pdf_url": row["pdf_url"],
+        "introduction_text": row["introduction"],
+        "fulltext": fulltext,
+        "fulltext_clean": sanetize(fulltext),
+        "title": head_metadata.get("title"),
+        "date": head_metadata.get("date"),
+        "video_url": head_metadata.get("video_url"),
+        "segments": parse_body(body),  # parse body
+        "guests": head_metadata["person"],
+    }
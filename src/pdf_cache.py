@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""Persistent cache for the lines extracted from the pdf transcripts. Extracting the text with
+pdfminer is by far the slowest step of parsing, while the head and body heuristics are cheap.
+The cache stores the extracted first page and body lines in a SQLite database, keyed by the
+SHA-256 of the pdf file and the extraction parameters (LAParams and pdfminer version). Changing
+a pdf or the extraction parameters therefore never returns stale lines.
+
+Examples:
+    cache = pdf_cache.PdfCache("data/SMC_dataset/pdf_cache.db")
+    head, body = parse_pdf.read_pdf("path/to/pdf", cache=cache)
+
+    cache.invalidate("path/to/pdf")  # drop a single pdf
+    cache.invalidate()  # drop everything
+"""
+
+import hashlib
+import pathlib
+import sqlite3
+import time
+import zlib
+from typing import Optional
+
+import pdfminer  # type: ignore
+from pdfminer.layout import LAParams  # type: ignore
+
+from config import PDF_CACHE_MAX_BYTES
+
+CHUNK_SIZE = 64 * 1024  # bytes
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        str: Hex digest of the file content.
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def extraction_params(laparams: Optional[LAParams] = None, mode: str = "full") -> str:
+    """Fingerprint of the extraction parameters. Part of every cache key.
+
+    Args:
+        laparams (Optional[LAParams], optional): Layout parameters used for the extraction. Defaults to LAParams().
+        mode (str, optional): Extraction mode. Defaults to "full".
+
+    Returns:
+        str: Fingerprint of the pdfminer version, the layout parameters and the mode.
+    """
+    if laparams is None:
+        laparams = LAParams()
+    params = ",".join(f"{k}={v}" for k, v in sorted(vars(laparams).items()))
+    return f"pdfminer={pdfminer.__version__};{params};mode={mode}"
+
+
+def _pack(lines: list[str]) -> bytes:
+    return zlib.compress("\n".join(lines).encode("utf-8"))
+
+
+def _unpack(data: bytes) -> list[str]:
+    return zlib.decompress(data).decode("utf-8").split("\n")
+
+
+class PdfCache:
+    """SQLite store for extracted pdf lines with size bounded LRU eviction.
+
+    Args:
+        path (str): Path to the cache database.
+        max_bytes (int, optional): Maximum size of the stored (compressed) lines. Defaults to PDF_CACHE_MAX_BYTES.
+        read_only (bool, optional): Only look up lines, e.g. for a dry run. The cache must exist and
+            the access times are not updated. Defaults to False.
+    """
+
+    def __init__(self, path: str, max_bytes: int = PDF_CACHE_MAX_BYTES, read_only: bool = False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        if read_only:
+            uri = f"{pathlib.Path(path).resolve().as_uri()}?mode=ro"
+            self.connection = sqlite3.connect(uri, uri=True)
+            return
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS Extraction
+            (
+                sha256 text NOT NULL,
+                params text NOT NULL,
+                head blob NOT NULL,
+                body blob NOT NULL,
+                size int NOT NULL,
+                last_access real NOT NULL,
+                PRIMARY KEY (sha256, params)
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_extraction_last_access ON Extraction (last_access)"
+        )
+        self.connection.commit()
+
+    def get(self, sha256: str, params: str) -> Optional[tuple[list[str], list[str]]]:
+        """Get the cached lines of a pdf.
+
+        Args:
+            sha256 (str): SHA-256 of the pdf file.
+            params (str): Fingerprint of the extraction parameters, see `extraction_params`.
+
+        Returns:
+            Optional[tuple[list[str], list[str]]]: Head and body lines or None on a cache miss.
+        """
+        row = self.connection.execute(
+            "SELECT head, body FROM Extraction WHERE sha256=? AND params=?", (sha256, params)
+        ).fetchone()
+        if not row:
+            return None
+        if self.read_only:
+            return (_unpack(row[0]), _unpack(row[1]))
+        self.connection.execute(
+            "UPDATE Extraction SET last_access=? WHERE sha256=? AND params=?",
+            (time.time(), sha256, params),
+        )
+        self.connection.commit()
+        return (_unpack(row[0]), _unpack(row[1]))
+
+    def put(self, sha256: str, params: str, head: list[str], body: list[str]):
+        """Store the lines of a pdf and evict the least recently used entries if the cache
+        grows larger than `max_bytes`.
+
+        Args:
+            sha256 (str): SHA-256 of the pdf file.
+            params (str): Fingerprint of the extraction parameters, see `extraction_params`.
+            head (list[str]): Lines of the first page.
+            body (list[str]): Lines of the remaining pages.
+        """
+        head_blob, body_blob = _pack(head), _pack(body)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO Extraction (sha256, params, head, body, size, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+            (sha256, params, head_blob, body_blob, len(head_blob) + len(body_blob), time.time()),
+        )
+        self.connection.commit()
+        self.evict()
+
+    def evict(self, max_bytes: Optional[int] = None):
+        """Delete the least recently used entries until the cache is smaller than `max_bytes`.
+
+        Args:
+            max_bytes (Optional[int], optional): Size limit. Defaults to the limit of the cache.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        total = self.size()
+        if total <= max_bytes:
+            return
+        cur = self.connection.execute(
+            "SELECT sha256, params, size FROM Extraction ORDER BY last_access"
+        )
+        evict = []
+        for sha256, params, size in cur:
+            if total <= max_bytes:
+                break
+            evict.append((sha256, params))
+            total -= size
+        self.connection.executemany("DELETE FROM Extraction WHERE sha256=? AND params=?", evict)
+        self.connection.commit()
+
+    def invalidate(self, path: Optional[str] = None):
+        """Delete the cached lines of a pdf, or of all pdfs if no path is given.
+
+        Args:
+            path (Optional[str], optional): Path to the pdf file. Defaults to None.
+        """
+        if path is None:
+            self.connection.execute("DELETE FROM Extraction")
+        else:
+            self.connection.execute("DELETE FROM Extraction WHERE sha256=?", (file_sha256(path),))
+        self.connection.commit()
+
+    def size(self) -> int:
+        """Size of all stored (compressed) lines in bytes."""
+        return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM Extraction").fetchone()[
+            0
+        ]
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+"""Entity resolution of the speakers. The import adds a person for every distinct speaker name,
+so title prefixes ("Prof. Dr."), spacing artifacts of the pdf extraction, abbreviated first names
+and typos create duplicate persons. `resolve_speakers`
+
+1. merges new persons into known persons with the same name key, a key without titles, case,
+   accents and spaces, see `name_key` and `same_person`. Candidates come from a blocking index
+   (the key, the surname with the first initial, the first name with the start or end of the
+   surname), so each name is only compared with the few names of its blocks and the run is
+   linear in the number of names. Names that only match by an initial or a similar surname
+   ("C. Drosten", "Schmidt" and "Schmitt") are not merged, distinct persons share them. These
+   pairs are written to `Person_Review` for a curator, see `merge_reviewed`,
+2. links the persons on the title page of each press briefing (`Head_Person`) to its speakers,
+   their description becomes the affiliation of the speaker if none is set. Within a briefing a
+   speaker only known by the surname or with an initial is linked to the full name of the title
+   page, if no other speaker of the briefing matches. Persons of the title page that do not
+   speak are added to the Person table.
+
+All name variants are recorded in `Person_Alias`, which the import uses for its lookups. Persons
+and title pages resolved once are not compared again, so a run after an import only resolves
+the new press briefings.
+
+Examples:
+    report = resolve_speakers.resolve_speakers(connection)
+    resolve_speakers.same_person("Prof. Dr. Christian Drosten", "Christian  Drosten")  # True
+    resolve_speakers.same_person("Christian Drosten", "C. Drosten")  # False
+    resolve_speakers.same_person("Christian Drosten", "C. Drosten", same_briefing=True)  # True
+"""
+
+import itertools
+import re
+import sqlite3
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Iterable, NamedTuple, Optional, Union
+
+from config import SPEAKER_MATCH_THRESHOLD
+from src import metrics
+from src.create_db import normalize_name
+
+# tokens of academic titles and roles, dropped from the name keys
+TITLE_TOKENS = {
+    "prof",
+    "dr",
+    "med",
+    "rer",
+    "nat",
+    "phil",
+    "habil",
+    "dipl",
+    "ing",
+    "pd",
+    "apl",
+    "jun",
+    "em",
+    "mult",
+    "vet",
+    "dent",
+    "univ",
+    "moderator",
+    "moderatorin",
+}
+UMLAUTS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+MIN_FUZZY_LENGTH = 5  # shorter surnames only match exactly
+
+
+class NameKey(NamedTuple):
+    tokens: tuple[str, ...]  # name parts without titles, e.g. ("hans-georg", "kraeusslich")
+    compact: str  # letters only, e.g. "hansgeorgkraeusslich"
+
+    @property
+    def first(self) -> str:
+        return re.sub(r"[^a-z]", "", self.tokens[0]) if len(self.tokens) > 1 else ""
+
+    @property
+    def last(self) -> str:
+        return re.sub(r"[^a-z]", "", self.tokens[-1]) if self.tokens else ""
+
+
+def name_key(name: str) -> NameKey:
+    """Normalize a person name for the comparison: lowercase, umlauts transcribed, accents,
+    punctuation, parentheses and title tokens removed.
+
+    Args:
+        name (str): Person name, e.g. "Prof. Dr. Hans-Georg Kräusslich".
+
+    Returns:
+        NameKey: Name parts and the name as letters only.
+    """
+    text = unicodedata.normalize("NFKC", name).lower().translate(UMLAUTS)
+    text = re.sub(r"\(.*?\)|h\.\s*c\.", " ", text)
+    text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    tokens = (token.strip("-'’") for token in re.split(r"[\s.,:;]+", text))
+    parts = tuple(token for token in tokens if token and token not in TITLE_TOKENS)
+    return NameKey(parts, re.sub(r"[^a-z]", "", "".join(parts)))
+
+
+def block_keys(key: NameKey) -> set[str]:
+    """Blocks of a name: the key, the surname with the first initial and the first name with the
+    first or last three letters of the surname. Names that can match (see `same_person`) share at
+    least one block, except surnames alone, which only match within a press briefing."""
+    keys = {f"c:{key.compact}"}
+    if key.first:
+        keys.add(f"s:{key.last}:{key.first[0]}")
+        keys.add(f"f:{key.first}:{key.last[:3]}")
+        keys.add(f"f:{key.first}:{key.last[-3:]}")
+    return keys
+
+
+def compare_names(
+    a: Union[str, NameKey], b: Union[str, NameKey], threshold: float = SPEAKER_MATCH_THRESHOLD
+) -> Optional[str]:
+    """How two names match: "key" if their keys are equal (titles, spaces, case), "initial" if the
+    surnames are equal and the first names are equal or an initial (middle names differ),
+    "surname" if one of them is only the surname, "fuzzy" if the first names are equal and the
+    surnames similar (typos, but also "Schmidt" and "Schmitt").
+
+    Args:
+        a (Union[str, NameKey]): Name or its key.
+        b (Union[str, NameKey]): Name or its key.
+        threshold (float, optional): Minimum similarity of the surnames. Defaults to SPEAKER_MATCH_THRESHOLD.
+
+    Returns:
+        Optional[str]: Kind of the match or None.
+    """
+    a = name_key(a) if isinstance(a, str) else a
+    b = name_key(b) if isinstance(b, str) else b
+    if not a.compact or not b.compact:
+        return None
+    if a.compact == b.compact:
+        return "key"
+    if a.last == b.last:
+        if not a.first or not b.first:
+            return "surname"
+        if a.first == b.first or (
+            a.first[0] == b.first[0] and min(len(a.first), len(b.first)) == 1
+        ):
+            return "initial"
+        return None
+    if a.first and a.first == b.first and min(len(a.last), len(b.last)) >= MIN_FUZZY_LENGTH:
+        if SequenceMatcher(None, a.last, b.last).ratio() >= threshold:
+            return "fuzzy"
+    return None
+
+
+def same_person(
+    a: Union[str, NameKey],
+    b: Union[str, NameKey],
+    threshold: float = SPEAKER_MATCH_THRESHOLD,
+    same_briefing: bool = False,
+) -> bool:
+    """Decide if two names refer to the same person without a review. They do if their keys are
+    equal, within a press briefing also if one is the surname alone or has an initial, see
+    `compare_names`. Similar surnames are never enough.
+
+    Args:
+        a (Union[str, NameKey]): Name or its key.
+        b (Union[str, NameKey]): Name or its key.
+        threshold (float, optional): Minimum similarity of the surnames. Defaults to SPEAKER_MATCH_THRESHOLD.
+        same_briefing (bool, optional): Both names are from the same press briefing. Defaults to False.
+
+    Returns:
+        bool: True if the names match.
+    """
+    kind = compare_names(a, b, threshold)
+    return kind == "key" or (same_briefing and kind in ("initial", "surname"))
+
+
+class BlockingIndex:
+    """Names of persons by block, see `block_keys`, and by surname for the lookups within a press
+    briefing. A person can have several names.
+
+    Args:
+        threshold (float, optional): Minimum similarity of the surnames, see `same_person`. Defaults to SPEAKER_MATCH_THRESHOLD.
+    """
+
+    def __init__(self, threshold: float = SPEAKER_MATCH_THRESHOLD):
+        self.threshold = threshold
+        self.blocks: dict[str, set[int]] = {}
+        self.surnames: dict[str, set[int]] = {}
+        self.names: dict[int, list[NameKey]] = {}
+
+    def add(self, person_ID: int, name: str):
+        key = name_key(name)
+        if not key.compact or key in self.names.get(person_ID, []):
+            return
+        self.names.setdefault(person_ID, []).append(key)
+        for block in block_keys(key):
+            self.blocks.setdefault(block, set()).add(person_ID)
+        self.surnames.setdefault(key.last, set()).add(person_ID)
+
+    def _candidates(self, key: NameKey, same_briefing: bool) -> list[int]:
+        candidates = set().union(*(self.blocks.get(block, ()) for block in block_keys(key)))
+        if same_briefing:
+            candidates |= self.surnames.get(key.last, set())
+        metrics.inc("speaker_candidates_total", len(candidates))
+        return sorted(candidates)
+
+    def match(self, name: str, same_briefing: bool = False) -> Optional[int]:
+        """Person that is the same person, see `same_person`. A key match wins, the lowest
+        `person_ID` if several match. A match by surname or initial is only taken if it is the
+        only one, "C. Drosten" may be any of several Drostens of a briefing.
+
+        Args:
+            name (str): Name to look up.
+            same_briefing (bool, optional): The index only holds names of the same press briefing, see `same_person`. Defaults to False.
+
+        Returns:
+            Optional[int]: ID of the person or None.
+        """
+        key = name_key(name)
+        if not key.compact:
+            return None
+        allowed = {"initial", "surname"} if same_briefing else set()
+        matches = []
+        for person_ID in self._candidates(key, same_briefing):
+            kinds = {compare_names(key, other, self.threshold) for other in self.names[person_ID]}
+            if "key" in kinds:
+                return person_ID
+            if kinds & allowed:
+                matches.append(person_ID)
+        return matches[0] if len(matches) == 1 else None
+
+    def similar(self, name: str) -> list[tuple[int, str]]:
+        """Persons with a name that matches, but not well enough to merge without a review.
+
+        Args:
+            name (str): Name to look up.
+
+        Returns:
+            list[tuple[int, str]]: (person_ID, kind of the match) pairs, see `compare_names`.
+        """
+        key = name_key(name)
+        if not key.compact:
+            return []
+        similar = []
+        for person_ID in self._candidates(key, same_briefing=False):
+            kinds = {compare_names(key, other, self.threshold) for other in self.names[person_ID]}
+            kind = next((k for k in ("initial", "fuzzy") if k in kinds), None)
+            if kind and "key" not in kinds:
+                similar.append((person_ID, kind))
+        return similar
+
+
+def _merge_persons(connection: sqlite3.Connection, merges: dict[int, int]):
+    """Point all references of the duplicate persons to their canonical person and delete the
+    duplicates. Missing affiliations and resorts are taken from the duplicates."""
+    pairs = [(canonical, duplicate) for duplicate, canonical in merges.items()]
+    for command in [
+        "UPDATE Segment SET speaker=? WHERE speaker=?",
+        "UPDATE Press_Briefing SET host=? WHERE host=?",
+        "UPDATE is_guest SET person_ID=? WHERE person_ID=?",
+        "UPDATE Head_Person SET person_ID=? WHERE person_ID=?",
+        "UPDATE Person_Alias SET person_ID=? WHERE person_ID=?",
+    ]:
+        connection.executemany(command, pairs)
+    connection.executemany(
+        "DELETE FROM Person_Review WHERE person_ID=? OR other_ID=?",
+        [(duplicate, duplicate) for duplicate in merges],
+    )
+    connection.executemany(
+        """UPDATE Person SET
+            afiliation = COALESCE(NULLIF(afiliation, ''), (SELECT afiliation FROM Person WHERE person_ID=?)),
+            resort = COALESCE(NULLIF(resort, ''), (SELECT resort FROM Person WHERE person_ID=?))
+        WHERE person_ID=?""",
+        [(duplicate, duplicate, canonical) for canonical, duplicate in pairs],
+    )
+    connection.executemany(
+        """DELETE FROM is_guest WHERE person_ID=? AND rowid NOT IN
+        (SELECT MIN(rowid) FROM is_guest WHERE person_ID=? GROUP BY pb_ID)""",
+        [(canonical, canonical) for canonical in set(merges.values())],
+    )
+    connection.executemany("DELETE FROM Person WHERE person_ID=?", [(d,) for d in merges])
+
+
+def resolve_speakers(
+    connection: sqlite3.Connection, threshold: float = SPEAKER_MATCH_THRESHOLD
+) -> dict[str, int]:
+    """Merge the new duplicate persons and link the new title page persons to the speakers, see
+    the module docstring. Runs in one transaction.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        threshold (float, optional): Minimum similarity of the surnames, see `same_person`. Defaults to SPEAKER_MATCH_THRESHOLD.
+
+    Returns:
+        dict[str, int]: Number of merged persons, persons to review, linked title page persons,
+            speakers linked to the full name of the title page and persons added from the title
+            pages.
+    """
+    index = BlockingIndex(threshold)
+    for name, person_ID in connection.execute("SELECT name, person_ID FROM Person_Alias"):
+        index.add(person_ID, name)
+
+    # 1. merge new persons into known persons, similar names are reviewed
+    merges: dict[int, int] = {}
+    reviews: list[tuple[int, int, str]] = []
+    aliases: list[tuple[str, int]] = []
+    for person_ID, name in connection.execute(
+        """SELECT person_ID, name FROM Person
+        WHERE person_ID NOT IN (SELECT person_ID FROM Person_Alias) ORDER BY person_ID"""
+    ).fetchall():
+        canonical = index.match(name)
+        if canonical is None:
+            canonical = person_ID
+            reviews.extend((person_ID, other, kind) for other, kind in index.similar(name))
+        else:
+            merges[person_ID] = canonical
+        index.add(canonical, name)
+        aliases.append((normalize_name(name), canonical))
+
+    # 2. link the persons of the title pages to the speakers of their press briefing
+    links: list[tuple[int, int]] = []
+    relinks: list[tuple[int, int, int]] = []
+    affiliations: list[tuple[str, int]] = []
+    created = 0
+    head_persons = connection.execute(
+        """SELECT pb_ID, head_person_ID, name, description FROM Head_Person
+        WHERE person_ID IS NULL ORDER BY pb_ID, head_person_ID"""
+    ).fetchall()
+    with connection:
+        _merge_persons(connection, merges)
+        for pb_ID, rows in itertools.groupby(head_persons, key=lambda row: row[0]):
+            speakers = BlockingIndex(threshold)
+            for person_ID, name in connection.execute(
+                """SELECT DISTINCT Person.person_ID, Person.name FROM Segment
+                JOIN Person ON Person.person_ID = Segment.speaker WHERE Segment.pb_ID = ?""",
+                (pb_ID,),
+            ):
+                speakers.add(person_ID, name)
+            for _, head_person_ID, name, description in rows:
+                person_ID = speakers.match(name)
+                if person_ID is None:  # e.g. only the surname or an initial
+                    speaker = speakers.match(name, same_briefing=True)
+                    person_ID = index.match(name) or speaker
+                    if speaker is not None and speaker != person_ID:
+                        relinks.append((person_ID, pb_ID, speaker))  # type: ignore
+                if person_ID is None:  # listed on the title page, but does not speak
+                    cur = connection.execute(
+                        "INSERT INTO Person (name, name_key, afiliation) VALUES (?, ?, ?)",
+                        (name, normalize_name(name), description),
+                    )
+                    person_ID = cur.lastrowid  # type: ignore
+                    created += 1
+                    similar = index.similar(name)
+                    reviews.extend((person_ID, other, kind) for other, kind in similar)  # type: ignore
+                index.add(person_ID, name)  # type: ignore
+                links.append((person_ID, head_person_ID))  # type: ignore
+                aliases.append((normalize_name(name), person_ID))  # type: ignore
+                if description:
+                    affiliations.append((description, person_ID))  # type: ignore
+
+        connection.executemany("UPDATE Head_Person SET person_ID=? WHERE head_person_ID=?", links)
+        connection.executemany("UPDATE Segment SET speaker=? WHERE pb_ID=? AND speaker=?", relinks)
+        connection.executemany(
+            "UPDATE is_guest SET person_ID=? WHERE pb_ID=? AND person_ID=?", relinks
+        )
+        connection.executemany(
+            """DELETE FROM is_guest WHERE pb_ID=? AND rowid NOT IN
+            (SELECT MIN(rowid) FROM is_guest WHERE pb_ID=? GROUP BY person_ID)""",
+            [(pb_ID, pb_ID) for pb_ID in {pb_ID for _, pb_ID, _ in relinks}],
+        )
+        connection.executemany(  # the first description of a person wins, curated ones are kept
+            "UPDATE Person SET afiliation=? WHERE person_ID=? AND COALESCE(afiliation, '')=''",
+            affiliations,
+        )
+        connection.executemany(
+            "INSERT OR IGNORE INTO Person_Alias (name, person_ID) VALUES (?, ?)", aliases
+        )
+        connection.executemany(
+            "INSERT OR IGNORE INTO Person_Review (person_ID, other_ID, kind) VALUES (?, ?, ?)",
+            reviews,
+        )
+
+    metrics.inc("speakers_merged_total", len(merges))
+    metrics.inc("head_persons_linked_total", len(links))
+    return {
+        "merged": len(merges),
+        "review": len(reviews),
+        "linked": len(links),
+        "relinked": len(relinks),
+        "created": created,
+    }
+
+
+def merge_reviewed(connection: sqlite3.Connection, pairs: Iterable[tuple[int, int]]) -> int:
+    """Merge pairs of `Person_Review` a curator confirmed, e.g. typos of a name. The other names
+    of the review are kept in `Person_Alias`, so the import finds the merged person.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        pairs (Iterable[tuple[int, int]]): (person_ID, other_ID) pairs, the person is merged into the other.
+
+    Returns:
+        int: Number of merged persons.
+    """
+    merges = dict(pairs)
+    with connection:
+        _merge_persons(connection, merges)
+    return len(merges)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Split the segments of the dataset into sentences. The segments are streamed from the database
+in chunks (keyset pagination on `segment_ID`) and split in worker processes, each of which loads
+the punkt model once. The sentences of a chunk are inserted with one `executemany`.
+
+The stage is incremental: split segments are flagged (`Segment.split`), also those that give
+no sentence, so after a partial re-import only the new segments are processed.
+
+Examples:
+    connection = create_db.create_connection(DB_PATH)
+    split_sentences.split_sentences(connection)
+"""
+
+import os
+import sqlite3
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Iterator, Optional
+
+import nltk  # type: ignore
+
+from config import DEBUG, NLTK_DATA_PATH, SENTENCE_CHUNK_SIZE, SENTENCE_LANGUAGE
+from src import metrics
+
+_tokenizer: Any = None  # punkt model of the worker process
+
+
+def load_punkt(language: str = SENTENCE_LANGUAGE) -> Any:
+    """Load the punkt sentence tokenizer of a language. The punkt models are downloaded to
+    `NLTK_DATA_PATH` on first use.
+
+    Args:
+        language (str, optional): Name of the punkt model. Defaults to SENTENCE_LANGUAGE.
+
+    Returns:
+        Any: Tokenizer with a `tokenize` method.
+    """
+    if NLTK_DATA_PATH not in nltk.data.path:
+        nltk.data.path.append(NLTK_DATA_PATH)
+    try:
+        from nltk.tokenize import PunktTokenizer  # type: ignore  # nltk >= 3.8.2
+
+        load, package = lambda: PunktTokenizer(language), "punkt_tab"
+    except ImportError:
+        load, package = lambda: nltk.data.load(f"tokenizers/punkt/{language}.pickle"), "punkt"
+    try:
+        return load()
+    except LookupError:
+        os.makedirs(NLTK_DATA_PATH, exist_ok=True)
+        nltk.download(package, NLTK_DATA_PATH)
+        return load()
+
+
+def _init_worker(language: str):
+    global _tokenizer
+    _tokenizer = load_punkt(language)
+
+
+def _split_chunk(segments: list[tuple[int, int, str]]) -> list[tuple[int, int, str]]:
+    """Split a chunk of segments into (segment_ID, pb_ID, sentence) rows."""
+    return [
+        (segment_id, pb_id, sentence)
+        for segment_id, pb_id, text in segments
+        for sentence in _tokenizer.tokenize(text)
+    ]
+
+
+def iter_unsplit_segments(
+    connection: sqlite3.Connection, chunk_size: int = SENTENCE_CHUNK_SIZE
+) -> Iterator[list[tuple[int, int, str]]]:
+    """Stream the segments that are not split yet in chunks, ordered by `segment_ID`.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        chunk_size (int, optional): Number of segments per chunk. Defaults to SENTENCE_CHUNK_SIZE.
+
+    Yields:
+        list[tuple[int, int, str]]: Chunk of (segment_ID, pb_ID, text) rows.
+    """
+    last_id = 0
+    while True:
+        chunk = connection.execute(
+            """SELECT segment_ID, pb_ID, text FROM Segment
+            WHERE segment_ID > ? AND split = 0
+            ORDER BY segment_ID LIMIT ?""",
+            (last_id, chunk_size),
+        ).fetchall()
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1][0]
+
+
+def split_sentences(
+    connection: sqlite3.Connection,
+    language: str = SENTENCE_LANGUAGE,
+    max_workers: Optional[int] = None,
+    chunk_size: int = SENTENCE_CHUNK_SIZE,
+) -> int:
+    """Split all segments that are not split yet, insert the sentences into the `Sentence` table
+    and flag the segments as split.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        language (str, optional): Name of the punkt model. Defaults to SENTENCE_LANGUAGE.
+        max_workers (Optional[int], optional): Number of worker processes. Defaults to the number of CPUs.
+        chunk_size (int, optional): Number of segments per worker task. Defaults to SENTENCE_CHUNK_SIZE.
+
+    Returns:
+        int: Number of inserted sentences.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = 2 * max_workers  # bounds the number of chunks held in memory
+    inserted = 0
+    load_punkt(language)  # download the model before the workers start
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_init_worker, initargs=(language,)
+    ) as executor:
+        pending: deque[tuple[list[int], Future]] = deque()
+
+        def _collect():
+            nonlocal inserted
+            segment_ids, future = pending.popleft()
+            rows = future.result()
+            with metrics.timer("db_commit_seconds", table="Sentence"), connection:
+                connection.executemany(
+                    "INSERT INTO Sentence (segment_ID, pb_ID, sentence) VALUES (?, ?, ?)", rows
+                )
+                connection.executemany(
+                    "UPDATE Segment SET split=1 WHERE segment_ID=?",
+                    [(segment_id,) for segment_id in segment_ids],
+                )
+            inserted += len(rows)
+            metrics.inc("db_rows_inserted_total", len(rows), table="Sentence")
+
+        for chunk in iter_unsplit_segments(connection, chunk_size):
+            pending.append(([row[0] for row in chunk], executor.submit(_split_chunk, chunk)))
+            if len(pending) >= max_pending:
+                _collect()
+        while pending:
+            _collect()
+
+    if DEBUG:
+        print(str(inserted), "sentences inserted.")
+    return inserted
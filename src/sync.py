@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""Incrementally synchronize the press briefing sites and transcript pdfs with the SMC website.
+A manifest keeps the URL, ETag/Last-Modified, size and SHA-256 of every downloaded file, so
+the files are requested with conditional GETs and only new or changed bytes are transferred.
+Downloads are streamed and resumable, see `http_client.download_file`.
+Files are kept in a content addressed store (`<store>/<sha[:2]>/<sha><suffix>`), the pdf
+directory only holds hard links into the store. Renamed or duplicated transcripts are therefore
+stored once.
+
+Examples:
+    results = sync.sync_pressbriefings()
+    changed = [pb for pb in results if pb["changed"]]
+"""
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, NamedTuple, Optional
+
+import requests
+
+from config import (
+    BASE_URL,
+    CRAWL_HOST_CONCURRENCY,
+    CRAWL_MAX_WORKERS,
+    CRAWL_RATE,
+    DEBUG,
+    MANIFEST_PATH,
+    PDF_DIR,
+    STORE_DIR,
+)
+from src import load_data
+from src.http_client import PoliteSession, download_file
+
+
+class SyncResult(NamedTuple):
+    url: str
+    path: str  # path of the object in the content store
+    sha256: str
+    changed: bool  # False if the server answered 304 or the content is unchanged
+
+
+class Manifest:
+    """SQLite backed manifest of all synchronized URLs. The manifest is safe to use from
+    multiple threads.
+
+    Args:
+        path (str): Path to the manifest database.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self.connection.execute(
+                """CREATE TABLE IF NOT EXISTS Manifest
+                (
+                    url text PRIMARY KEY,
+                    kind text NOT NULL,
+                    etag text,
+                    last_modified text,
+                    size int NOT NULL,
+                    sha256 text NOT NULL,
+                    path text NOT NULL,
+                    fetched_at real NOT NULL
+                )
+                """
+            )
+            self.connection.commit()
+
+    def get(self, url: str) -> Optional[dict[str, Any]]:
+        """Get the manifest entry of an url.
+
+        Args:
+            url (str): URL of the file.
+
+        Returns:
+            Optional[dict[str, Any]]: Manifest entry or None if the url was never synchronized.
+        """
+        with self._lock:
+            cur = self.connection.execute(
+                "SELECT url, kind, etag, last_modified, size, sha256, path, fetched_at FROM Manifest WHERE url=?",
+                (url,),
+            )
+            row = cur.fetchone()
+            if not row:
+                return None
+            return dict(zip([c[0] for c in cur.description], row))
+
+    def update(
+        self,
+        url: str,
+        kind: str,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        size: int,
+        sha256: str,
+        path: str,
+    ):
+        """Insert or replace the manifest entry of an url."""
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO Manifest (url, kind, etag, last_modified, size, sha256, path, fetched_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, kind, etag, last_modified, size, sha256, path, time.time()),
+            )
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class ContentStore:
+    """Content addressed file store. Each file is saved once under its SHA-256.
+
+    Args:
+        root (str): Root directory of the store.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def tmp_path(self, url: str) -> str:
+        """Temporary download path of an url. The path is stable, so an interrupted download is
+        resumed on the next run, and therefore only used while holding `url_lock`."""
+        return os.path.join(self.root, "tmp", hashlib.sha1(url.encode()).hexdigest())
+
+    def url_lock(self, url: str) -> threading.Lock:
+        """Lock of an url. Press briefings may link the same pdf, the lock keeps concurrent
+        workers from downloading it into the same temporary path at once."""
+        with self._locks_lock:
+            return self._locks.setdefault(url, threading.Lock())
+
+    def object_path(self, sha256: str, suffix: str = "") -> str:
+        """Path of an object in the store."""
+        return os.path.join(self.root, sha256[:2], sha256 + suffix)
+
+    def put(self, tmp_path: str, sha256: str, suffix: str = "") -> str:
+        """Move a temporary file into the store. If the object already exists, the temporary
+        file is discarded.
+
+        Args:
+            tmp_path (str): Path to the temporary file.
+            sha256 (str): SHA-256 of the file content.
+            suffix (str, optional): File suffix of the object. Defaults to "".
+
+        Returns:
+            str: Path of the object in the store.
+        """
+        path = self.object_path(sha256, suffix)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return path
+
+    def link(self, object_path: str, dest: str):
+        """Atomically point `dest` at an object in the store. A hard link is used where possible,
+        otherwise the object is copied.
+
+        Args:
+            object_path (str): Path of the object in the store.
+            dest (str): Path of the link to create or replace.
+        """
+        if os.path.exists(dest) and os.path.samefile(object_path, dest):
+            return
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        tmp_dest = dest + ".link"
+        if os.path.lexists(tmp_dest):
+            os.remove(tmp_dest)
+        try:
+            os.link(object_path, tmp_dest)
+        except OSError:  # e.g. store and pdf dir on different file systems
+            shutil.copyfile(object_path, tmp_dest)
+        os.replace(tmp_dest, dest)
+
+
+def sync_url(
+    session: PoliteSession,
+    url: str,
+    kind: str,
+    manifest: Manifest,
+    store: ContentStore,
+    suffix: str = "",
+) -> SyncResult:
+    """Synchronize a single url with a conditional GET. If the server answers with
+    `304 Not Modified`, nothing is transferred and the stored object is returned.
+
+    Args:
+        session (PoliteSession): Session to send the request with.
+        url (str): URL of the file.
+        kind (str): Kind of the file, e.g. "pdf" or "html".
+        manifest (Manifest): Manifest of the synchronized urls.
+        store (ContentStore): Store to save the file in.
+        suffix (str, optional): File suffix of the object in the store. Defaults to "".
+
+    Returns:
+        SyncResult: Path, hash and whether the content changed.
+    """
+    with store.url_lock(url):
+        return _sync_url(session, url, kind, manifest, store, suffix)
+
+
+def _sync_url(
+    session: PoliteSession,
+    url: str,
+    kind: str,
+    manifest: Manifest,
+    store: ContentStore,
+    suffix: str,
+) -> SyncResult:
+    """`sync_url` without the lock."""
+    entry = manifest.get(url)
+    headers = {}
+    if entry and os.path.exists(entry["path"]):
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    tmp_path = store.tmp_path(url)
+    result = download_file(session, url, tmp_path, headers=headers)
+    if result.status == 304 and entry:
+        return SyncResult(url, entry["path"], entry["sha256"], False)
+
+    path = store.put(tmp_path, result.sha256, suffix)  # type: ignore
+    manifest.update(url, kind, result.etag, result.last_modified, result.size, result.sha256, path)  # type: ignore
+    changed = not entry or entry["sha256"] != result.sha256
+    return SyncResult(url, path, result.sha256, changed)  # type: ignore
+
+
+def sync_pressbriefings(
+    base_url: str = BASE_URL,
+    pdf_dir: str = PDF_DIR,
+    manifest_path: str = MANIFEST_PATH,
+    store_dir: str = STORE_DIR,
+    max_workers: int = CRAWL_MAX_WORKERS,
+    host_concurrency: int = CRAWL_HOST_CONCURRENCY,
+    rate: float = CRAWL_RATE,
+    session: Optional[PoliteSession] = None,
+) -> list[dict[str, Any]]:
+    """Incrementally synchronize all press briefing sites and their transcript pdfs. Every
+    pdf is linked into `pdf_dir` under the filename from its url.
+
+    Args:
+        base_url (str, optional): Base URL of the SMC site. Defaults to BASE_URL.
+        pdf_dir (str, optional): Directory the pdfs are linked into. Defaults to PDF_DIR.
+        manifest_path (str, optional): Path to the manifest database. Defaults to MANIFEST_PATH.
+        store_dir (str, optional): Root of the content store. Defaults to STORE_DIR.
+        max_workers (int, optional): Number of worker threads. Defaults to CRAWL_MAX_WORKERS.
+        host_concurrency (int, optional): Maximum requests in flight per host. Defaults to CRAWL_HOST_CONCURRENCY.
+        rate (float, optional): Requests per second per host. Defaults to CRAWL_RATE.
+        session (Optional[PoliteSession], optional): Session to reuse. Defaults to a new session.
+
+    Returns:
+        list[dict[str, Any]]: Metadata for each press briefing with the keys `introduction`, `pdf_path`,
+            `pdf_url`, `url` and `changed`.
+    """
+    own_session = session is None
+    if session is None:
+        session = PoliteSession(host_concurrency=host_concurrency, rate=rate)
+    manifest = Manifest(manifest_path)
+    store = ContentStore(store_dir)
+
+    def _sync(url: str) -> dict[str, Any]:
+        pb: dict[str, Any] = {"introduction": None, "pdf_path": None, "pdf_url": None, "url": url, "changed": False}
+        try:
+            page = sync_url(session, url, "html", manifest, store, ".html")  # type: ignore
+        except (requests.RequestException, IOError) as e:
+            print("ERROR: Could not load pressbriefing:", url, e)
+            return pb
+        with open(page.path, "rb") as f:
+            site = load_data.extrect_pressbriefing(f.read())
+        pb["introduction"] = site["introduction"]
+        pdf_url = site["pdf_url"]
+        if not pdf_url:
+            return pb
+        if not pdf_url.startswith("http"):
+            pdf_url = base_url + pdf_url
+        pb["pdf_url"] = pdf_url
+
+        try:
+            pdf = sync_url(session, pdf_url, "pdf", manifest, store, ".pdf")  # type: ignore
+        except (requests.RequestException, IOError) as e:
+            print("ERROR: Could not load pdf:", pdf_url, e)
+            return pb
+        pdf_path = os.path.join(pdf_dir, pdf_url.split("/")[-1])
+        store.link(pdf.path, pdf_path)
+        pb["pdf_path"] = pdf_path
+        pb["changed"] = page.changed or pdf.changed
+        return pb
+
+    try:
+        links = load_data.crawl_pressbriefing_links(session, base_url, max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_sync, links))
+    finally:
+        manifest.close()
+        if own_session:
+            session.close()
+
+    if DEBUG:
+        print(str(sum(pb["changed"] for pb in results)), "of", str(len(results)), "press briefings changed.")
+    return results
@@ -1,10 +1,314 @@
 # -*- coding: utf-8 -*-
-"""Detect the main concept of a text through wikification."""
+"""Detect the main concept of a text through wikification.
 
+`WikifyClient` sends many requests concurrently over a pooled session. The calls per second
+allowed by the provider are enforced with a token bucket shared by all workers, the text is sent
+form encoded in the POST body, 429/5xx responses are retried with backoff and a 403 (no credits
+left) stops the batch with an `OutOfCreditsError`. Every call starts anew, so a run can continue
+after the credits were topped up. The base urls are configurable, so the client
+can be pointed at a local fake server.
+
+Examples:
+    client = wikify.WikifyClient("tagme", token)
+    for result in client.annotate_many(sentences):
+        print(result.text, result.annotations, result.error)
+"""
+
+import threading
 import time
-from typing import Any, Optional
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Iterable, Iterator, NamedTuple, Optional, Sequence
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from config import DANDELION_URL, TAGME_URL, WIKIFY_MAX_WORKERS, WIKIFY_RATE
+from src import metrics
+from src.http_client import RETRY_STATUS, TokenBucket, retry_after
+
+SERVICE_URLS = {"dandaleon": DANDELION_URL, "tagme": TAGME_URL}
+MIN_WORDS = 4  # shorter texts are not wikified
+MAX_TEXT_LENGTH = 4000  # chars, limit of the dandelion api
+PACK_SEPARATOR = " "  # between the sentences of a packed request
+
+
+class OutOfCreditsError(Exception):
+    """Raised if the API answers 403 because no credits are left."""
+
+
+class WikifyResult(NamedTuple):
+    text: str
+    annotations: Optional[list[dict[str, Any]]]  # None if nothing was detected
+    error: Optional[str]  # None if the request succeeded
+
+
+def pack_texts(texts: Sequence[str], max_length: int = MAX_TEXT_LENGTH) -> Iterator[list[int]]:
+    """Greedily pack consecutive texts into requests of at most `max_length` chars. Texts with
+    less than `MIN_WORDS` words and texts longer than `max_length` are packed alone.
+
+    Args:
+        texts (Sequence[str]): Texts to pack, e.g. the sentences of a segment.
+        max_length (int, optional): Maximum length of a packed text. Defaults to MAX_TEXT_LENGTH.
+
+    Yields:
+        list[int]: Indices of the texts of each pack.
+    """
+    pack: list[int] = []
+    length = 0
+    for i, text in enumerate(texts):
+        alone = len(text.split(" ")) < MIN_WORDS or len(text) > max_length
+        if pack and (alone or length + len(PACK_SEPARATOR) + len(text) > max_length):
+            yield pack
+            pack, length = [], 0
+        if alone:
+            yield [i]
+            continue
+        length += len(text) + (len(PACK_SEPARATOR) if pack else 0)
+        pack.append(i)
+    if pack:
+        yield pack
+
+
+def unpack_annotations(texts: Sequence[str], result: WikifyResult) -> list[WikifyResult]:
+    """Map the annotations of a packed request back to its texts by their `start`/`end` offsets.
+    Annotations that cross the boundary of a text or have no offsets are dropped, the offsets of
+    the others are shifted to the text.
+
+    Args:
+        texts (Sequence[str]): Texts of the pack.
+        result (WikifyResult): Result of the packed request.
+
+    Returns:
+        list[WikifyResult]: Result for each text.
+    """
+    if result.error or not result.annotations:
+        return [WikifyResult(text, None, result.error) for text in texts]
+
+    starts = []
+    offset = 0
+    for text in texts:
+        starts.append(offset)
+        offset += len(text) + len(PACK_SEPARATOR)
+
+    annotations: list[list[dict[str, Any]]] = [[] for _ in texts]
+    for annotation in result.annotations:
+        start, end = annotation.get("start"), annotation.get("end")
+        if start is None or end is None:
+            continue
+        i = bisect_right(starts, start) - 1
+        if i < 0 or end > starts[i] + len(texts[i]):  # crosses a sentence boundary
+            continue
+        annotations[i].append({**annotation, "start": start - starts[i], "end": end - starts[i]})
+    return [WikifyResult(text, found or None, None) for text, found in zip(texts, annotations)]
+
+
+class WikifyClient:
+    """Concurrent client for the Dandelion and TagMe entity extraction APIs.
+
+    Args:
+        service (str): Name of the API. Either dandaleon or tagme.
+        token (str): Token for the API.
+        language (str, optional): Language of the input texts. Defaults to "de".
+        base_url (Optional[str], optional): URL of the API endpoint. Defaults to the url of the service from the config.
+        max_workers (int, optional): Number of requests in flight. Defaults to WIKIFY_MAX_WORKERS.
+        rate (float, optional): Calls per second. Defaults to WIKIFY_RATE.
+        retries (int, optional): Number of retries on 429/5xx and connection errors. Defaults to 3.
+        backoff (float, optional): Initial backoff in seconds. Defaults to 1.0.
+        timeout (float, optional): Timeout per request in seconds. Defaults to 30.
+        session (Optional[requests.Session], optional): Session to reuse. Defaults to a new pooled session.
+    """
+
+    def __init__(
+        self,
+        service: str,
+        token: str,
+        language: str = "de",
+        base_url: Optional[str] = None,
+        max_workers: int = WIKIFY_MAX_WORKERS,
+        rate: float = WIKIFY_RATE,
+        retries: int = 3,
+        backoff: float = 1.0,
+        timeout: float = 30.0,
+        session: Optional[requests.Session] = None,
+    ):
+        if service not in SERVICE_URLS:
+            raise ValueError(f"Unknown service: {service}")
+        self.service = service
+        self.token = token
+        self.language = language
+        self.base_url = base_url or SERVICE_URLS[service]
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, capacity=1.0)  # no burst, never exceed `rate` in any second
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+
+    def params(self, text: str, **extra: Any) -> dict[str, Any]:
+        """Form fields of a request.
+
+        Args:
+            text (str): Text to wikify.
+            **extra: Additional API parameters, e.g. `top_entities` for dandelion.
+
+        Returns:
+            dict[str, Any]: Form fields including language and token.
+        """
+        if self.service == "tagme":
+            return {
+                "lang": self.language,
+                "gcube-token": self.token,
+                "tweet": "false",
+                "text": text,
+                **extra,
+            }
+        return {"lang": self.language, "token": self.token, "text": text, **extra}
+
+    def annotate(self, text: str, **extra: Any) -> Optional[list[dict[str, Any]]]:
+        """Wikify a single text. Texts with less than `MIN_WORDS` words are skipped.
+
+        Args:
+            text (str): Text to wikify.
+            **extra: Additional API parameters, see `params`.
+
+        Raises:
+            OutOfCreditsError: If no credits are left.
+            requests.RequestException: If the request still fails after all retries.
+            ValueError: If the response is not json.
+
+        Returns:
+            Optional[list[dict[str, Any]]]: Annotations or None if nothing was detected.
+        """
+        return self._annotate(text, threading.Event(), **extra)
+
+    def _annotate(
+        self, text: str, out_of_credits: threading.Event, **extra: Any
+    ) -> Optional[list[dict[str, Any]]]:
+        """See `annotate`. `out_of_credits` is shared by the requests of a batch, once one of
+        them gets a 403 the others are not sent anymore."""
+        if len(text.split(" ")) < MIN_WORDS:
+            return None
+
+        for attempt in range(self.retries + 1):
+            if out_of_credits.is_set():
+                raise OutOfCreditsError(self.service)
+            self.bucket.acquire()
+            try:
+                with metrics.timer("wikify_request_seconds", service=self.service):
+                    responds = self.session.post(
+                        self.base_url, data=self.params(text, **extra), timeout=self.timeout
+                    )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.inc("wikify_requests_total", service=self.service, status=type(e).__name__)
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2**attempt)
+                continue
+
+            metrics.inc("wikify_requests_total", service=self.service, status=responds.status_code)
+            if responds.status_code == 403:
+                out_of_credits.set()
+                raise OutOfCreditsError(self.service)
+            if responds.status_code in RETRY_STATUS and attempt < self.retries:
+                wait = retry_after(responds)
+                time.sleep(self.backoff * 2**attempt if wait is None else wait)
+                continue
+            responds.raise_for_status()
+            return responds.json().get("annotations") or None
+        return None
+
+    def annotate_many(self, texts: Iterable[str], **extra: Any) -> Iterator[WikifyResult]:
+        """Wikify many texts concurrently. The results are yielded in the order of the texts as
+        soon as they are available. A failed request does not abort the run, its error is returned
+        in the result instead. If no credits are left, the pending requests are cancelled.
+
+        Args:
+            texts (Iterable[str]): Texts to wikify.
+            **extra: Additional API parameters, see `params`.
+
+        Raises:
+            OutOfCreditsError: If no credits are left. All results received before are yielded first.
+
+        Yields:
+            WikifyResult: Annotations or an error for each text.
+        """
+        max_pending = 2 * self.max_workers
+        out_of_credits = threading.Event()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending: deque[tuple[str, Future]] = deque()
+
+            def _collect() -> WikifyResult:
+                text, future = pending.popleft()
+                try:
+                    return WikifyResult(text, future.result(), None)
+                except OutOfCreditsError:
+                    for _, rest in pending:
+                        rest.cancel()
+                    raise
+                except (requests.RequestException, ValueError) as e:  # ValueError: not json
+                    return WikifyResult(text, None, f"{type(e).__name__}: {e}")
+
+            for text in texts:
+                future = executor.submit(self._annotate, text, out_of_credits, **extra)
+                pending.append((text, future))
+                if len(pending) >= max_pending:
+                    yield _collect()
+            while pending:
+                yield _collect()
+
+    def annotate_packed(
+        self, groups: Iterable[Sequence[str]], max_length: int = MAX_TEXT_LENGTH, **extra: Any
+    ) -> Iterator[WikifyResult]:
+        """Wikify many short texts with few requests. The consecutive texts of each group (e.g.
+        the sentences of a segment) are joined into requests of up to `max_length` chars and the
+        annotations are mapped back to the texts, see `pack_texts` and `unpack_annotations`.
+
+        Args:
+            groups (Iterable[Sequence[str]]): Groups of texts, texts of different groups are never packed together.
+            max_length (int, optional): Maximum length of a packed request. Defaults to MAX_TEXT_LENGTH.
+            **extra: Additional API parameters, see `params`.
+
+        Raises:
+            OutOfCreditsError: If no credits are left. All results received before are yielded first.
+
+        Yields:
+            WikifyResult: Annotations or an error for each text, in the order of the groups and texts.
+        """
+        packs: deque[list[str]] = deque()
+
+        def _packed_texts() -> Iterator[str]:
+            for texts in groups:
+                for indices in pack_texts(texts, max_length):
+                    pack = [texts[i] for i in indices]
+                    packs.append(pack)
+                    yield PACK_SEPARATOR.join(pack)
+
+        for result in self.annotate_many(_packed_texts(), **extra):
+            yield from unpack_annotations(packs.popleft(), result)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self) -> "WikifyClient":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@lru_cache(maxsize=None)
+def _client(service: str, token: str, language: str) -> WikifyClient:
+    """Shared client for the single text functions, so their connections are kept alive."""
+    return WikifyClient(service, token, language)
 
 
 def wifify(text: str, service: str, token: str, language: str = "de") -> Optional[Any]:
@@ -19,24 +323,12 @@ def wifify(text: str, service: str, token: str, language: str = "de") -> Optiona
     Returns:
         Optional[Any]: Result dictionary with detected nain_concepts if available or "Error" if not enough credits are left.
     """
-    if len(text.split(" ")) < 4:
-        return None
-
-    if service == "dandaleon":
-        api = f"https://api.dandelion.eu/datatxt/nex/v1/?lang={language}&text={text}&token={token}"
-        time.sleep(0.02)  # obey rate limit of 50 calls per second
-    elif service == "tagme":
-        api = f"https://tagme.d4science.org/tagme/tag?lang={language}&gcube-token={token}&tweet=false&text={text}"
-        time.sleep(0.02)
-
-    r = requests.get(api)
-    if r.status_code == 403:
+    try:
+        return _client(service, token, language).annotate(text)
+    except OutOfCreditsError:
         print("ERROR: not enough credits left.")
         return "Error"
-
-    if r.status_code == 200 and r.json().get("annotations"):
-        return r.json().get("annotations")
-    else:
+    except (requests.RequestException, ValueError):
         return None
 
 
@@ -55,22 +347,14 @@ def detect_main_concept(
     Returns:
         Optional[Any]: Result dictionary with detected nain_concepts if available or "Error" if not enough credits are left.
     """
-    if len(text.split(" ")) < 4:
-        return None
-
-    if len(text) > 4000:
+    if len(text) > MAX_TEXT_LENGTH:
         print("Error: Text is longer than 4000 chars.")
         return None
 
-    num_entetys_str: str = str(num_entetys)
-    api = f"https://api.dandelion.eu/datatxt/nex/v1/?lang={language}&text={text}&token={token}&top_entities={num_entetys_str}"
-    time.sleep(0.02)  # obey rate limit of 50 calls per second
-
-    r = requests.get(api)
-    if r.status_code == 403:
+    try:
+        return _client("dandaleon", token, language).annotate(text, top_entities=num_entetys)
+    except OutOfCreditsError:
         print("ERROR: not enough credits left.")
         return "Error"
-    if r.status_code == 200 and r.json().get("annotations"):
-        return r.json().get("annotations")
-    else:
+    except (requests.RequestException, ValueError):
         return None
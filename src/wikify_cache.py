@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""Persistent cache for wikification responses. Many sentences of the transcripts are identical
+or only differ in whitespace ("Vielen Dank.", moderator boilerplate, repeated questions), and the
+titles and introductions are wikified again on every rebuild. The cache stores the annotations in
+a SQLite database, keyed by service, language, request parameters and the SHA-256 of the
+normalized text. Entries expire after a TTL and the least recently used entries are evicted if
+the cache grows too large.
+
+`annotate_unique` deduplicates a workload before it is sent: each distinct text is requested at
+most once and the annotations are fanned out to all ids with that text.
+
+Examples:
+    cache = wikify_cache.WikifyCache("data/SMC_dataset/wikify_cache.db")
+    client = wikify.WikifyClient("tagme", token)
+    for sentence_ids, result in wikify_cache.annotate_unique(client, sentences, cache):
+        ...
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+import unicodedata
+import zlib
+from typing import Any, Hashable, Iterable, Iterator, Optional
+
+from config import WIKIFY_CACHE_MAX_BYTES, WIKIFY_CACHE_TTL
+from src import metrics
+from src.wikify import MIN_WORDS, WikifyClient, WikifyResult
+
+SQL_CHUNK_SIZE = 500  # host parameters per query
+FLUSH_SIZE = 100  # responses written per transaction
+
+
+def normalize_text(text: str) -> str:
+    """Normalize a text for the cache key: unicode NFC and collapsed whitespace.
+
+    Args:
+        text (str): Text to normalize.
+
+    Returns:
+        str: Normalized text.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 of the normalized text."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def request_params(**extra: Any) -> str:
+    """Fingerprint of the additional request parameters. Part of every cache key."""
+    return json.dumps(extra, sort_keys=True)
+
+
+class WikifyCache:
+    """SQLite store for wikification responses with TTL and size bounded LRU eviction.
+
+    Args:
+        path (str): Path to the cache database.
+        ttl (Optional[float], optional): Time to live of an entry in seconds, None to keep entries forever. Defaults to WIKIFY_CACHE_TTL.
+        max_bytes (int, optional): Maximum size of the stored (compressed) responses. Defaults to WIKIFY_CACHE_MAX_BYTES.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: Optional[float] = WIKIFY_CACHE_TTL,
+        max_bytes: int = WIKIFY_CACHE_MAX_BYTES,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS Response
+            (
+                service text NOT NULL,
+                language text NOT NULL,
+                params text NOT NULL,
+                text_hash text NOT NULL,
+                annotations blob NOT NULL,
+                size int NOT NULL,
+                created_at real NOT NULL,
+                last_access real NOT NULL,
+                PRIMARY KEY (service, language, params, text_hash)
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_response_last_access ON Response (last_access)"
+        )
+        self.connection.commit()
+
+    def get_many(
+        self, service: str, language: str, params: str, texts: Iterable[str]
+    ) -> dict[str, Optional[list[dict[str, Any]]]]:
+        """Get the cached annotations of many texts.
+
+        Args:
+            service (str): Name of the API.
+            language (str): Language of the texts.
+            params (str): Fingerprint of the request parameters, see `request_params`.
+            texts (Iterable[str]): Texts to look up.
+
+        Returns:
+            dict[str, Optional[list[dict[str, Any]]]]: Annotations (None if nothing was detected) by text hash for all cache hits.
+        """
+        hashes = list({text_hash(text) for text in texts})
+        min_created = time.time() - self.ttl if self.ttl is not None else 0.0
+        hits: dict[str, Optional[list[dict[str, Any]]]] = {}
+        for i in range(0, len(hashes), SQL_CHUNK_SIZE):
+            chunk = hashes[i : i + SQL_CHUNK_SIZE]
+            cur = self.connection.execute(
+                f"""SELECT text_hash, annotations FROM Response
+                WHERE service=? AND language=? AND params=? AND created_at>=?
+                AND text_hash IN ({", ".join("?" * len(chunk))})""",
+                (service, language, params, min_created, *chunk),
+            )
+            for key, annotations in cur:
+                hits[key] = json.loads(zlib.decompress(annotations))
+        now = time.time()
+        self.connection.executemany(
+            "UPDATE Response SET last_access=? WHERE service=? AND language=? AND params=? AND text_hash=?",
+            [(now, service, language, params, key) for key in hits],
+        )
+        self.connection.commit()
+        return hits
+
+    def get(
+        self, service: str, language: str, params: str, text: str
+    ) -> tuple[bool, Optional[list[dict[str, Any]]]]:
+        """Get the cached annotations of a text.
+
+        Returns:
+            tuple[bool, Optional[list[dict[str, Any]]]]: Whether the text was cached and its annotations.
+        """
+        hits = self.get_many(service, language, params, [text])
+        key = text_hash(text)
+        return key in hits, hits.get(key)
+
+    def put_many(
+        self,
+        service: str,
+        language: str,
+        params: str,
+        items: Iterable[tuple[str, Optional[list[dict[str, Any]]]]],
+    ):
+        """Store the annotations of many texts and evict entries if the cache grows larger than
+        `max_bytes`.
+
+        Args:
+            service (str): Name of the API.
+            language (str): Language of the texts.
+            params (str): Fingerprint of the request parameters, see `request_params`.
+            items (Iterable[tuple[str, Optional[list[dict[str, Any]]]]]): Texts and their annotations.
+        """
+        now = time.time()
+        rows = []
+        for text, annotations in items:
+            blob = zlib.compress(json.dumps(annotations).encode("utf-8"))
+            rows.append((service, language, params, text_hash(text), blob, len(blob), now, now))
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO Response (service, language, params, text_hash, annotations, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        self.connection.commit()
+        self.evict()
+
+    def put(
+        self,
+        service: str,
+        language: str,
+        params: str,
+        text: str,
+        annotations: Optional[list[dict[str, Any]]],
+    ):
+        """Store the annotations of a text, see `put_many`."""
+        self.put_many(service, language, params, [(text, annotations)])
+
+    def evict(self, max_bytes: Optional[int] = None):
+        """Delete expired entries and the least recently used entries until the cache is smaller
+        than `max_bytes`.
+
+        Args:
+            max_bytes (Optional[int], optional): Size limit. Defaults to the limit of the cache.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if self.ttl is not None:
+            self.connection.execute(
+                "DELETE FROM Response WHERE created_at<?", (time.time() - self.ttl,)
+            )
+        total = self.size()
+        if total > max_bytes:
+            cur = self.connection.execute(
+                "SELECT service, language, params, text_hash, size FROM Response ORDER BY last_access"
+            )
+            evict = []
+            for service, language, params, key, size in cur:
+                if total <= max_bytes:
+                    break
+                evict.append((service, language, params, key))
+                total -= size
+            self.connection.executemany(
+                "DELETE FROM Response WHERE service=? AND language=? AND params=? AND text_hash=?",
+                evict,
+            )
+        self.connection.commit()
+
+    def size(self) -> int:
+        """Size of all stored (compressed) responses in bytes."""
+        return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM Response").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+def annotate_unique(
+    client: WikifyClient,
+    items: Iterable[tuple[Hashable, str]],
+    cache: Optional[WikifyCache] = None,
+    groups: Optional[dict[Hashable, Hashable]] = None,
+    **extra: Any,
+) -> Iterator[tuple[list[Hashable], WikifyResult]]:
+    """Wikify a workload with each distinct (normalized) text sent at most once. Cached texts are
+    not sent at all. The normalized text is sent, so the `start`/`end` offsets of the annotations
+    refer to the normalized text. Packed results are cached apart from the results of single
+    texts.
+
+    Args:
+        client (WikifyClient): Client to send the requests with.
+        items (Iterable[tuple[Hashable, str]]): Ids (e.g. `sentence_ID`) and their texts.
+        cache (Optional[WikifyCache], optional): Response cache. Defaults to None.
+        groups (Optional[dict[Hashable, Hashable]], optional): Group of each id (e.g. its `segment_ID`). If given, the texts
+            of a group are packed into few requests, see `WikifyClient.annotate_packed`. Defaults to None.
+        **extra: Additional API parameters, see `WikifyClient.params`.
+
+    Raises:
+        OutOfCreditsError: If no credits are left. All results received before are yielded and cached first.
+
+    Yields:
+        tuple[list[Hashable], WikifyResult]: All ids with the same text and the result for that text.
+    """
+    ids_by_text: dict[str, list[Hashable]] = {}
+    for key, text in items:
+        ids_by_text.setdefault(normalize_text(text), []).append(key)
+
+    # packed annotations are found with the context of the neighbouring texts, unpacked
+    # lookups must not get them
+    params = request_params(**extra, **({"packed": True} if groups is not None else {}))
+    misses: dict[Hashable, list[str]] = {}  # texts to send by group
+    hits = {}
+    if cache is not None:
+        hits = cache.get_many(client.service, client.language, params, ids_by_text)
+    for text, ids in ids_by_text.items():
+        if len(text.split(" ")) < MIN_WORDS:
+            yield ids, WikifyResult(text, None, None)
+        elif (key := text_hash(text)) in hits:
+            metrics.inc("wikify_cache_hits_total", service=client.service)
+            yield ids, WikifyResult(text, hits[key] or None, None)
+        else:
+            metrics.inc("wikify_cache_misses_total", service=client.service)
+            misses.setdefault(groups.get(ids[0]) if groups is not None else None, []).append(text)
+
+    buffer: list[tuple[str, Optional[list[dict[str, Any]]]]] = []
+    try:
+        if groups is not None:
+            results = client.annotate_packed(misses.values(), **extra)
+        else:
+            results = client.annotate_many(misses.get(None, []), **extra)
+        for result in results:
+            if cache is not None and result.error is None:
+                buffer.append((result.text, result.annotations))
+                if len(buffer) >= FLUSH_SIZE:
+                    cache.put_many(client.service, client.language, params, buffer)
+                    buffer = []
+            yield ids_by_text[result.text], result
+    finally:
+        if cache is not None and buffer:
+            cache.put_many(client.service, client.language, params, buffer)
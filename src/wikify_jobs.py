@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""Resumable wikification of the sentences, titles and introductions. The progress is kept in
+the `Wikification_Job` table of the dataset (one job per target row and service) instead of a
+text file. Workers claim batches of jobs atomically, write the annotations and the job status of
+a batch in one transaction and record the attempts and the last error of failed jobs. A run can
+be stopped at any time (or run out of credits) and continues exactly where it stopped. Rows that
+already have results, e.g. from the notebook, are enqueued as done, so they are not wikified
+again.
+
+Examples:
+    wikify_jobs.enqueue(connection, "sentence", "tagme")
+    with wikify.WikifyClient("tagme", token) as client:
+        wikify_jobs.run(connection, "sentence", client, cache)
+    print(wikify_jobs.progress(connection, "sentence", "tagme"))
+"""
+
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from config import DEBUG
+from src import metrics, wikify_cache
+from src.wikify import OutOfCreditsError, WikifyClient
+
+JOB_LEASE = 600.0  # seconds until a running job of a crashed worker is claimed again
+CONFIDENCE_KEY = {"tagme": "link_probability", "dandaleon": "confidence"}
+
+
+def clean_introduction(text: str) -> str:
+    """Shorten an introduction and remove the link to the overview page and special whitespace."""
+    return (
+        text[:2000]
+        .replace("https://www.sciencemediacenter.de/alle-angebote", "")
+        .replace("\xa0", "")
+        .replace("\n", "")
+    )
+
+
+@dataclass(frozen=True)
+class WikifyTarget:
+    source_table: str
+    id_column: str
+    text_column: str
+    result_table: str
+    result_columns: tuple[str, ...]  # filled from the annotations, see `_annotation_row`
+    extra: dict[str, Any] = field(default_factory=dict)  # parameters for the dandelion api
+    clean: Optional[Callable[[str], str]] = None
+    group_column: Optional[str] = None  # texts of the same group can be packed into one request
+    cluster_table: Optional[str] = None  # near duplicates, see `dedup.cluster_sentences`
+
+
+TARGETS = {
+    "sentence": WikifyTarget(
+        "Sentence",
+        "sentence_ID",
+        "sentence",
+        "Sentence_Wikification",
+        ("term", "wiki_num", "confidence", "url"),
+        group_column="segment_ID",
+        cluster_table="Sentence_Cluster",
+    ),
+    "title": WikifyTarget(
+        "Press_Briefing",
+        "pb_ID",
+        "title",
+        "pb_Wikification_title",
+        ("term", "wiki_num", "confidence", "url"),
+    ),
+    "intro": WikifyTarget(
+        "Press_Briefing",
+        "pb_ID",
+        "introduction_text",
+        "pb_Wikification_intro",
+        ("wiki_num", "confidence", "url"),
+        {"top_entities": 5},
+        clean_introduction,
+    ),
+}
+
+
+def enqueue(
+    connection: sqlite3.Connection, target: str, service: str, representatives: bool = False
+) -> int:
+    """Create a pending job for every row of the target that has no job for the service yet.
+    Rows that already have results are enqueued as done instead, the results table is shared by
+    the services.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        target (str): One of `TARGETS`.
+        service (str): Name of the API. Either dandaleon or tagme.
+        representatives (bool, optional): Skip sentences that are near duplicates of another
+            sentence, see `dedup.cluster_sentences`. The results of a representative are copied
+            to the skipped sentences of its cluster when its job is done. Defaults to False.
+
+    Returns:
+        int: Number of new pending jobs.
+    """
+    spec = TARGETS[target]
+    where = ""
+    if representatives:
+        if spec.cluster_table is None:
+            raise ValueError(f"only sentences are clustered, not {target}")
+        where = f"""WHERE {spec.id_column} NOT IN
+            (SELECT {spec.id_column} FROM {spec.cluster_table} WHERE cluster_ID != {spec.id_column})"""
+    with connection:
+        connection.execute(
+            f"""INSERT OR IGNORE INTO Wikification_Job (target, target_ID, service, status)
+            SELECT DISTINCT ?, {spec.id_column}, ?, 'done' FROM {spec.result_table}
+            WHERE {spec.id_column} IN (SELECT {spec.id_column} FROM {spec.source_table})""",
+            (target, service),
+        )
+        cur = connection.execute(
+            f"""INSERT OR IGNORE INTO Wikification_Job (target, target_ID, service)
+            SELECT ?, {spec.id_column}, ? FROM {spec.source_table} {where}
+            ORDER BY {spec.id_column}""",
+            (target, service),
+        )
+    return cur.rowcount
+
+
+def claim(
+    connection: sqlite3.Connection,
+    target: str,
+    service: str,
+    batch_size: int = 500,
+    max_attempts: int = 3,
+) -> list[tuple[int, int]]:
+    """Atomically claim a batch of jobs. Failed jobs with attempts left and running jobs whose
+    lease expired are claimed again.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        target (str): One of `TARGETS`.
+        service (str): Name of the API.
+        batch_size (int, optional): Maximum number of jobs to claim. Defaults to 500.
+        max_attempts (int, optional): Maximum number of attempts per job. Defaults to 3.
+
+    Returns:
+        list[tuple[int, int]]: Claimed jobs as (job_ID, target_ID).
+    """
+    now = time.time()
+    connection.commit()
+    connection.execute("BEGIN IMMEDIATE")  # no other worker can claim in between
+    try:
+        connection.execute(
+            """UPDATE Wikification_Job SET status='pending'
+            WHERE target=? AND service=? AND ((status='failed' AND attempts<?) OR (status='running' AND claimed_at<?))""",
+            (target, service, max_attempts, now - JOB_LEASE),
+        )
+        jobs = connection.execute(
+            """SELECT job_ID, target_ID FROM Wikification_Job
+            WHERE target=? AND service=? AND status='pending' ORDER BY job_ID LIMIT ?""",
+            (target, service, batch_size),
+        ).fetchall()
+        connection.executemany(
+            "UPDATE Wikification_Job SET status='running', attempts=attempts+1, claimed_at=? WHERE job_ID=?",
+            [(now, job_id) for job_id, _ in jobs],
+        )
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    return jobs
+
+
+def _annotation_row(
+    spec: WikifyTarget, service: str, target_id: int, concept: dict[str, Any]
+) -> tuple[Any, ...]:
+    values = {
+        "term": concept.get("title"),
+        "wiki_num": concept.get("id"),
+        "confidence": concept.get(CONFIDENCE_KEY[service]),
+        "url": concept.get("uri"),
+    }
+    return (target_id, *(values[column] for column in spec.result_columns))
+
+
+def _cluster_members(
+    connection: sqlite3.Connection, target: str, service: str, representatives: list[int]
+) -> dict[int, int]:
+    """Members of the clusters of the given representatives that have no job of their own, i.e.
+    were skipped by `enqueue(..., representatives=True)`, mapped to their representative."""
+    spec = TARGETS[target]
+    if spec.cluster_table is None or not representatives:
+        return {}
+    return dict(
+        connection.execute(
+            f"""SELECT {spec.id_column}, cluster_ID FROM {spec.cluster_table}
+            WHERE cluster_ID IN ({", ".join("?" * len(representatives))}) AND {spec.id_column} != cluster_ID
+            AND {spec.id_column} NOT IN (SELECT target_ID FROM Wikification_Job WHERE target=? AND service=?)""",
+            (*representatives, target, service),
+        )
+    )
+
+
+def _finish(
+    connection: sqlite3.Connection,
+    target: str,
+    service: str,
+    jobs: list[tuple[int, int]],
+    done: dict[int, Optional[list[dict[str, Any]]]],
+    failed: dict[int, str],
+):
+    """Write the annotations and the status of a claimed batch in one transaction, the
+    annotations of a representative are copied to the members of its cluster. Jobs without a
+    result are released."""
+    spec = TARGETS[target]
+    now = time.time()
+    job_ids = {target_id: job_id for job_id, target_id in jobs}
+    members = _cluster_members(connection, target, service, list(done))
+    results = {**done, **{member: done[cluster_id] for member, cluster_id in members.items()}}
+    rows = [
+        _annotation_row(spec, service, target_id, concept)
+        for target_id, concepts in results.items()
+        for concept in concepts or []
+        if concept.get("id") is not None
+    ]
+    columns = ", ".join((spec.id_column, *spec.result_columns))
+    with metrics.timer("db_commit_seconds", table=spec.result_table), connection:
+        connection.executemany(  # a job may have been written before its lease expired
+            f"DELETE FROM {spec.result_table} WHERE {spec.id_column}=?",
+            [(target_id,) for target_id in results],
+        )
+        connection.executemany(
+            f"INSERT INTO {spec.result_table} ({columns}) VALUES ({', '.join('?' * (len(spec.result_columns) + 1))})",
+            rows,
+        )
+        connection.executemany(
+            "UPDATE Wikification_Job SET status='done', last_error=NULL, finished_at=? WHERE job_ID=?",
+            [(now, job_ids[target_id]) for target_id in done],
+        )
+        connection.executemany(
+            "UPDATE Wikification_Job SET status='failed', last_error=?, finished_at=? WHERE job_ID=?",
+            [(error, now, job_ids[target_id]) for target_id, error in failed.items()],
+        )
+        connection.executemany(
+            "UPDATE Wikification_Job SET status='pending', attempts=attempts-1 WHERE job_ID=?",
+            [
+                (job_id,)
+                for target_id, job_id in job_ids.items()
+                if target_id not in done and target_id not in failed
+            ],
+        )
+    metrics.inc("db_rows_inserted_total", len(rows), table=spec.result_table)
+    metrics.inc("wikify_jobs_total", len(done), table=spec.result_table, status="done")
+    metrics.inc("wikify_jobs_total", len(failed), table=spec.result_table, status="failed")
+
+
+def run(
+    connection: sqlite3.Connection,
+    target: str,
+    client: WikifyClient,
+    cache: Optional[wikify_cache.WikifyCache] = None,
+    batch_size: int = 500,
+    max_attempts: int = 3,
+    pack: bool = False,
+) -> dict[str, Any]:
+    """Process the jobs of a target until none are left or the credits run out.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        target (str): One of `TARGETS`.
+        client (WikifyClient): Client to send the requests with, its service selects the jobs.
+        cache (Optional[wikify_cache.WikifyCache], optional): Response cache. Defaults to None.
+        batch_size (int, optional): Number of jobs claimed at once. Defaults to 500.
+        max_attempts (int, optional): Maximum number of attempts per job. Defaults to 3.
+        pack (bool, optional): Pack consecutive sentences of a segment into one request, see
+            `WikifyClient.annotate_packed`. Defaults to False.
+
+    Returns:
+        dict[str, Any]: Progress after the run, see `progress`.
+    """
+    spec = TARGETS[target]
+    service = client.service
+    extra = spec.extra if service == "dandaleon" else {}
+    while jobs := claim(connection, target, service, batch_size, max_attempts):
+        target_ids = [target_id for _, target_id in jobs]
+        group_column = spec.group_column if pack and spec.group_column else "NULL"
+        texts = {}
+        groups = {}
+        for target_id, text, group in connection.execute(
+            f"""SELECT {spec.id_column}, COALESCE({spec.text_column}, ''), {group_column} FROM {spec.source_table}
+            WHERE {spec.id_column} IN ({", ".join("?" * len(target_ids))}) ORDER BY {spec.id_column}""",
+            target_ids,
+        ):
+            texts[target_id] = spec.clean(text) if spec.clean else text
+            groups[target_id] = group
+        done: dict[int, Optional[list[dict[str, Any]]]] = {
+            target_id: None for target_id in target_ids if target_id not in texts  # deleted rows
+        }
+        failed: dict[int, str] = {}
+        try:
+            for ids, result in wikify_cache.annotate_unique(
+                client, texts.items(), cache, groups if pack else None, **extra
+            ):
+                for target_id in ids:
+                    if result.error:
+                        failed[target_id] = result.error  # type: ignore
+                    else:
+                        done[target_id] = result.annotations
+        except OutOfCreditsError:
+            print("ERROR: not enough credits left.")
+            _finish(connection, target, service, jobs, done, failed)
+            break
+        _finish(connection, target, service, jobs, done, failed)
+        if DEBUG:
+            report = progress(connection, target, service)
+            print(f"{report['done']} of {report['total']} {target} jobs done.")
+    return progress(connection, target, service)
+
+
+def progress(
+    connection: sqlite3.Connection,
+    target: Optional[str] = None,
+    service: Optional[str] = None,
+    window: float = 600.0,
+) -> dict[str, Any]:
+    """Progress and throughput of the wikification jobs.
+
+    Args:
+        connection (sqlite3.Connection): Database connection object.
+        target (Optional[str], optional): Only count jobs of this target. Defaults to all targets.
+        service (Optional[str], optional): Only count jobs of this service. Defaults to all services.
+        window (float, optional): Time window for the throughput in seconds. Defaults to 600.
+
+    Returns:
+        dict[str, Any]: Number of jobs per status and in total, the throughput in jobs per second
+            and the estimated remaining time in seconds (None if nothing was finished in the window).
+    """
+    where, params = "WHERE 1=1", []
+    if target is not None:
+        where += " AND target=?"
+        params.append(target)
+    if service is not None:
+        where += " AND service=?"
+        params.append(service)
+
+    report: dict[str, Any] = {"pending": 0, "running": 0, "done": 0, "failed": 0}
+    for status, count in connection.execute(
+        f"SELECT status, COUNT(*) FROM Wikification_Job {where} GROUP BY status", params
+    ):
+        report[status] = count
+    report["total"] = sum(report.values())
+
+    since = time.time() - window
+    first, finished = connection.execute(
+        f"SELECT MIN(finished_at), COUNT(*) FROM Wikification_Job {where} AND finished_at>=?",
+        (*params, since),
+    ).fetchone()
+    elapsed = time.time() - first if first else 0.0
+    report["throughput"] = finished / elapsed if elapsed > 0 else None
+    remaining = report["pending"] + report["running"]
+    report["eta"] = remaining / report["throughput"] if report["throughput"] else None
+    return report
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Shared fixtures. The tests run offline, http is served by local stub servers."""
+
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Iterator
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+@pytest.fixture
+def serve() -> Iterator[Callable[[type[BaseHTTPRequestHandler]], str]]:
+    """Start a handler class on a local port in a background thread and return its url."""
+    servers: list[ThreadingHTTPServer] = []
+
+    def _serve(handler: type[BaseHTTPRequestHandler]) -> str:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}/"
+
+    yield _serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    """Stub of the SMC site. `files` maps a path (with query) to its body, every file is served
+    with a hash of its body as ETag and answers a matching If-None-Match with 304. All requests
+    are recorded as (path, status)."""
+
+    protocol_version = "HTTP/1.1"
+    files: dict[str, bytes] = {}
+    requests: list[tuple[str, int]] = []
+
+    def log_message(self, *args: Any):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        body = cls.files.get(self.path)
+        etag = f'"{hash(body)}"'
+        if body is None:
+            status, body = 404, b""
+        elif self.headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+        else:
+            status = 200
+        cls.requests.append((self.path, status))
+        self.send_response(status)
+        if status != 404:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def smc_files(pdfs: list[tuple[str, bytes]]) -> dict[str, bytes]:
+    """Overview page, one listing page and one press briefing site per pdf of the stub site."""
+    from src import load_data
+
+    files = {
+        load_data.OVERVIEW_PATH: b'<ul><li class="last page-item"><a>1</a></li></ul>',
+        load_data.LISTING_PATH.format(1)
+        .split("#")[0]: "".join(
+            f'<a class="m-news-list__link" href="/pb/{i}">Briefing {i}</a>'
+            for i in range(len(pdfs))
+        )
+        .encode(),
+    }
+    for i, (name, content) in enumerate(pdfs):
+        files[f"/pb/{i}"] = (
+            f"<html><body><main><h1>Briefing {i}</h1><p>Einleitung {i}.</p>"
+            f'<p>Transkript: <a href="/fileadmin/{name}">PDF</a></p></main></body></html>'
+        ).encode()
+        files[f"/fileadmin/{name}"] = content
+    return files
+
+
+@pytest.fixture
+def smc_site(serve) -> Callable[[list[tuple[str, bytes]]], tuple[str, type[SiteHandler]]]:
+    """Serve a stub SMC site with a press briefing per (pdf name, pdf content) and return its
+    base url without trailing slash and the handler class."""
+
+    def _smc_site(pdfs: list[tuple[str, bytes]]) -> tuple[str, type[SiteHandler]]:
+        handler = type("Handler", (SiteHandler,), {"files": smc_files(pdfs), "requests": []})
+        return serve(handler).rstrip("/"), handler
+
+    return _smc_site
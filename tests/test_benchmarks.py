@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Smoke test of the offline pipeline benchmark and its synthetic corpus."""
+
+import csv
+import json
+import os
+import subprocess
+import sys
+
+BENCHMARKS = os.path.join(os.path.dirname(__file__), "..", "benchmarks")
+sys.path.append(BENCHMARKS)
+
+import bench_pipeline  # type: ignore  # noqa: E402
+from synthetic import generate_corpus  # type: ignore  # noqa: E402
+
+from src import load_data  # noqa: E402
+
+STAGES = ["generate", "read_pdf", "extract_site", "parse_head", "parse_body", "sanetize"]
+
+
+def test_synthetic_corpus_is_deterministic(tmp_path):
+    rows = generate_corpus(str(tmp_path / "a"), 2, num_segments=4, seed=1)
+    again = generate_corpus(str(tmp_path / "b"), 2, num_segments=4, seed=1)
+    for row, other in zip(rows, again):
+        with open(row["pdf_path"], "rb") as f, open(other["pdf_path"], "rb") as g:
+            assert f.read() == g.read()
+    with open(tmp_path / "a" / "metadata.csv", newline="", encoding="utf-8") as f:
+        assert list(csv.DictReader(f)) == rows
+
+    with open(tmp_path / "a" / "html" / "Transkript_Synthetisch_00000.html", "rb") as f:
+        site = load_data.extrect_pressbriefing(f.read())
+    assert site["introduction"].startswith(rows[0]["introduction"])  # and the link paragraph
+    assert site["pdf_url"] == rows[0]["pdf_url"]
+
+
+def test_thresholds_and_baseline_are_checked():
+    results = {"10": {"parse_body": {"ms_per_item": 30.0}, "segment": {"skipped": "no punkt"}}}
+    assert bench_pipeline.check(results, {"parse_body": 50.0}) == []
+    assert bench_pipeline.check(results, {"parse_body": 20.0}) == [
+        "10/parse_body: 30.000ms > threshold 20.0ms"
+    ]
+    baseline = {"10": {"parse_body": {"ms_per_item": 10.0}}}
+    assert bench_pipeline.check(results, {}, baseline, tolerance=2) == [
+        "10/parse_body: 30.000ms > 2 x baseline 10.0ms"
+    ]
+
+
+def test_benchmark_writes_json_results(tmp_path):
+    output = str(tmp_path / "results.json")
+    process = subprocess.run(
+        [
+            sys.executable,
+            os.path.join(BENCHMARKS, "bench_pipeline.py"),
+            "--scales",
+            "2",
+            "--segments",
+            "6",
+            "--workers",
+            "1",
+            "--output",
+            output,
+        ],
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    with open(output, encoding="utf-8") as f:
+        results = json.load(f)
+
+    assert process.returncode == (1 if results["regressions"] else 0), process.stderr
+    stages = results["results"]["2"]
+    assert set(stages) == set(STAGES + ["import", "segment", "wikify"])
+    for stage in STAGES + ["import"]:
+        assert stages[stage]["items"] == 2 and stages[stage]["ms_per_item"] > 0
+    assert stages["wikify"]["items"] >= 4  # title and introduction jobs at least
+    assert results["meta"]["segments"] == 6
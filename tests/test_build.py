@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Import stage of the build on a synthetic corpus of the pipeline benchmark."""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from synthetic import generate_corpus  # type: ignore  # noqa: E402
+
+from src import build, metadata  # noqa: E402
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(build, "PDF_CACHE_PATH", str(tmp_path / "pdf_cache.db"))
+    generate_corpus(str(tmp_path), 3, num_segments=5)
+    return str(tmp_path / "dataset.db"), str(tmp_path / "metadata.csv")
+
+
+def _build(corpus) -> dict[str, build.Plan]:
+    return build.build(*corpus, stages=["parse", "import"], workers=1)
+
+
+def _press_briefings(db_path: str) -> list[tuple[int, str]]:
+    connection = sqlite3.connect(db_path)
+    rows = connection.execute(
+        "SELECT pb_ID, pdf_path FROM Press_Briefing ORDER BY pb_ID"
+    ).fetchall()
+    connection.close()
+    return rows
+
+
+def test_only_changed_records_are_imported_again(corpus):
+    assert len(_build(corpus)["import"]) == 3
+    assert _build(corpus)["import"] == {}
+
+    rows = metadata.read_metadata(corpus[1])
+    rows[1]["introduction"] += "Korrektur\n"
+    metadata.write_metadata(rows, corpus[1])
+    assert list(_build(corpus)["import"]) == [rows[1]["pdf_path"]]
+
+
+def test_press_briefings_without_build_state_are_adopted(corpus):
+    _build(corpus)
+    imported = _press_briefings(corpus[0])
+    connection = sqlite3.connect(corpus[0])
+    with connection:
+        connection.execute("DELETE FROM Build_State")  # imported by the notebook
+    connection.close()
+
+    assert len(_build(corpus)["import"]) == 3
+    assert _press_briefings(corpus[0]) == imported
+    assert _build(corpus)["import"] == {}
+
+
+def test_unknown_stages_are_rejected(corpus):
+    with pytest.raises(ValueError, match="segmnet"):
+        build.build(*corpus, stages=["import", "segmnet"])
+
+
+def test_dry_run_does_not_touch_the_database(corpus):
+    db_path, metadata_path = corpus
+    assert build.build(db_path, metadata_path, dry_run=True) == {}
+    assert not os.path.exists(db_path)
+
+    sqlite3.connect(db_path).close()  # empty database of an old version
+    assert build.build(db_path, metadata_path, dry_run=True) == {}
+    assert os.path.getsize(db_path) == 0
+
+    _build(corpus)
+    rows = metadata.read_metadata(metadata_path)
+    rows[0]["introduction"] += "Korrektur\n"
+    metadata.write_metadata(rows, metadata_path)
+    files = [db_path, build.PDF_CACHE_PATH]
+    before = [open(path, "rb").read() for path in files]
+
+    plans = build.build(db_path, metadata_path, stages=["parse", "import"], dry_run=True)
+
+    assert plans["parse"] == {} and list(plans["import"]) == [rows[0]["pdf_path"]]
+    assert [open(path, "rb").read() for path in files] == before
+
+
+def test_transcripts_are_parsed_once_per_build(corpus, monkeypatch):
+    from src import parse_pdf
+
+    parsed = []
+    parse_body = parse_pdf.parse_body
+    monkeypatch.setattr(
+        parse_pdf, "parse_body", lambda lines: parsed.append(1) or parse_body(lines)
+    )
+
+    _build(corpus)
+
+    assert len(parsed) == 3
+    assert len(_press_briefings(corpus[0])) == 3
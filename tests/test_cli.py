@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+from nltk.tokenize.punkt import PunktSentenceTokenizer  # type: ignore
+
+from src import cli, create_db, split_sentences
+
+
+def test_check_does_not_create_the_database(tmp_path, capsys):
+    path = tmp_path / "dataset.db"
+
+    assert cli.main(["--db", str(path), "check"]) == 1
+    assert not path.exists()
+    assert "No database" in capsys.readouterr().out
+
+
+def test_check_does_not_migrate(tmp_path, capsys):
+    path = tmp_path / "dataset.db"
+    sqlite3.connect(path).close()  # empty file of an interrupted import
+
+    assert cli.main(["--db", str(path), "check"]) == 1
+    assert "schema version: 0" in capsys.readouterr().out
+    connection = sqlite3.connect(path)
+    assert connection.execute("SELECT name FROM sqlite_master").fetchall() == []
+    create_db.migrate(connection)
+    connection.close()
+
+    assert cli.main(["--db", str(path), "check"]) == 0
+
+
+def test_export_opens_the_database_read_only(tmp_path, capsys):
+    path = tmp_path / "dataset.db"
+    output = str(tmp_path / "export.csv")
+
+    assert cli.main(["--db", str(path), "export", "--output", output]) == 1
+    assert not path.exists()
+    assert "No database" in capsys.readouterr().out
+
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE t (a)")
+    connection.execute("INSERT INTO t VALUES (1)")
+    connection.commit()
+    connection.close()
+    query = "SELECT a FROM t"
+    assert cli.main(["--db", str(path), "export", "--output", output, "--query", query]) == 0
+    assert "1 rows exported" in capsys.readouterr().out
+
+
+def test_segment_migrates_an_old_database(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(
+        split_sentences, "load_punkt", lambda language="german": PunktSentenceTokenizer()
+    )
+    path = tmp_path / "dataset.db"
+    connection = sqlite3.connect(path)
+    create_db.create_tables(connection)  # schema of the notebook, without `Segment.split`
+    connection.execute("INSERT INTO Segment (pb_ID, text) VALUES (1, 'Ein Satz. Noch ein Satz.')")
+    connection.commit()
+    connection.close()
+
+    assert cli.main(["--db", str(path), "--workers", "1", "segment"]) == 0
+    assert "2 sentences inserted." in capsys.readouterr().out
+    connection = sqlite3.connect(path)
+    assert create_db.schema_version(connection) == create_db.MIGRATIONS[-1][0]
+    assert connection.execute("SELECT split FROM Segment").fetchall() == [(1,)]
+    connection.close()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import sys
+
+import pytest
+
+from src import create_db, resolve_speakers
+
+
+def _migrate_to(connection: sqlite3.Connection, version: int):
+    create_db.create_version_table(connection)
+    for migration_version, description, migration in create_db.MIGRATIONS[:version]:
+        migration(connection)
+        connection.execute(
+            "INSERT INTO Schema_Version (version, description) VALUES (?, ?)",
+            (migration_version, description),
+        )
+    connection.commit()
+
+
+def test_migrations_keep_duplicate_persons_for_resolve():
+    connection = sqlite3.connect(":memory:")
+    _migrate_to(connection, 1)
+    connection.executemany(
+        "INSERT INTO Person (person_ID, name, afiliation, resort) VALUES (?, ?, ?, ?)",
+        [
+            (1, "Christian  Drosten", None, "Virologie"),
+            (2, "christian drosten", "Charité Berlin", None),
+            (3, "MÜLLER", None, None),
+            (4, "müller", "Universität Kiel", None),
+        ],
+    )
+    connection.execute("INSERT INTO Segment (pb_ID, text, speaker) VALUES (1, 'Text', 2)")
+    connection.commit()
+
+    create_db.migrate(connection)
+
+    assert connection.execute(
+        "SELECT person_ID, name_key FROM Person ORDER BY person_ID"
+    ).fetchall() == [
+        (1, "christian drosten"),
+        (2, "christian drosten"),
+        (3, "müller"),
+        (4, "müller"),
+    ]
+    assert all(uses_index for uses_index, _ in create_db.check_query_plans(connection).values())
+
+    resolve_speakers.resolve_speakers(connection)
+
+    assert connection.execute(
+        "SELECT person_ID, afiliation, resort FROM Person ORDER BY person_ID"
+    ).fetchall() == [(1, "Charité Berlin", "Virologie"), (3, "Universität Kiel", None)]
+    assert connection.execute("SELECT speaker FROM Segment").fetchall() == [(1,)]
+
+
+def test_import_uses_name_key():
+    connection = sqlite3.connect(":memory:")
+    create_db.migrate(connection)
+    record = {"title": "Titel", "segments": [{"speaker": "Sandra  Ciesek", "text": "Text"}]}
+    create_db.import_press_briefings(connection, [record])
+    record["segments"][0]["speaker"] = "SANDRA CIESEK"
+    create_db.import_press_briefings(connection, [record])
+    assert connection.execute("SELECT name, name_key FROM Person").fetchall() == [
+        ("Sandra  Ciesek", "sandra ciesek")
+    ]
+
+
+def test_title_page_persons_of_imported_briefings_are_read(tmp_path):
+    sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+    from synthetic import generate_corpus  # type: ignore
+
+    (row,) = generate_corpus(str(tmp_path), 1, num_segments=2)
+    connection = sqlite3.connect(":memory:")
+    create_db.migrate(connection)
+    connection.execute("INSERT INTO Press_Briefing (pdf_path) VALUES (?)", (row["pdf_path"],))
+    connection.execute("INSERT INTO Press_Briefing (pdf_path) VALUES ('missing.pdf')")
+    connection.commit()
+
+    assert create_db.backfill_head_persons(connection) > 0
+    assert create_db.backfill_head_persons(connection) == 0
+
+    head_persons = connection.execute("SELECT pb_ID, name FROM Head_Person").fetchall()
+    assert head_persons and {pb_ID for pb_ID, _ in head_persons} == {1}
+
+
+def test_bulk_import_of_press_briefings(tmp_path):
+    connection = sqlite3.connect(str(tmp_path / "smc.db"))
+    create_db.migrate(connection)
+    synchronous = connection.execute("PRAGMA synchronous").fetchone()[0]
+    records = [
+        {
+            "title": f"Titel {i}",
+            "pdf_path": f"{i}.pdf",
+            "segments": [
+                {"speaker": "Volker Stollorz", "text": "Frage", "timecode": "00:00"},
+                {"speaker": "Sandra Ciesek" if i else "Christian Drosten", "text": "Antwort"},
+                {"speaker": "Volker  Stollorz", "text": ""},  # dropped, empty text
+            ],
+            "guests": [{"name": "Prof. Dr. Sandra Ciesek", "description": " Virologin"}],
+        }
+        for i in range(2)
+    ]
+    records.append(dict(records[0], pdf_path="broken.pdf", date=object()))  # not bindable
+
+    imported = create_db.import_press_briefings(connection, records[:2], bulk_load=True)
+    assert imported == [1, 2]
+    with pytest.raises(sqlite3.Error):
+        create_db.import_press_briefings(connection, records[1:], bulk_load=True)
+
+    assert connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    assert connection.execute("PRAGMA synchronous").fetchone()[0] == synchronous
+    assert connection.execute("SELECT pdf_path FROM Press_Briefing").fetchall() == [
+        ("0.pdf",),
+        ("1.pdf",),
+        ("1.pdf",),
+    ]  # the transaction of the broken record was rolled back
+    assert connection.execute("SELECT person_ID, name FROM Person").fetchall() == [
+        (1, "Volker Stollorz"),
+        (2, "Christian Drosten"),
+        (3, "Sandra Ciesek"),
+    ]
+    assert connection.execute("SELECT pb_ID, speaker, text FROM Segment").fetchall() == [
+        (1, 1, "Frage"),
+        (1, 2, "Antwort"),
+        (2, 1, "Frage"),
+        (2, 3, "Antwort"),
+        (3, 1, "Frage"),
+        (3, 3, "Antwort"),
+    ]
+    assert connection.execute("SELECT * FROM is_guest ORDER BY pb_ID").fetchall() == [
+        (1, 1),
+        (1, 2),
+        (2, 1),
+        (2, 3),
+        (3, 1),
+        (3, 3),
+    ]
+    assert connection.execute("SELECT COUNT(*) FROM Head_Person").fetchone() == (3,)
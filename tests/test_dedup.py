@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Near-duplicate clustering on a small synthetic corpus."""
+
+import os
+import random
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from synthetic import _sentence  # type: ignore  # noqa: E402
+
+from src import create_db, dedup  # noqa: E402
+
+LONG = (
+    "Wir sehen in den Daten der letzten Wochen einen deutlichen Anstieg der Infektionen "
+    "bei Kindern und Jugendlichen in allen Bundesländern"
+)
+DUPLICATES = {  # sentence_ID: text, near duplicates of the sentences 3 and 5
+    3: "Vielen Dank für die Frage.",
+    11: "vielen Dank  für die Frage!",
+    14: "Vielen Dank, für die Frage",
+    5: LONG + ".",
+    12: LONG + " gesehen.",
+    8: "Die Zahl der Infektionen steigt in Berlin.",  # similar, but not a duplicate
+    15: "Die Zahl der Impfungen sinkt in Bayern.",
+}
+
+
+@pytest.fixture
+def connection() -> sqlite3.Connection:
+    rng = random.Random(0)
+    texts = {i: _sentence(rng) for i in range(1, 21)}
+    texts.update(DUPLICATES)
+    connection = sqlite3.connect(":memory:")
+    create_db.migrate(connection)
+    connection.executemany(
+        "INSERT INTO Sentence (sentence_ID, pb_ID, segment_ID, sentence) VALUES (?, 1, 1, ?)",
+        sorted(texts.items()),
+    )
+    connection.commit()
+    return connection
+
+
+def _clusters(connection: sqlite3.Connection) -> dict[int, list[int]]:
+    clusters: dict[int, list[int]] = {}
+    for sentence_ID, cluster_ID in connection.execute(
+        "SELECT sentence_ID, cluster_ID FROM Sentence_Cluster ORDER BY sentence_ID"
+    ):
+        clusters.setdefault(cluster_ID, []).append(sentence_ID)
+    return {cluster_ID: ids for cluster_ID, ids in clusters.items() if len(ids) > 1}
+
+
+def test_near_duplicates_are_clustered_under_the_lowest_id(connection):
+    report = dedup.cluster_sentences(connection)
+
+    assert report == {"sentences": 20, "clusters": 2, "duplicates": 3}
+    assert _clusters(connection) == {3: [3, 11, 14], 5: [5, 12]}
+    assert connection.execute("SELECT COUNT(*) FROM Sentence_Cluster").fetchone() == (20,)
+
+
+def test_rerun_keeps_the_clusters_and_their_representatives(connection):
+    dedup.cluster_sentences(connection)
+    table = connection.execute("SELECT * FROM Sentence_Cluster ORDER BY sentence_ID").fetchall()
+
+    assert dedup.cluster_sentences(connection, batch_size=3)["duplicates"] == 3
+    assert (
+        connection.execute("SELECT * FROM Sentence_Cluster ORDER BY sentence_ID").fetchall()
+        == table
+    )
+
+    connection.execute(
+        "INSERT INTO Sentence (sentence_ID, pb_ID, segment_ID, sentence) VALUES (21, 2, 2, ?)",
+        ("VIELEN DANK FÜR DIE FRAGE",),
+    )
+    dedup.cluster_sentences(connection)
+    assert _clusters(connection) == {3: [3, 11, 14, 21], 5: [5, 12]}
+
+
+def test_representatives_drop_cluster_members(connection):
+    dedup.cluster_sentences(connection)
+    records = [{"sentence_ID": i} for i in range(1, 22)]  # 21 is not clustered yet
+    kept = [r["sentence_ID"] for r in dedup.representatives(connection, records)]
+    assert kept == [i for i in range(1, 22) if i not in (11, 12, 14)]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+import sys
+
+import pytest
+
+from src import export
+
+QUERY = "SELECT a, b, c FROM t ORDER BY rowid"
+ROWS = [(None, 1, "x"), (None, 2, None), (5, 2.5, "z"), (6, None, "w")]
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE t (a, b, c)")
+    connection.executemany("INSERT INTO t VALUES (?, ?, ?)", ROWS)
+    return connection
+
+
+def test_column_types_cover_all_chunks(connection):
+    columns, _ = export.iter_chunks(connection, QUERY)
+
+    assert export._column_types(connection, QUERY, columns) == (
+        ["int64", "float64", "text"],
+        [True, True, True],
+    )
+
+
+def test_fallback_snapshot_keeps_types_and_nulls(connection, tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)  # the fallback format
+    path = str(tmp_path / "snapshot")
+
+    assert export.write_snapshot(connection, path, QUERY, chunk_size=2) == 4
+    snapshot = export.read_snapshot(path)
+
+    assert snapshot["a"].tolist() == [None, None, 5, 6]
+    assert snapshot["b"].dtype == "float64"
+    assert snapshot["b"].tolist()[:3] == [1.0, 2.0, 2.5] and snapshot["b"].mask[3]
+    assert list(snapshot["c"]) == ["x", None, "z", "w"]
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Full text search over sentences and segments."""
+
+import sqlite3
+
+import pytest
+
+from src import create_db
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    create_db.migrate(connection)
+    connection.execute("INSERT INTO Segment (segment_ID, pb_ID, text) VALUES (1, 1, 'Text')")
+    connection.executemany(
+        "INSERT INTO Sentence (sentence_ID, pb_ID, segment_ID, sentence) VALUES (?, 1, 1, ?)",
+        [
+            (1, "Das Corona-Virus verbreitet sich schnell."),
+            (2, "SARS-CoV-2 ist ein Coronavirus."),
+            (3, "Der R-Wert liegt über eins."),
+            (4, "Was ist das? Eine Impfung."),
+            (5, "Die Impfstoffe wirken."),
+        ],
+    )
+    create_db.create_fulltext_index(connection)
+    connection.commit()
+    return connection
+
+
+def _ids(connection, query: str, **kwargs) -> list[int]:
+    return sorted(r["sentence_ID"] for r in create_db.search_sentences(connection, query, **kwargs))
+
+
+def test_query_terms_are_quoted():
+    assert create_db.fts_query('SARS-CoV-2  "Impf*') == '"SARS-CoV-2" """Impf"*'
+    assert create_db.fts_query("*") == '"*"'
+
+
+@pytest.mark.parametrize(
+    "query, ids",
+    [
+        ("Corona-Virus", [1]),
+        ("SARS-CoV-2", [2]),
+        ("R-Wert", [3]),
+        ("Was ist das?", [4]),
+        ("Impf*", [4, 5]),
+        ("impfstoffe", [5]),
+        ("Impfung Virus", []),
+    ],
+)
+def test_search_with_punctuation(connection, query, ids):
+    assert _ids(connection, query) == ids
+
+
+def test_raw_queries_use_fts5_syntax(connection):
+    assert _ids(connection, "Impfung OR Virus", raw=True) == [1, 4]
+    with pytest.raises(sqlite3.OperationalError):
+        _ids(connection, "SARS-CoV-2", raw=True)
+
+
+def test_triggers_keep_the_index_in_sync(connection):
+    connection.execute(
+        "INSERT INTO Sentence (sentence_ID, pb_ID, segment_ID, sentence) "
+        "VALUES (6, 1, 1, 'Die Maskenpflicht gilt.')"
+    )
+    assert _ids(connection, "Maskenpflicht") == [6]
+
+    connection.execute(
+        "UPDATE Sentence SET sentence = 'Die Testpflicht gilt.' WHERE sentence_ID = 6"
+    )
+    assert _ids(connection, "Maskenpflicht") == []
+    assert _ids(connection, "Testpflicht") == [6]
+
+    connection.execute("DELETE FROM Sentence WHERE sentence_ID = 6")
+    assert _ids(connection, "Testpflicht") == []
+
+    connection.execute("UPDATE Segment SET text = 'Neuer R-Wert' WHERE segment_ID = 1")
+    assert [r["segment_ID"] for r in create_db.search_segments(connection, "R-Wert")] == [1]
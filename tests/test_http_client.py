@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from typing import Any
+
+import requests
+
+from src import http_client
+
+
+class _SlowHandler(BaseHTTPRequestHandler):
+    """Answers after 50ms and records the maximum number of requests in flight."""
+
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def log_message(self, *args: Any):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(0.05)
+        with cls.lock:
+            cls.in_flight -= 1
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+
+def test_token_bucket_limits_rate():
+    bucket = http_client.TokenBucket(rate=20, capacity=1)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.monotonic() - start >= 5 / 20 * 0.9  # the first token is available at once
+
+
+def test_polite_session_limits_concurrency_per_host(serve):
+    url = serve(_SlowHandler)
+    with http_client.PoliteSession(host_concurrency=2, rate=1000) as session:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            statuses = list(executor.map(lambda _: session.get(url).status_code, range(8)))
+    assert statuses == [200] * 8
+    assert _SlowHandler.max_in_flight == 2
+
+
+def test_streamed_response_holds_its_slot_until_closed(serve):
+    url = serve(_SlowHandler)
+    with http_client.PoliteSession(host_concurrency=1, rate=1000) as session:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            streamed = session.get(url, stream=True)
+            second = executor.submit(session.get, url)
+            time.sleep(0.2)
+            assert not second.done()  # the streamed body is not read yet
+            streamed.close()
+            assert second.result(timeout=5).status_code == 200
+
+            streamed = session.get(url, stream=True)
+            assert streamed.content == b"ok"  # reading the body to the end releases the slot too
+            assert executor.submit(session.get, url).result(timeout=5).status_code == 200
+
+            with session.get(url, stream=True):
+                pass
+            assert session.get(url, timeout=5).status_code == 200
+
+
+BODY = bytes(range(256)) * 40
+ETAG = '"v1"'
+
+
+class _FileHandler(BaseHTTPRequestHandler):
+    """Serves BODY with Range and If-Range support and records the Range headers."""
+
+    ranges: list[Any] = []
+
+    def log_message(self, *args: Any):
+        pass
+
+    def do_GET(self):
+        type(self).ranges.append(self.headers.get("Range"))
+        start = self.start()
+        if start is None:
+            self.send_response(200)
+        else:
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(BODY) - 1}/{len(BODY)}")
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(BODY) - (start or 0)))
+        self.end_headers()
+        self.wfile.write(BODY[start or 0 :])
+
+    def start(self) -> Any:
+        """Offset of the response body, None for a full response."""
+        requested = self.headers.get("Range")
+        if requested and self.headers.get("If-Range") == ETAG:
+            return int(requested[len("bytes=") : -1])
+        return None
+
+
+def _write_part(dest: str, data: bytes, validator: str = ETAG):
+    with open(dest + ".part", "wb") as f:
+        f.write(data)
+    with open(dest + ".part.validator", "w") as f:
+        f.write(validator)
+
+
+def test_download_resumes_part(serve, tmp_path):
+    class _Resume(_FileHandler):
+        ranges: list[Any] = []
+
+    dest = str(tmp_path / "transcript.pdf")
+    _write_part(dest, BODY[:1000])
+
+    result = http_client.download_file(requests.Session(), serve(_Resume), dest)
+
+    assert _Resume.ranges == ["bytes=1000-"]
+    assert result.status == 206 and result.size == len(BODY)
+    with open(dest, "rb") as f:
+        assert f.read() == BODY
+
+
+def test_download_restarts_on_mismatched_range(serve, tmp_path):
+    class _WrongRange(_FileHandler):
+        ranges: list[Any] = []
+
+        def start(self) -> Any:  # answers every Range request from the start of the file
+            return 0 if self.headers.get("Range") else None
+
+    dest = str(tmp_path / "transcript.pdf")
+    _write_part(dest, b"x" * 1000)
+
+    result = http_client.download_file(requests.Session(), serve(_WrongRange), dest, backoff=30)
+
+    assert _WrongRange.ranges == ["bytes=1000-", None]
+    assert result.status == 200
+    with open(dest, "rb") as f:
+        assert f.read() == BODY
+
+
+def test_download_waits_retry_after(serve, tmp_path):
+    class _Busy(_FileHandler):
+        ranges: list[Any] = []
+
+        def do_GET(self):
+            if not type(self).ranges:
+                type(self).ranges.append("busy")
+                self.send_response(503)
+                self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            super().do_GET()
+
+    dest = str(tmp_path / "transcript.pdf")
+    start = time.monotonic()
+    result = http_client.download_file(requests.Session(), serve(_Busy), dest, backoff=30)
+    assert time.monotonic() - start < 10  # the backoff of 30s was replaced by Retry-After
+    assert result.status == 200 and result.size == len(BODY)
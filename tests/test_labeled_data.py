@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+import config
+from src import labeled_data
+
+
+def test_index_directory_is_outside_the_dataset():
+    base_dir = os.path.abspath(config.BASE_DIR) + os.sep
+    assert not os.path.abspath(config.LABELED_INDEX_DIR).startswith(base_dir)
+
+
+def test_default_index_is_kept_out_of_the_data_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(labeled_data, "LABELED_INDEX_DIR", str(tmp_path / "index"))
+    data = tmp_path / "labeled"
+    data.mkdir()
+    path = data / "claims.jsonl"
+    path.write_text(
+        "".join(json.dumps({"sentence_ID": i, "prob": i / 10}) + "\n" for i in range(5)),
+        encoding="utf-8",
+    )
+
+    dataset = labeled_data.JsonlDataset(str(path))
+
+    assert [record["sentence_ID"] for record in dataset.select(min_prob=0.3)] == [3, 4]
+    assert [p.name for p in data.iterdir()] == ["claims.jsonl"]
+    assert dataset.index_path.startswith(str(tmp_path / "index"))
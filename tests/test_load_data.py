@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pandas as pd  # type: ignore
+from bs4 import BeautifulSoup  # type: ignore
+
+from src import load_data
+from src.http_client import PoliteSession
+
+TESTS_DIR = os.path.dirname(__file__)
+
+SITE = """<html><body>
+<nav><p>Navigation</p><h1>Science Media Center</h1></nav>
+<main>
+<h1>Was wissen wir über Impfstoffe?</h1>
+<time datetime="2021-03-04">04.03.2021</time>
+<p>Erster Absatz.</p>
+<p>Transkript: <a href="/fileadmin/Transkript_Impfstoffe.pdf">PDF</a></p>
+</main>
+<footer><p>Impressum</p></footer>
+</body></html>"""
+
+
+def test_extrect_pressbriefing_reads_article_only():
+    site = load_data.extrect_pressbriefing(SITE)
+    assert site == {
+        "introduction": "Erster Absatz.\nTranskript: PDF\n",
+        "pdf_url": "/fileadmin/Transkript_Impfstoffe.pdf",
+        "title": "Was wissen wir über Impfstoffe?",
+        "date": "2021-03-04",
+    }
+
+
+def test_extrect_pressbriefing_without_article_reads_page():
+    site = load_data.extrect_pressbriefing(SITE.replace("main>", "div>"))
+    assert site["introduction"].startswith("Navigation\n")
+    assert site["title"] == "Science Media Center"
+    assert site["pdf_url"] == "/fileadmin/Transkript_Impfstoffe.pdf"
+
+
+def test_extrect_pressbriefing_of_saved_site():
+    # saved site of the first press briefing in metadata.csv, with the newsletter form and
+    # footer paragraphs that the recorded introduction picked up from the whole page
+    with open(os.path.join(TESTS_DIR, "data", "press_briefing_teststrategie.html"), "rb") as f:
+        html = f.read()
+    metadata = pd.read_csv(os.path.join(TESTS_DIR, "..", "data", "SMC_dataset", "metadata.csv"))
+    metadata = metadata.iloc[0]
+    legacy = load_data.extrect_introduction(BeautifulSoup(html, "html.parser"))
+    assert legacy == metadata["introduction"]
+
+    site = load_data.extrect_pressbriefing(html)
+    assert site["introduction"] == legacy.split("Die Felder mit einem * sind Pflichtfelder\n")[0]
+    assert site["introduction"].endswith("SARS-CoV-2. Bundesanzeiger.\n")
+    assert "https://www.sciencemediacenter.de" + site["pdf_url"] == metadata["pdf_url"]
+    assert site["title"] == "Welche nationale Teststrategie bringt uns optimal durch den Winter?"
+
+
+def test_crawl_and_extract_press_briefings_of_stub_site(smc_site):
+    url, handler = smc_site([("Transkript_A.pdf", b"%PDF a"), ("Transkript_B.pdf", b"%PDF b")])
+    with PoliteSession(host_concurrency=2, rate=1000) as session:
+        pages = load_data.crawl_pressbriefings(url, max_workers=2, session=session)
+    assert list(pages) == [f"{url}/pb/0", f"{url}/pb/1"]
+
+    sites = load_data.extrect_pressbriefings(list(pages.values()), max_workers=2)
+    assert sites == [
+        {
+            "introduction": f"Einleitung {i}.\nTranskript: PDF\n",
+            "pdf_url": f"/fileadmin/Transkript_{name}.pdf",
+            "title": f"Briefing {i}",
+            "date": None,
+        }
+        for i, name in enumerate("AB")
+    ]
+
+    del handler.files["/pb/0"]
+    assert list(load_data.crawl_pressbriefings(url, max_workers=2, rate=1000)) == [f"{url}/pb/1"]
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Metrics registry, export formats, worker snapshots and profiling hooks."""
+
+import json
+import os
+import pstats
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from synthetic import write_pdf  # type: ignore  # noqa: E402
+
+from src import metrics, parse_pdf  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def registry():
+    metrics.reset()
+    yield
+    metrics.reset()
+    metrics.disable_profiling()
+
+
+def test_counters_and_histograms():
+    metrics.inc("api_calls_total", service="tagme")
+    metrics.inc("api_calls_total", 2, service="tagme")
+    metrics.inc("api_calls_total", service="dandaleon")
+    for value in (0.002, 0.002, 7.0, 100.0):
+        metrics.observe("request_seconds", value)
+    with pytest.raises(ValueError), metrics.timer("pdf_read_seconds"):
+        raise ValueError  # observed anyway
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == [
+        {"name": "api_calls_total", "labels": {"service": "dandaleon"}, "value": 1},
+        {"name": "api_calls_total", "labels": {"service": "tagme"}, "value": 3},
+    ]
+    histograms = {h["name"]: h for h in snapshot["histograms"]}
+    assert histograms["request_seconds"]["buckets"] == [0, 2, 0, 0, 0, 0, 0, 0, 1, 0, 1]
+    assert histograms["request_seconds"]["sum"] == pytest.approx(107.004)
+    assert histograms["pdf_read_seconds"]["count"] == 1
+    assert json.loads(metrics.to_json()) == snapshot
+
+
+def test_prometheus_text_format():
+    metrics.inc("rows_inserted_total", 5, table='Press "Briefing"')
+    metrics.observe("request_seconds", 0.02)
+
+    lines = metrics.to_prometheus().splitlines()
+    assert lines[:2] == [
+        "# TYPE rows_inserted_total counter",
+        'rows_inserted_total{table="Press \\"Briefing\\""} 5',
+    ]
+    assert lines[2] == "# TYPE request_seconds histogram"
+    assert 'request_seconds_bucket{le="0.01"} 0' in lines
+    assert 'request_seconds_bucket{le="0.05"} 1' in lines
+    assert lines[-3:] == [
+        'request_seconds_bucket{le="+Inf"} 1',
+        "request_seconds_sum 0.02",
+        "request_seconds_count 1",
+    ]
+
+
+def test_collected_snapshots_are_merged():
+    metrics.inc("pdf_pages_total")
+    with metrics.collect() as collected:
+        metrics.inc("pdf_pages_total", 2)
+        metrics.observe("pdf_read_seconds", 0.5)
+    assert metrics.snapshot()["counters"][0]["value"] == 1  # recorded apart
+
+    metrics.merge(collected)
+    metrics.merge(collected)
+    metrics.merge(None)
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"][0]["value"] == 5
+    assert snapshot["histograms"][0]["count"] == 2
+
+
+def test_metrics_of_worker_processes_are_merged(tmp_path):
+    paths = []
+    for i in range(3):
+        paths.append(str(tmp_path / f"{i}.pdf"))
+        write_pdf(paths[-1], [[f"Titel {i}"], ["Text"], ["Impressum"]])
+
+    assert all(result.error is None for result in parse_pdf.read_pdfs(paths, max_workers=2))
+    assert metrics.REGISTRY.counters[("pdf_pages_total", ())] == 9
+
+
+def test_profiles_of_the_slowest_inputs_are_kept(tmp_path):
+    directory = str(tmp_path / "profiles")
+    metrics.enable_profiling(directory, top_n=2, memory=True)
+    for key, seconds in [("fast.pdf", 0.0), ("slow.pdf", 0.05), ("medium.pdf", 0.02)]:
+        with metrics.profile("read_pdf", key):
+            with metrics.profile("read_pdf", "nested"):  # not profiled again
+                time.sleep(seconds)
+
+    profiles = sorted(f for f in os.listdir(directory) if f.endswith(".prof"))
+    assert [f.split("-", 2)[2] for f in profiles] == ["medium.pdf.prof", "slow.pdf.prof"]
+    assert len([f for f in os.listdir(directory) if f.endswith(".mem.txt")]) == 2
+    pstats.Stats(os.path.join(directory, profiles[-1]))  # readable
+
+    metrics.disable_profiling()
+    with metrics.profile("read_pdf", "unprofiled.pdf"):
+        pass
+    assert len(os.listdir(directory)) == 4
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import re
+import sys
+import time
+
+import pytest
+
+from src import metrics, parse_pdf
+from src.pdf_cache import PdfCache, extraction_params, file_sha256
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from synthetic import generate_corpus, write_pdf  # type: ignore  # noqa: E402
+
+READ_PDF = parse_pdf.read_pdf
+
+
+def _read_slowly(path: str, *args, **kwargs):
+    """`read_pdf` that hangs on files named `slow`, the workers are forked and see the patch."""
+    if "slow" in path:
+        time.sleep(30)
+    return READ_PDF(path, *args, **kwargs)
+
+
+def test_read_pdfs_bounds_cache_hits(tmp_path):
+    cache = PdfCache(str(tmp_path / "pdf_cache.db"))
+    paths = []
+    for i in range(20):
+        path = tmp_path / f"Transkript_{i}.pdf"
+        path.write_bytes(b"%PDF " + bytes([i]))
+        cache.put(file_sha256(str(path)), extraction_params(), [f"head {i}"], [f"body {i}"])
+        paths.append(str(path))
+
+    consumed = []
+
+    def _paths():
+        for path in paths:
+            consumed.append(path)
+            yield path
+
+    results = parse_pdf.read_pdfs(_paths(), max_workers=1, cache=cache)
+    first = next(results)
+    assert first.head == ["head 0"] and first.error is None
+    assert len(consumed) == 2  # 2 * max_workers results are held at most
+    assert [result.body for result in results] == [[f"body {i}"] for i in range(1, 20)]
+    cache.close()
+
+
+def test_read_pdfs_returns_errors_in_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(parse_pdf, "read_pdf", _read_slowly)
+    paths = []
+    for name in ["first", "corrupt", "slow", "second", "third"]:
+        path = str(tmp_path / f"{name}.pdf")
+        if name == "corrupt":
+            with open(path, "wb") as f:
+                f.write(b"%PDF-1.4\nno objects")
+        else:
+            write_pdf(path, [[f"Titel {name}"], [f"Text {name}"]])
+        paths.append(path)
+
+    start = time.monotonic()
+    results = list(parse_pdf.read_pdfs(paths, max_workers=2, timeout=1.0))
+
+    assert time.monotonic() - start < 20
+    assert [result.path for result in results] == paths
+    assert [result.error is None for result in results] == [True, False, False, True, True]
+    assert results[2].error == "timeout after 1.0s"
+    assert [result.head[0] for result in results if not result.error] == [
+        "Titel first",
+        "Titel second",
+        "Titel third",
+    ]
+    assert results[4].body[0] == "Text third"
+
+
+def _legacy_parse_body(lines):
+    """`parse_body` before the single pass rewrite (19f4bb3), the golden reference."""
+    timecode_pattern = re.compile(r"\[\d\d:\d\d\]|\(\d\d:\d\d\)|\[\d\d:\d\d:\d\d\]")
+
+    def _get_timecode(line):
+        if timecode_pattern.search(line):
+            return re.findall(timecode_pattern, line)[0]
+
+    def _get_name(line):
+        if timecode_pattern.search(line):
+            return timecode_pattern.split(line)[0].strip().replace(":", "")
+
+    passages = []
+    current_passage = {}
+    for line in lines:
+        if "in der Redaktion" in line:
+            break
+        if name := _get_name(line):
+            if current_passage:
+                passages.append(current_passage)
+                current_passage = {}
+            current_passage["speaker"] = name
+            current_passage["timecode"] = _get_timecode(line)
+        else:
+            if current_passage.get("text"):
+                current_passage["text"] += line.lstrip()
+            else:
+                current_passage["text"] = line.lstrip()
+    passages.append(current_passage)
+    return passages
+
+
+RECORDED_LINES = [
+    [],
+    [""],
+    ["Text vor dem ersten Sprecher ", "  und weiter"],
+    ["Moderator [00:00]", "Herzlich willkommen ", "", "zum Press Briefing."],
+    ["Prof. Dr. Christian Drosten: [01:02:03] Das Virus", " verbreitet sich."],
+    ["Sandra Ciesek (12:30)", "Sandra Ciesek (12:31)", "Antwort"],
+    ["[00:10] nur ein Zeitstempel", "Moderator [00:20]", "", ""],
+    ["Moderator [00:00]", "Frage", "Die Redaktion: in der Redaktion", "Impressum"],
+    ["in der Redaktion", "Moderator [00:00]"],
+]
+
+
+@pytest.mark.parametrize("lines", RECORDED_LINES)
+def test_parse_body_matches_legacy_parser_on_recorded_lines(lines):
+    assert parse_pdf.parse_body(lines) == _legacy_parse_body(lines)
+
+
+def test_parse_body_matches_legacy_parser_on_random_lines():
+    rng = random.Random(0)
+    choices = ["", "  ", "Satz. ", "Moderator [00:00]", "Anna Müller: (01:02)", "[00:30] Text"]
+    for _ in range(500):
+        lines = [rng.choice(choices) for _ in range(rng.randint(0, 12))]
+        assert parse_pdf.parse_body(lines) == _legacy_parse_body(lines), lines
+
+
+@pytest.mark.parametrize("layout", [True, False])
+def test_parse_body_matches_legacy_parser_on_synthetic_pdfs(tmp_path, layout):
+    rows = generate_corpus(str(tmp_path), 3, num_segments=20)
+    for row in rows:
+        lines = list(parse_pdf.iter_body_lines(row["pdf_path"], layout=layout))
+        segments = parse_pdf.parse_body(lines)
+        assert len(segments) == 20 and segments == _legacy_parse_body(lines)
+
+
+def _pages_read() -> float:
+    return metrics.REGISTRY.counters.get(("pdf_pages_total", ()), 0)
+
+
+def test_read_head_reads_only_the_first_page(tmp_path):
+    (row,) = generate_corpus(str(tmp_path), 1, num_segments=20)
+    head, body = parse_pdf.read_pdf(row["pdf_path"])
+    metrics.reset()
+
+    assert parse_pdf.read_head(row["pdf_path"]) == head
+    assert _pages_read() == 1
+    assert parse_pdf.parse_head(head)["title"] == "Was wissen wir über Wasserstoff? Teil 0"
+
+
+def test_body_pages_are_read_lazily(tmp_path):
+    (row,) = generate_corpus(str(tmp_path), 1, num_segments=20)
+    head, body = parse_pdf.read_pdf(row["pdf_path"])
+    metrics.reset()
+
+    lines = parse_pdf.iter_body_lines(row["pdf_path"])
+    first = next(lines)
+    assert _pages_read() == 2  # the title page and the first transcript page
+    assert [first, *lines] == body
+    assert _pages_read() > 3
+
+
+@pytest.mark.parametrize("layout", [True, False])
+def test_parse_press_briefings_of_synthetic_corpus(tmp_path, layout, monkeypatch):
+    monkeypatch.setattr(parse_pdf, "read_pdf", lambda path, **kwargs: READ_PDF(path, layout=layout))
+    rows = generate_corpus(str(tmp_path), 2, num_segments=12)
+    corrupt = str(tmp_path / "corrupt.pdf")
+    with open(corrupt, "wb") as f:
+        f.write(b"%PDF-1.4\nno objects")
+    rows.insert(1, dict(rows[0], pdf_path=corrupt))
+    errors: list[tuple[str, str]] = []
+
+    records = list(parse_pdf.parse_press_briefings(rows, errors=errors, max_workers=2))
+
+    assert [error[0] for error in errors] == [corrupt]
+    assert [record["pdf_path"] for record in records] == [rows[0]["pdf_path"], rows[2]["pdf_path"]]
+    assert [record["title"] for record in records] == [
+        "Was wissen wir über Wasserstoff? Teil 0",
+        "Was wissen wir über Impfstoffe? Teil 1",
+    ]
+    assert [record["date"] for record in records] == ["25.07.2018", "19.02.2020"]
+    assert records[0]["introduction_text"] == rows[0]["introduction"]
+    assert records[0]["guests"][-1]["name"] == "Volker Stollorz"
+    for record in records:
+        assert len(record["segments"]) == 12
+        assert record["segments"][0]["speaker"] == "Volker Stollorz"
+        assert record["video_url"].startswith("https://bit.ly/")
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Heuristics, report and resumable review of scripts/pb_checker.py."""
+
+import csv
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+import pb_checker  # type: ignore  # noqa: E402
+from synthetic import generate_corpus, write_pdf  # type: ignore  # noqa: E402
+
+
+@pytest.fixture
+def rows(tmp_path) -> list[dict]:
+    rows = generate_corpus(str(tmp_path), 3, num_segments=6)
+    corrupt = str(tmp_path / "corrupt.pdf")
+    with open(corrupt, "wb") as f:
+        f.write(b"%PDF-1.4\nno objects")
+    untitled = str(tmp_path / "untitled.pdf")
+    write_pdf(untitled, [["Kein Titel"], ["Volker Stollorz: [00:00]", "Frage"]])
+    return rows + [dict(rows[0], pdf_path=corrupt), dict(rows[0], pdf_path=untitled)]
+
+
+def _pb(segments: list[tuple[str, str]], **kwargs) -> dict:
+    pb = {
+        "title": "Titel",
+        "date": "01.02.2021",
+        "head_person": ["Prof. Dr. Sandra Ciesek", "Volker Stollorz"],
+        "segments": [{"speaker": s, "timecode": t, "text": "Text"} for s, t in segments],
+    }
+    pb["person"] = list({s for s, _ in segments})
+    pb.update(kwargs)
+    return pb
+
+
+def test_heuristics():
+    good = _pb([("Volker Stollorz", "00:00"), ("Sandra Ciesek", "00:30")])
+    assert pb_checker.check_pb(good) == []
+    assert pb_checker.check_pb(None) == ["read error"]
+
+    issues = pb_checker.check_pb(
+        _pb(
+            [
+                ("Volker Stollorz", "01:00"),
+                ("Christian Drosten", "00:30"),
+                ("Sandra Ciesek", "01:10"),
+            ],
+            title=None,
+            date="",
+        )
+    )
+    assert issues == [
+        "missing title",
+        "missing date",
+        "non monotonic timecodes: 1",
+        "unknown speaker: Christian Drosten",
+    ]
+    assert pb_checker.score(issues) == 5 + 2 + 2 + 1
+    assert pb_checker.check_pb(_pb([("Volker Stollorz", "00:00")])) == ["one segment"]
+
+
+def test_report_ranks_suspicious_parses_first(tmp_path, rows):
+    path = str(tmp_path / "report.csv")
+    results = pb_checker.report(rows, max_workers=2, path=path)
+
+    assert [result["pdf_path"] for result in results] == [
+        rows[i]["pdf_path"] for i in (4, 3, 0, 1, 2)
+    ]
+    assert [result["score"] for result in results] == [5 + 2 + 3 + 1, 10, 0, 0, 0]
+    assert results[0]["issues"] == (
+        "missing title; missing date; one segment; unknown speaker: Volker Stollorz"
+    )
+    assert results[1]["issues"].startswith("read error; ")
+    assert results[2]["num_segments"] == 6
+    with open(path, newline="", encoding="utf-8") as f:
+        assert [row["pdf_path"] for row in csv.DictReader(f)] == [r["pdf_path"] for r in results]
+
+
+def test_review_resumes_and_shows_changed_pdfs_again(tmp_path, rows, monkeypatch):
+    verdicts_path = str(tmp_path / "verdicts.json")
+    shown: list[str] = []
+    monkeypatch.setattr(pb_checker, "print_pb", lambda pb, issues: shown.append(pb["pdf_path"]))
+    monkeypatch.setattr(os, "system", lambda command: 0)
+
+    def _review(*commands: str, **kwargs) -> list[str]:
+        answers = iter(commands)
+        monkeypatch.setattr("builtins.input", lambda: next(answers))
+        return pb_checker.review(rows, max_workers=2, verdicts_path=verdicts_path, **kwargs)
+
+    assert _review("y", "n", "q") == [rows[1]["pdf_path"]]
+    assert shown == [rows[0]["pdf_path"], rows[1]["pdf_path"], rows[2]["pdf_path"]]
+
+    shown.clear()  # the third briefing was not decided, the read error is not printed by print_pb
+    assert _review("y", "n", "y", "q") == [rows[1]["pdf_path"], rows[3]["pdf_path"]]
+    assert shown == [rows[2]["pdf_path"], rows[4]["pdf_path"]]
+
+    shown.clear()
+    write_pdf(rows[0]["pdf_path"], [["Korrigiert"], ["Text"]])
+    assert _review("y", min_score=1) == [rows[1]["pdf_path"], rows[3]["pdf_path"]]
+    assert shown == [rows[0]["pdf_path"]]  # changed, now without title
+    assert pb_checker.load_verdicts(verdicts_path)[rows[0]["pdf_path"]]["verdict"] == "y"
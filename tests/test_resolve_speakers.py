@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+import pytest
+
+from src import create_db, resolve_speakers
+
+
+@pytest.mark.parametrize(
+    "a, b, same_briefing, expected",
+    [
+        ("Prof. Dr. Christian Drosten", "Christian  Drosten", False, True),
+        ("Christian Drosten", "C. Drosten", False, False),
+        ("Christian Drosten", "C. Drosten", True, True),
+        ("Christian Drosten", "Drosten", True, True),
+        ("Thomas Schmidt", "Thomas Schmitt", False, False),
+        ("Thomas Schmidt", "Thomas Schmitt", True, False),
+        ("Anna Müller", "Anna Möller", True, False),
+        ("Jan Becker", "Jan Bäcker", True, False),
+    ],
+)
+def test_same_person(a, b, same_briefing, expected):
+    assert resolve_speakers.same_person(a, b, same_briefing=same_briefing) is expected
+
+
+def _connection(persons: list[tuple[int, str]]) -> sqlite3.Connection:
+    connection = sqlite3.connect(":memory:")
+    create_db.migrate(connection)
+    connection.executemany(
+        "INSERT INTO Person (person_ID, name, name_key) VALUES (?, ?, ?)",
+        [(person_ID, name, create_db.normalize_name(name)) for person_ID, name in persons],
+    )
+    connection.commit()
+    return connection
+
+
+def test_similar_names_are_reviewed_not_merged():
+    connection = _connection(
+        [(1, "Thomas Schmidt"), (2, "Thomas Schmitt"), (3, "Prof. Dr. Thomas Schmidt")]
+    )
+
+    report = resolve_speakers.resolve_speakers(connection)
+
+    assert report["merged"] == 1 and report["review"] == 1
+    assert connection.execute("SELECT person_ID FROM Person").fetchall() == [(1,), (2,)]
+    assert connection.execute("SELECT * FROM Person_Review").fetchall() == [(2, 1, "fuzzy")]
+
+    assert resolve_speakers.merge_reviewed(connection, [(2, 1)]) == 1
+    assert connection.execute("SELECT person_ID FROM Person").fetchall() == [(1,)]
+    assert connection.execute("SELECT * FROM Person_Review").fetchall() == []
+
+
+def test_initial_is_linked_only_to_the_title_page_of_its_briefing():
+    connection = _connection([(1, "Clara Drosten"), (2, "Christian Drosten"), (3, "C. Drosten")])
+    connection.executemany(
+        "INSERT INTO Segment (pb_ID, speaker, text) VALUES (?, ?, 'Text')", [(1, 3), (2, 1)]
+    )
+    connection.execute("INSERT INTO Head_Person (pb_ID, name) VALUES (1, 'Christian Drosten')")
+    connection.commit()
+
+    report = resolve_speakers.resolve_speakers(connection)
+
+    assert report["merged"] == 0 and report["relinked"] == 1
+    assert connection.execute("SELECT pb_ID, speaker FROM Segment ORDER BY pb_ID").fetchall() == [
+        (1, 2),
+        (2, 1),
+    ]
+    assert connection.execute(
+        "SELECT person_ID, other_ID FROM Person_Review ORDER BY other_ID"
+    ).fetchall() == [(3, 1), (3, 2)]
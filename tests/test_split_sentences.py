@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from nltk.tokenize.punkt import PunktSentenceTokenizer  # type: ignore
+
+from src import create_db, split_sentences
+
+
+def test_segments_without_sentences_are_not_split_again(tmp_path, monkeypatch):
+    # untrained punkt model, the worker processes are forked and see the patch
+    monkeypatch.setattr(
+        split_sentences, "load_punkt", lambda language="german": PunktSentenceTokenizer()
+    )
+    connection = create_db.create_connection(str(tmp_path / "dataset.db"))
+    create_db.migrate(connection)
+    connection.executemany(
+        "INSERT INTO Segment (pb_ID, text) VALUES (1, ?)",
+        [("Ein Satz. Noch ein Satz.",), ("   ",), ("Der letzte Satz.",)],
+    )
+    connection.commit()
+
+    assert split_sentences.split_sentences(connection, max_workers=1, chunk_size=2) == 3
+    assert list(split_sentences.iter_unsplit_segments(connection)) == []
+    assert split_sentences.split_sentences(connection, max_workers=1) == 0
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Incremental synchronization against a stub SMC site."""
+
+import glob
+import os
+
+import pytest
+
+from src import sync
+from src.http_client import PoliteSession
+
+PDF = b"%PDF-1.4 Transkript"
+
+
+@pytest.fixture
+def run_sync(tmp_path):
+    def _run_sync(url: str) -> list[dict]:
+        with PoliteSession(host_concurrency=4, rate=1000) as session:
+            return sync.sync_pressbriefings(
+                base_url=url,
+                pdf_dir=str(tmp_path / "pdfs"),
+                manifest_path=str(tmp_path / "manifest.db"),
+                store_dir=str(tmp_path / "store"),
+                max_workers=4,
+                session=session,
+            )
+
+    return _run_sync
+
+
+def _manifest(tmp_path) -> dict[str, dict]:
+    manifest = sync.Manifest(str(tmp_path / "manifest.db"))
+    cur = manifest.connection.execute("SELECT url FROM Manifest")
+    entries = {url.split("/")[-1]: manifest.get(url) for url, in cur.fetchall()}
+    manifest.close()
+    return entries
+
+
+def test_duplicate_pdfs_are_stored_once(tmp_path, smc_site, run_sync):
+    url, handler = smc_site([("a.pdf", PDF), ("b.pdf", PDF), ("a.pdf", PDF), ("c.pdf", b"%PDF c")])
+    results = run_sync(url)
+
+    assert [pb["pdf_path"] for pb in results] == [
+        str(tmp_path / "pdfs" / name) for name in ["a.pdf", "b.pdf", "a.pdf", "c.pdf"]
+    ]
+    assert all(pb["changed"] for pb in results)
+    assert os.path.samefile(tmp_path / "pdfs" / "a.pdf", tmp_path / "pdfs" / "b.pdf")
+    assert len(glob.glob(str(tmp_path / "store" / "*" / "*.pdf"))) == 2
+    assert os.listdir(tmp_path / "store" / "tmp") == []
+    with open(tmp_path / "pdfs" / "b.pdf", "rb") as f:
+        assert f.read() == PDF
+    # the pdf linked by two briefings is downloaded once, the second worker gets a 304
+    assert sorted(s for p, s in handler.requests if p == "/fileadmin/a.pdf") == [200, 304]
+
+
+def test_unchanged_files_are_not_transferred_again(tmp_path, smc_site, run_sync):
+    url, handler = smc_site([("a.pdf", PDF), ("b.pdf", b"%PDF b")])
+    run_sync(url)
+    entries = _manifest(tmp_path)
+    assert set(entries) == {"0", "1", "a.pdf", "b.pdf"}
+    assert entries["a.pdf"]["kind"] == "pdf" and entries["a.pdf"]["size"] == len(PDF)
+    assert entries["a.pdf"]["etag"] == f'"{hash(PDF)}"'
+
+    handler.requests.clear()
+    results = run_sync(url)
+    assert not any(pb["changed"] for pb in results)
+    assert {s for p, s in handler.requests if p.startswith(("/pb/", "/fileadmin/"))} == {304}
+
+    handler.files["/fileadmin/b.pdf"] = b"%PDF b, korrigiert"
+    results = run_sync(url)
+    assert [pb["changed"] for pb in results] == [False, True]
+    entry = _manifest(tmp_path)["b.pdf"]
+    assert entry["size"] == len(b"%PDF b, korrigiert")
+    assert entry["sha256"] != entries["b.pdf"]["sha256"]
+    assert entry["fetched_at"] > entries["b.pdf"]["fetched_at"]
+    with open(tmp_path / "pdfs" / "b.pdf", "rb") as f:
+        assert f.read() == b"%PDF b, korrigiert"
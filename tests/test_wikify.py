@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import json
+from http.server import BaseHTTPRequestHandler
+from typing import Any
+
+import pytest
+
+from src import http_client, wikify
+
+TEXT = "Das Virus verbreitet sich schnell"
+
+
+class _ScriptedHandler(BaseHTTPRequestHandler):
+    """Answers the requests with the scripted (status, body) pairs, then with an empty result.
+    `headers` are sent with every scripted answer."""
+
+    script: list[tuple[int, bytes]] = []
+    headers_: dict[str, str] = {}
+
+    def log_message(self, *args: Any):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        script = type(self).script
+        status, body = script.pop(0) if script else (200, b'{"annotations": []}')
+        self.send_response(status)
+        for name, value in type(self).headers_.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _client(url: str, **kwargs: Any) -> wikify.WikifyClient:
+    return wikify.WikifyClient("tagme", "token", base_url=url, rate=1000, backoff=0, **kwargs)
+
+
+def test_out_of_credits_does_not_stick(serve):
+    annotation = {"start": 4, "end": 9, "spot": "Virus", "title": "Virus"}
+
+    class _Handler(_ScriptedHandler):
+        script = [(403, b""), (200, json.dumps({"annotations": [annotation]}).encode())]
+
+    with _client(serve(_Handler)) as client:
+        with pytest.raises(wikify.OutOfCreditsError):
+            client.annotate(TEXT)
+        assert client.annotate(TEXT) == [annotation]  # after the credits were topped up
+
+
+def test_annotate_many_returns_invalid_json_as_error(serve):
+    class _Handler(_ScriptedHandler):
+        script = [(200, b"<html>maintenance</html>")]
+
+    with _client(serve(_Handler), max_workers=1) as client:  # the first text gets the html
+        results = list(client.annotate_many([TEXT, TEXT]))
+    assert results[0].error is not None and results[0].annotations is None
+    assert results[1] == wikify.WikifyResult(TEXT, None, None)
+
+
+def test_retry_after_is_capped(serve, monkeypatch):
+    class _Handler(_ScriptedHandler):
+        script = [(429, b""), (503, b"")]
+        headers_ = {"Retry-After": "86400"}
+
+    waits: list[float] = []
+    monkeypatch.setattr(wikify.time, "sleep", waits.append)
+    with _client(serve(_Handler)) as client:
+        assert client.annotate(TEXT) is None
+    assert waits == [http_client.MAX_RETRY_AFTER] * 2
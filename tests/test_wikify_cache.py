@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Response cache and deduplication against the wikification stub of the pipeline benchmark."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from bench_pipeline import _StubHandler, serve_stub  # type: ignore  # noqa: E402
+
+from src import wikify, wikify_cache  # noqa: E402
+
+PARAMS = wikify_cache.request_params()
+
+
+class _CountingHandler(_StubHandler):
+    requests = 0
+
+    def do_POST(self):
+        type(self).requests += 1
+        super().do_POST()
+
+
+@pytest.fixture
+def client():
+    server, url = serve_stub()
+    server.RequestHandlerClass = _CountingHandler
+    _CountingHandler.requests = 0
+    with wikify.WikifyClient("tagme", "token", base_url=url, rate=1e6) as client:
+        yield client
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = wikify_cache.WikifyCache(str(tmp_path / "wikify_cache.db"), ttl=60, max_bytes=10**6)
+    yield cache
+    cache.close()
+
+
+def _annotate(client, items, cache, groups=None) -> dict[tuple, wikify.WikifyResult]:
+    return {
+        tuple(ids): result
+        for ids, result in wikify_cache.annotate_unique(client, items, cache, groups)
+    }
+
+
+def test_entries_expire_after_the_ttl(cache):
+    cache.put("tagme", "de", PARAMS, "Das Virus verbreitet sich", [{"id": 1}])
+    assert cache.get("tagme", "de", PARAMS, "Das  Virus verbreitet sich ") == (True, [{"id": 1}])
+    assert cache.get("tagme", "en", PARAMS, "Das Virus verbreitet sich") == (False, None)
+
+    cache.connection.execute("UPDATE Response SET created_at = created_at - 61")
+    assert cache.get("tagme", "de", PARAMS, "Das Virus verbreitet sich") == (False, None)
+    cache.evict()
+    assert cache.size() == 0
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    texts = [f"Satz Nummer {i} über Viren" for i in range(4)]
+    cache.put_many(
+        "tagme", "de", PARAMS, [(text, [{"id": i} for i in range(50)]) for text in texts]
+    )
+    for i, text in enumerate(texts):  # the first text is used last
+        cache.connection.execute(
+            "UPDATE Response SET last_access = ? WHERE text_hash = ?",
+            (100 - i if i else 200, wikify_cache.text_hash(text)),
+        )
+    entry_size = cache.size() // 4
+
+    cache.evict(max_bytes=2 * entry_size)
+
+    assert cache.size() <= 2 * entry_size
+    cached = [cache.get("tagme", "de", PARAMS, text)[0] for text in texts]
+    assert cached == [True, True, False, False]
+
+
+def test_duplicate_texts_are_sent_once(client, cache):
+    items = [
+        (1, "Das Virus verbreitet sich schnell"),
+        (2, "Das  Virus verbreitet sich schnell "),
+        (3, "Die Impfung schützt vor schweren Verläufen"),
+        (4, "Kurzer Satz"),  # too short, not sent
+    ]
+    results = _annotate(client, items, cache)
+
+    assert sorted(results) == [(1, 2), (3,), (4,)]
+    assert results[(4,)].annotations is None
+    assert _CountingHandler.requests == 2
+    assert _annotate(client, items, cache) == results
+    assert _CountingHandler.requests == 2  # all from the cache
+
+
+def test_offsets_refer_to_the_normalized_text(client, cache):
+    text = "Der  Virologe Christian\xa0Drosten  warnt vor Mu\u0308ller"  # decomposed ü
+    for _ in range(2):  # sent and cached
+        ((ids, result),) = wikify_cache.annotate_unique(client, [(1, text)], cache)
+        assert result.text == wikify_cache.normalize_text(text)
+        assert result.text == "Der Virologe Christian Drosten warnt vor Müller"
+        spots = [result.text[a["start"] : a["end"]] for a in result.annotations]
+        assert spots == [a["spot"] for a in result.annotations]
+        assert spots == ["Virologe", "Christian", "Drosten", "Müller"]
+    assert _CountingHandler.requests == 1
+
+
+def test_packed_results_are_cached_apart(client, cache):
+    items = [(i, f"Satz {i} über das Virus und die Impfung") for i in range(4)]
+    groups = {i: i // 2 for i, _ in items}
+
+    packed = _annotate(client, items, cache, groups)
+    assert _CountingHandler.requests == 2  # one request per segment
+    assert cache.get("tagme", "de", wikify_cache.request_params(packed=True), items[0][1])[0]
+    assert not cache.get("tagme", "de", PARAMS, items[0][1])[0]
+
+    assert len(_annotate(client, items, cache)) == 4
+    assert _CountingHandler.requests == 6  # packed results are not used for single texts
+    assert _annotate(client, items, cache, groups) == packed
+    assert _CountingHandler.requests == 6
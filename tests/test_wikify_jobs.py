@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+from typing import Any, Iterable, Iterator
+
+import pytest
+
+from src import create_db, wikify_jobs
+from src.wikify import OutOfCreditsError, WikifyResult
+
+
+def _database(sentences: int) -> sqlite3.Connection:
+    connection = sqlite3.connect(":memory:")
+    create_db.create_tables(connection)
+    connection.executemany(
+        "INSERT INTO Sentence (sentence_ID, pb_ID, segment_ID, sentence) VALUES (?, 1, 1, 'Satz')",
+        [(i,) for i in range(1, sentences + 1)],
+    )
+    connection.commit()
+    return connection
+
+
+def _jobs(connection: sqlite3.Connection) -> list[tuple[int, str, str]]:
+    return connection.execute(
+        "SELECT target_ID, service, status FROM Wikification_Job ORDER BY target_ID"
+    ).fetchall()
+
+
+def test_migration_seeds_notebook_progress(tmp_path, monkeypatch):
+    progress = tmp_path / "wikifyed.txt"
+    progress.write_text("1\n2\n\n9\n")  # 9 no longer exists
+    monkeypatch.setattr(create_db, "WIKIFYED_PATH", str(progress))
+    connection = _database(3)
+
+    create_db.migrate(connection)
+
+    assert _jobs(connection) == [(1, "tagme", "done"), (2, "tagme", "done")]
+    assert wikify_jobs.enqueue(connection, "sentence", "tagme") == 1
+
+
+def test_notebook_progress_does_not_depend_on_the_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert os.path.isabs(create_db.WIKIFYED_PATH)
+    assert os.path.exists(create_db.WIKIFYED_PATH)
+
+
+def test_enqueue_marks_rows_with_results_done(tmp_path, monkeypatch):
+    monkeypatch.setattr(create_db, "WIKIFYED_PATH", str(tmp_path / "missing.txt"))
+    connection = _database(3)
+    create_db.migrate(connection)
+    connection.execute(
+        """INSERT INTO Sentence_Wikification (sentence_ID, term, wiki_num, confidence, url)
+        VALUES (2, 'Virus', 1, 0.5, 'https://de.wikipedia.org/wiki/Virus')"""
+    )
+
+    assert wikify_jobs.enqueue(connection, "sentence", "tagme") == 2
+    assert _jobs(connection) == [
+        (1, "tagme", "pending"),
+        (2, "tagme", "done"),
+        (3, "tagme", "pending"),
+    ]
+
+
+class _Client:
+    """Annotates the first word of each text, fails texts with `Fehler` and runs out of credits
+    after `credits` texts."""
+
+    service = "tagme"
+    language = "de"
+
+    def __init__(self, credits: int = 1000):
+        self.credits = credits
+        self.texts: list[str] = []
+
+    def annotate_many(self, texts: Iterable[str], **extra: Any) -> Iterator[WikifyResult]:
+        for text in texts:
+            if len(self.texts) == self.credits:
+                raise OutOfCreditsError(self.service)
+            self.texts.append(text)
+            if "Fehler" in text:
+                yield WikifyResult(text, None, "500 Server Error")
+            else:
+                word = text.split(" ")[0]
+                concept = {"title": word, "id": len(word), "link_probability": 0.5, "uri": word}
+                yield WikifyResult(text, [concept], None)
+
+
+@pytest.fixture
+def connection(tmp_path, monkeypatch) -> sqlite3.Connection:
+    monkeypatch.setattr(create_db, "WIKIFYED_PATH", str(tmp_path / "missing.txt"))
+    connection = _database(0)
+    connection.executemany(
+        "INSERT INTO Sentence (sentence_ID, pb_ID, segment_ID, sentence) VALUES (?, 1, 1, ?)",
+        [
+            (1, "Viren verbreiten sich schnell."),
+            (2, "Masken schützen vor Viren."),
+            (3, "Fehler beim Wikifizieren dieses Satzes."),
+            (4, "Impfstoffe wirken gegen schwere Verläufe."),
+        ],
+    )
+    create_db.migrate(connection)
+    wikify_jobs.enqueue(connection, "sentence", "tagme")
+    return connection
+
+
+def _job_states(connection: sqlite3.Connection) -> list[tuple[int, str, int]]:
+    return connection.execute(
+        "SELECT target_ID, status, attempts FROM Wikification_Job ORDER BY target_ID"
+    ).fetchall()
+
+
+def _results(connection: sqlite3.Connection) -> list[tuple[int, str]]:
+    return connection.execute(
+        "SELECT sentence_ID, term FROM Sentence_Wikification ORDER BY sentence_ID"
+    ).fetchall()
+
+
+def test_claim_leases_jobs_until_they_expire(connection, monkeypatch):
+    assert [t for _, t in wikify_jobs.claim(connection, "sentence", "tagme", 3)] == [1, 2, 3]
+    assert [t for _, t in wikify_jobs.claim(connection, "sentence", "tagme", 3)] == [4]
+    assert wikify_jobs.claim(connection, "sentence", "tagme", 3) == []
+    assert wikify_jobs.claim(connection, "sentence", "title", 3) == []
+
+    connection.execute(
+        "UPDATE Wikification_Job SET claimed_at = claimed_at - 601 WHERE target_ID = 2"
+    )
+    assert [t for _, t in wikify_jobs.claim(connection, "sentence", "tagme", 3)] == [2]
+    assert _job_states(connection) == [
+        (1, "running", 1),
+        (2, "running", 2),
+        (3, "running", 1),
+        (4, "running", 1),
+    ]
+
+
+def test_run_writes_results_and_retries_failures(connection):
+    client = _Client()
+    report = wikify_jobs.run(connection, "sentence", client, batch_size=2, max_attempts=2)
+
+    assert _results(connection) == [(1, "Viren"), (2, "Masken"), (4, "Impfstoffe")]
+    assert _job_states(connection) == [
+        (1, "done", 1),
+        (2, "done", 1),
+        (3, "failed", 2),
+        (4, "done", 1),
+    ]
+    assert connection.execute(
+        "SELECT last_error FROM Wikification_Job WHERE target_ID = 3"
+    ).fetchone() == ("500 Server Error",)
+    assert client.texts.count("Fehler beim Wikifizieren dieses Satzes.") == 2
+    assert (report["done"], report["failed"], report["pending"]) == (3, 1, 0)
+
+
+def test_out_of_credits_releases_unfinished_jobs(connection):
+    report = wikify_jobs.run(connection, "sentence", _Client(credits=1), batch_size=3)
+
+    assert _results(connection) == [(1, "Viren")]
+    assert _job_states(connection) == [
+        (1, "done", 1),
+        (2, "pending", 0),
+        (3, "pending", 0),
+        (4, "pending", 0),
+    ]
+    assert (report["done"], report["pending"]) == (1, 3)
+
+
+def test_crashed_batch_is_rolled_back_and_resumed(connection, monkeypatch):
+    connection.execute(
+        """CREATE TRIGGER crash BEFORE UPDATE OF status ON Wikification_Job
+        WHEN new.status = 'done' AND new.target_ID = 4 BEGIN SELECT RAISE(ABORT, 'crash'); END"""
+    )
+    with pytest.raises(sqlite3.DatabaseError):
+        wikify_jobs.run(connection, "sentence", _Client(), batch_size=2, max_attempts=1)
+    # the first batch is committed, the results of the crashed batch are not
+    assert _results(connection) == [(1, "Viren"), (2, "Masken")]
+    assert _job_states(connection)[2:] == [(3, "running", 1), (4, "running", 1)]
+
+    connection.execute("DROP TRIGGER crash")
+    client = _Client()
+    wikify_jobs.run(connection, "sentence", client, max_attempts=2)
+    assert client.texts == []  # the lease of the crashed batch is not expired yet
+
+    monkeypatch.setattr(wikify_jobs, "JOB_LEASE", 0.0)
+    wikify_jobs.run(connection, "sentence", client, max_attempts=2)
+    assert client.texts == [
+        "Fehler beim Wikifizieren dieses Satzes.",
+        "Impfstoffe wirken gegen schwere Verläufe.",
+    ]
+    assert _results(connection) == [(1, "Viren"), (2, "Masken"), (4, "Impfstoffe")]
+    assert _job_states(connection)[2:] == [(3, "failed", 2), (4, "done", 2)]
+
+
+def test_representatives_results_are_copied_to_their_cluster(connection):
+    connection.execute("DELETE FROM Wikification_Job")
+    connection.executemany(
+        "INSERT INTO Sentence_Cluster (sentence_ID, cluster_ID) VALUES (?, ?)",
+        [(1, 1), (2, 1), (3, 3), (4, 1)],
+    )
+    assert wikify_jobs.enqueue(connection, "sentence", "tagme", representatives=True) == 2
+
+    client = _Client()
+    wikify_jobs.run(connection, "sentence", client, max_attempts=1)
+
+    assert len(client.texts) == 2
+    assert _results(connection) == [(1, "Viren"), (2, "Viren"), (4, "Viren")]
+    assert [t for t, *_ in _job_states(connection)] == [1, 3]
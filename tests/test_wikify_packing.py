@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Packed requests against the wikification stub of the pipeline benchmark. The stub annotates
+every capitalized word independent of its context, so packing must not change any annotation."""
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from bench_pipeline import _StubHandler, serve_stub  # type: ignore  # noqa: E402
+from synthetic import _sentence  # type: ignore  # noqa: E402
+
+from src import wikify, wikify_cache  # noqa: E402
+
+
+class _CountingHandler(_StubHandler):
+    requests = 0
+
+    def do_POST(self):
+        type(self).requests += 1
+        super().do_POST()
+
+
+@pytest.fixture
+def stub():
+    server, url = serve_stub()
+    server.RequestHandlerClass = _CountingHandler
+    _CountingHandler.requests = 0
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+def _segments(seed: int = 0) -> list[list[str]]:
+    rng = random.Random(seed)
+    return [[_sentence(rng) for _ in range(rng.randint(1, 12))] for _ in range(30)]
+
+
+def test_packed_annotations_match_single_requests(stub):
+    segments = _segments()
+    sentences = [sentence for segment in segments for sentence in segment]
+    with wikify.WikifyClient("tagme", "token", base_url=stub, rate=1e6) as client:
+        single = list(client.annotate_many(sentences))
+        requests = _CountingHandler.requests
+        packed = list(client.annotate_packed(segments))
+
+    assert _CountingHandler.requests - requests <= len(segments) < requests
+    assert [result.text for result in packed] == sentences
+    assert all(result.error is None for result in single + packed)
+    assert [result.annotations for result in packed] == [result.annotations for result in single]
+
+
+def test_packed_results_are_cached_apart(stub, tmp_path):
+    segments = _segments(1)
+    items = [
+        ((segment_id, i), sentence)
+        for segment_id, segment in enumerate(segments)
+        for i, sentence in enumerate(segment)
+    ]
+    groups = {key: key[0] for key, _ in items}
+    cache = wikify_cache.WikifyCache(str(tmp_path / "wikify_cache.db"))
+    with wikify.WikifyClient("tagme", "token", base_url=stub, rate=1e6) as client:
+        packed = dict(
+            (tuple(ids), result)
+            for ids, result in wikify_cache.annotate_unique(client, items, cache, groups)
+        )
+        requests = _CountingHandler.requests
+        list(wikify_cache.annotate_unique(client, items, cache, groups))
+        assert _CountingHandler.requests == requests  # packed hits
+        single = dict(
+            (tuple(ids), result)
+            for ids, result in wikify_cache.annotate_unique(client, items, cache)
+        )
+        assert _CountingHandler.requests > requests  # not served from the packed entries
+    cache.close()
+    assert {ids: result.annotations for ids, result in packed.items()} == {
+        ids: result.annotations for ids, result in single.items()
+    }